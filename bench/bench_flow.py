@@ -56,6 +56,61 @@ def test_simple_flow_n_events(benchmark, n):
     benchmark(inner)
 
 
+@pytest.mark.parametrize("n", [1000, 5000])
+def test_simple_flow_emit_many_n_events(benchmark, n):
+    def inner():
+        controller = build_flow(
+            [
+                SyncEmitSource(),
+                Map(lambda x: x + 1),
+                Reduce(0, lambda acc, x: acc + x),
+            ]
+        ).run()
+
+        controller.emit_many(range(n))
+        controller.terminate()
+        controller.await_termination()
+
+    benchmark(inner)
+
+
+# Subclasses of built-in steps are not fused into synchronous segments, so these run each step as a separate coroutine
+class _UnfusedMap(Map):
+    pass
+
+
+class _UnfusedReduce(Reduce):
+    pass
+
+
+@pytest.mark.parametrize("fused", [True, False])
+@pytest.mark.parametrize("n", [1000, 5000])
+def test_map_chain_async_flow_n_events(benchmark, n, fused):
+    map_class = Map if fused else _UnfusedMap
+    reduce_class = Reduce if fused else _UnfusedReduce
+
+    async def async_inner():
+        controller = build_flow(
+            [
+                AsyncEmitSource(),
+                map_class(lambda x: x + 1),
+                map_class(lambda x: x * 2),
+                map_class(lambda x: x - 1),
+                reduce_class(0, lambda acc, x: acc + x),
+            ]
+        ).run()
+
+        for i in range(n):
+            await controller.emit(i)
+        await controller.terminate()
+        await controller.await_termination()
+
+    def inner():
+        asyncio.run(async_inner())
+
+    benchmark(inner)
+
+
 @pytest.mark.parametrize("n", [0, 1, 1000, 5000])
 def test_simple_async_flow_n_events(benchmark, n):
     async def async_inner():
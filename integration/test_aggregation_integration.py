@@ -1588,6 +1588,88 @@ def test_query_aggregate_by_key(setup_teardown_test, partitioned_by_key, flush_i
     ), f"actual did not match expected. \n actual: {actual} \n expected: {expected_results}"
 
 
+@pytest.mark.parametrize("flush_interval", [None, 1])
+def test_approximate_aggregations_persisted(setup_teardown_test, flush_interval):
+    def aggregate(events):
+        table = Table(setup_teardown_test.table_name, setup_teardown_test.driver(), flush_interval_secs=flush_interval)
+        controller = build_flow(
+            [
+                SyncEmitSource(),
+                AggregateByKey(
+                    [
+                        FieldAggregator(
+                            "number_of_stuff",
+                            "col1",
+                            ["count", "approx_distinct", "approx_p100"],
+                            SlidingWindows(["1h", "24h"], "10m"),
+                        )
+                    ],
+                    table,
+                    time_field="time",
+                ),
+                NoSqlTarget(table),
+                Reduce([], lambda acc, x: append_return(acc, x)),
+            ]
+        ).run()
+        for event in events:
+            controller.emit(event, "tal")
+        controller.terminate()
+        return controller.await_termination()
+
+    items_in_ingest_batch = 10
+    aggregate(
+        [
+            {"col1": i % 4, "time": setup_teardown_test.test_base_time + timedelta(minutes=25 * i)}
+            for i in range(items_in_ingest_batch)
+        ]
+    )
+
+    other_table = Table(setup_teardown_test.table_name, setup_teardown_test.driver())
+    controller = build_flow(
+        [
+            SyncEmitSource(),
+            QueryByKey(
+                [
+                    "number_of_stuff_approx_distinct_1h",
+                    "number_of_stuff_approx_distinct_24h",
+                    "number_of_stuff_approx_p100_24h",
+                ],
+                other_table,
+                time_field="time",
+            ),
+            Reduce([], lambda acc, x: append_return(acc, x)),
+        ]
+    ).run()
+    base_time = setup_teardown_test.test_base_time + timedelta(minutes=25 * items_in_ingest_batch)
+    controller.emit({"col1": items_in_ingest_batch, "time": base_time}, "tal")
+    controller.terminate()
+    actual = controller.await_termination()
+    assert actual == [
+        {
+            "col1": 10,
+            "number_of_stuff_approx_distinct_1h": 2,
+            "number_of_stuff_approx_distinct_24h": 4,
+            "number_of_stuff_approx_p100_24h": 3,
+            "time": base_time,
+        }
+    ]
+
+    # Aggregation continues from the sketches in storage
+    actual = aggregate([{"col1": 7, "time": base_time}])
+    assert actual == [
+        {
+            "col1": 7,
+            "number_of_stuff_count_1h": 3.0,
+            "number_of_stuff_count_24h": 11.0,
+            "number_of_stuff_approx_distinct_1h": 3,
+            "number_of_stuff_approx_distinct_24h": 5,
+            "number_of_stuff_approx_p100_1h": 7,
+            "number_of_stuff_approx_p100_24h": 7,
+            "time": base_time,
+        }
+    ]
+
+
 @pytest.mark.parametrize(
     "query_aggregations",
     [
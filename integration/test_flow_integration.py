@@ -1108,6 +1108,40 @@ def test_writing_int_key(setup_teardown_test):
     controller.await_termination()
 
 
+def test_join_with_table_loads_keys_in_bulk(setup_teardown_test):
+    keys = ["num"]
+    table = _get_table(setup_teardown_test, {"num": int, "color": str}, keys)
+
+    df = pd.DataFrame({"num": [0, 1, 2], "color": ["green", "blue", "red"]})
+
+    controller = build_flow(
+        [
+            DataframeSource(df, key_field="num"),
+            NoSqlTarget(table),
+        ]
+    ).run()
+    controller.await_termination()
+
+    table = Table(setup_teardown_test.table_name, table._storage)
+    controller = build_flow(
+        [
+            SyncEmitSource(),
+            JoinWithTable(table, "num", attributes=["color"]),
+            Reduce([], lambda acc, x: append_return(acc, x)),
+        ]
+    ).run()
+    controller.emit_many([{"num": i} for i in range(4)])
+    controller.terminate()
+    termination_result = controller.await_termination()
+
+    assert termination_result == [
+        {"num": 0, "color": "green"},
+        {"num": 1, "color": "blue"},
+        {"num": 2, "color": "red"},
+        {"num": 3},
+    ]
+
+
 @pytest.mark.parametrize(
     "color, v3io_failed", [(["gre'en", 'bl"ue', "red"], False), (["gr\"e'en", "bl\"u'e", "red"], True)]
 )
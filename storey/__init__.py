@@ -55,10 +55,15 @@ from .flow import Reduce  # noqa: F401
 from .flow import Rename  # noqa: F401
 from .flow import SendToHttp  # noqa: F401
 from .flow import build_flow  # noqa: F401
+from .metrics import MetricsCollector  # noqa: F401
+from .offline_aggregations import aggregate_dataframe  # noqa: F401
+from .sharding import ShardedExecution  # noqa: F401
+from .shared_memory import SharedMemoryRingBuffer  # noqa: F401
 from .sources import AsyncEmitSource  # noqa: F401
 from .sources import CSVSource  # noqa: F401
 from .sources import DataframeSource  # noqa: F401
 from .sources import ParquetSource  # noqa: F401
+from .sources import SharedMemorySource  # noqa: F401
 from .sources import SQLSource  # noqa: F401
 from .sources import SyncEmitSource  # noqa: F401
 from .sql_driver import SQLDriver  # noqa: F401
@@ -67,6 +72,7 @@ from .targets import CSVTarget  # noqa: F401
 from .targets import KafkaTarget  # noqa: F401
 from .targets import NoSqlTarget  # noqa: F401
 from .targets import ParquetTarget  # noqa: F401
+from .targets import SharedMemoryTarget  # noqa: F401
 from .targets import StreamTarget  # noqa: F401
 from .targets import TDEngineTarget  # noqa: F401
 from .targets import TSDBTarget  # noqa: F401
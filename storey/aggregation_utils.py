@@ -14,6 +14,8 @@
 #
 import math
 
+from .sketches import is_approximate_aggregate
+
 _aggrTypeNone = 0
 _aggrTypeCount = 1
 _aggrTypeSum = 2
@@ -130,6 +132,9 @@ def get_all_raw_aggregates_with_hidden(aggregates):
     for aggregate in aggregates:
         if is_raw_aggregate(aggregate):
             raw_aggregates[aggregate] = False
+        elif is_approximate_aggregate(aggregate):
+            # Approximate aggregates are calculated from sketches, rather than from raw aggregates
+            continue
         else:
             for dependant_aggr in get_implied_aggregates(aggregate):
                 if dependant_aggr not in raw_aggregates:
@@ -13,15 +13,19 @@
 # limitations under the License.
 #
 import asyncio
+import heapq
+import itertools
+import math
 import re
 import time
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Callable, Dict, List, Optional, Union
 
 import pandas as pd
 
 from .aggregation_utils import is_aggregation_name
 from .dtypes import (
+    EmissionType,
     EmitAfterMaxEvent,
     EmitAfterPeriod,
     EmitAfterWindow,
@@ -30,10 +34,12 @@ from .dtypes import (
     FieldAggregator,
     FixedWindows,
     FixedWindowType,
+    LateDataHandling,
     SlidingWindows,
     _dict_to_emit_policy,
 )
-from .flow import Event, Flow, _termination_obj
+from .flow import Event, Flow, _termination_obj, _Timers
+from .sketches import is_approximate_aggregate
 from .table import Table
 from .utils import stringify_key
 
@@ -63,6 +69,18 @@ class AggregateByKey(Flow):
         format `{'col_name': 'new_col_name'}`. (Optional)
     :param time_format: If the value of the time field is of type string, this format will be used to parse it, as
         defined in datetime.strptime(). By default, parsing will follow ISO-8601.
+    :param allowed_lateness_secs: How late, in seconds of event time, events may arrive relative to the latest event
+        seen so far. When set, the step keeps a watermark, which is the latest event time minus this lateness, and
+        EmitAfterPeriod and EmitAfterWindow emit each period or window once the watermark passes its end (plus the
+        delay of the policy), rather than by the wall clock, so that replays of old data (e.g. from ParquetSource) emit
+        as fast as the data flows. Events are then held back until the watermark passes them, so that each period or
+        window is emitted before the events that follow it are aggregated. By default, there is no watermark.
+        (Optional)
+    :param late_data_handling: How to handle events that are older than the watermark, which requires
+        allowed_lateness_secs. LateDataHandling.Nothing aggregates them like any other event, LateDataHandling.Drop
+        drops them, and LateDataHandling.Sort_before_emit additionally holds back every event until the watermark
+        passes it with any emit policy, so that events that are at most allowed_lateness_secs late are aggregated and
+        emitted in order of event time. Defaults to LateDataHandling.Nothing.
     """
 
     def __init__(
@@ -77,9 +95,21 @@ class AggregateByKey(Flow):
         aliases: Optional[Dict[str, str]] = None,
         use_windows_from_schema: bool = False,
         time_format: Optional[str] = None,
+        allowed_lateness_secs: Optional[float] = None,
+        late_data_handling: LateDataHandling = LateDataHandling.Nothing,
         **kwargs,
     ):
+        if allowed_lateness_secs is not None:
+            kwargs["allowed_lateness_secs"] = allowed_lateness_secs
+        if late_data_handling != LateDataHandling.Nothing:
+            kwargs["late_data_handling"] = late_data_handling
         Flow.__init__(self, **kwargs)
+        if allowed_lateness_secs is not None and allowed_lateness_secs < 0:
+            raise ValueError(f"allowed_lateness_secs may not be negative (got {allowed_lateness_secs})")
+        if allowed_lateness_secs is None and late_data_handling != LateDataHandling.Nothing:
+            raise ValueError(f"late_data_handling {late_data_handling} requires allowed_lateness_secs")
+        self._allowed_lateness_millis = None if allowed_lateness_secs is None else allowed_lateness_secs * 1000
+        self._late_data_handling = late_data_handling
         aggregates = self._parse_aggregates(aggregates)
         self._check_unique_names(aggregates)
 
@@ -104,6 +134,12 @@ class AggregateByKey(Flow):
         self._emit_policy = emit_policy
         if isinstance(self._emit_policy, dict):
             self._emit_policy = _dict_to_emit_policy(self._emit_policy)
+        self._emit_incrementally = (
+            isinstance(self._emit_policy, (EmitAfterPeriod, EmitAfterWindow))
+            and self._emit_policy.emission_type == EmissionType.Incremental
+        )
+        if isinstance(self._emit_policy, EmitAfterMaxEvent) and self._emit_policy.timeout_secs and self._metrics:
+            self._metrics.register_gauge(f"{self.name}.timer_lag", self._get_timer_lag_metrics)
 
         self._augmentation_fn = augmentation_fn
         if not augmentation_fn:
@@ -142,9 +178,19 @@ class AggregateByKey(Flow):
     def _init(self):
         super()._init()
         self._events_in_batch = {}
+        # Batches of events are emitted when their timers, which start at their first event, fire
+        self._timers = _Timers()
         self._emit_worker_running = False
         self._terminate_worker = False
         self._timeout_task: Optional[asyncio.Task] = None
+        # Time of the last event of each key that may have changed since the last emission, when emitting incrementally
+        self._last_event_time_by_key = {}
+        # Event time state, when there is a watermark
+        self._max_event_time = None
+        self._next_emit_time = None
+        # Events held back until the watermark passes them, as a heap of (event time, sequence number, event)
+        self._held_events = []
+        self._held_event_sequence = itertools.count()
 
     def _check_unique_names(self, aggregates):
         unique_aggr_names = set()
@@ -200,59 +246,121 @@ class AggregateByKey(Flow):
     async def _do(self, event):
         if event == _termination_obj:
             self._terminate_worker = True
+            if self._max_event_time is not None:
+                # No more events can arrive, so everything up to the latest event is complete
+                await self._advance_watermark(self._max_event_time)
             return await self._do_downstream(_termination_obj)
 
         try:
             # check whether a background loop is needed, if so create start one
-            if (not self._emit_worker_running) and (
-                isinstance(self._emit_policy, EmitAfterPeriod) or isinstance(self._emit_policy, EmitAfterWindow)
+            if (
+                (not self._emit_worker_running)
+                and self._allowed_lateness_millis is None
+                and (isinstance(self._emit_policy, EmitAfterPeriod) or isinstance(self._emit_policy, EmitAfterWindow))
             ):
                 asyncio.get_running_loop().create_task(self._emit_worker())
                 self._emit_worker_running = True
 
-            element = event.body
-            key = event.key
-            if self._key_extractor:
-                key = self._key_extractor(element)
-
             event_timestamp = self._get_timestamp(event)
-
-            safe_key = stringify_key(key)
-            await self._table._lazy_load_key_with_aggregates(safe_key, event_timestamp)
-            await self._table._aggregate(safe_key, event, element, event_timestamp)
-
-            if isinstance(self._emit_policy, EmitEveryEvent):
-                await self._emit_event(key, event)
-            elif isinstance(self._emit_policy, EmitAfterMaxEvent):
-                if safe_key in self._events_in_batch:
-                    self._events_in_batch[safe_key]["counter"] += 1
-                else:
-                    event_dict = {"counter": 1, "time": time.monotonic()}
-                    self._events_in_batch[safe_key] = event_dict
-                self._events_in_batch[safe_key]["event"] = event
-                if self._emit_policy.timeout_secs and self._timeout_task is None:
-                    self._timeout_task = asyncio.get_running_loop().create_task(self._sleep_and_emit())
-                if self._events_in_batch[safe_key]["counter"] == self._emit_policy.max_events:
-                    event_from_batch = self._events_in_batch.pop(safe_key, None)
-                    if event_from_batch is not None:
-                        await self._emit_event(key, event_from_batch["event"])
+            if self._allowed_lateness_millis is None:
+                await self._aggregate_event(event, event_timestamp)
+            else:
+                await self._aggregate_event_by_watermark(event, event_timestamp)
         except Exception as ex:
             raise ex
 
-    async def _sleep_and_emit(self):
-        while self._events_in_batch:
-            key = next(iter(self._events_in_batch.keys()))
-            delta_seconds = time.monotonic() - self._events_in_batch[key]["time"]
-            if delta_seconds < self._emit_policy.timeout_secs:
-                await asyncio.sleep(self._emit_policy.timeout_secs - delta_seconds)
-            event = self._events_in_batch.pop(key, None)
-            if event is not None:
-                await self._emit_event(key, event["event"])
+    async def _aggregate_event_by_watermark(self, event, event_timestamp):
+        if self._max_event_time is None:
+            self._max_event_time = event_timestamp
+            if isinstance(self._emit_policy, (EmitAfterPeriod, EmitAfterWindow)):
+                millis_between_emits = self._get_seconds_between_emits() * 1000
+                self._next_emit_time = (int(event_timestamp / millis_between_emits) + 1) * millis_between_emits
+        elif event_timestamp < self._max_event_time - self._allowed_lateness_millis:
+            if self._late_data_handling == LateDataHandling.Drop:
+                return
+            await self._aggregate_event(event, event_timestamp)
+            return
+
+        # Events are held until the watermark passes them, so that the periods or windows that the watermark passes
+        # first are emitted without them
+        if self._late_data_handling == LateDataHandling.Sort_before_emit or self._next_emit_time is not None:
+            heapq.heappush(self._held_events, (event_timestamp, next(self._held_event_sequence), event))
+        else:
+            await self._aggregate_event(event, event_timestamp)
+        if event_timestamp >= self._max_event_time:
+            self._max_event_time = event_timestamp
+            await self._advance_watermark(self._max_event_time - self._allowed_lateness_millis)
+
+    # Aggregates the held events, and emits the periods or windows, that the watermark passed, in order of event time
+    async def _advance_watermark(self, watermark):
+        while True:
+            next_event_time = self._held_events[0][0] if self._held_events else math.inf
+            next_emit_time = math.inf if self._next_emit_time is None else self._next_emit_time
+            # Events that belong to the next period are held until it is emitted, which may be delayed
+            if next_event_time <= watermark and next_event_time < next_emit_time:
+                _, _, event = heapq.heappop(self._held_events)
+                await self._aggregate_event(event, next_event_time)
+            elif (
+                self._next_emit_time is not None
+                and self._next_emit_time + self._emit_policy.delay_in_seconds * 1000 <= watermark
+            ):
+                await self._emit_all_events(next_emit_time)
+                self._next_emit_time += self._get_seconds_between_emits() * 1000
+            else:
+                return
+
+    async def _aggregate_event(self, event, event_timestamp):
+        element = event.body
+        key = event.key
+        if self._key_extractor:
+            key = self._key_extractor(element)
+
+        safe_key = stringify_key(key)
+        await self._table._lazy_load_key_with_aggregates(safe_key, event_timestamp)
+        await self._table._aggregate(safe_key, event, element, event_timestamp)
+        if self._emit_incrementally:
+            last_event_time = self._last_event_time_by_key.get(safe_key)
+            if last_event_time is None or event_timestamp > last_event_time:
+                self._last_event_time_by_key[safe_key] = event_timestamp
+
+        if isinstance(self._emit_policy, EmitEveryEvent):
+            await self._emit_event(key, event)
+        elif isinstance(self._emit_policy, EmitAfterMaxEvent):
+            if safe_key in self._events_in_batch:
+                self._events_in_batch[safe_key]["counter"] += 1
+            else:
+                self._events_in_batch[safe_key] = {"counter": 1}
+                if self._emit_policy.timeout_secs:
+                    self._timers.schedule(safe_key, time.monotonic() + self._emit_policy.timeout_secs)
+            self._events_in_batch[safe_key]["event"] = event
+            if self._emit_policy.timeout_secs and self._timeout_task is None:
+                self._timeout_task = asyncio.get_running_loop().create_task(self._sleep_and_emit())
+            if self._events_in_batch[safe_key]["counter"] == self._emit_policy.max_events:
+                event_from_batch = self._events_in_batch.pop(safe_key, None)
+                self._timers.cancel(safe_key)
+                if event_from_batch is not None:
+                    await self._emit_event(key, event_from_batch["event"])
 
+    async def _sleep_and_emit(self):
+        await self._timers.run(self._emit_timed_out_event)
         self._timeout_task = None
 
+    async def _emit_timed_out_event(self, key):
+        event = self._events_in_batch.pop(key, None)
+        if event is not None:
+            await self._emit_event(key, event["event"])
+
+    def _get_timer_lag_metrics(self):
+        timers = getattr(self, "_timers", None)
+        return timers.get_lag_metrics() if timers is not None else None
+
     # Emit a single event for the requested key
     async def _emit_event(self, key, event):
+        event.body = await self._get_emitted_body(key, event)
+        event.key = key
+        await self._do_downstream(event)
+
+    async def _get_emitted_body(self, key, event):
         event_timestamp = self._get_timestamp(event)
 
         safe_key = stringify_key(key)
@@ -270,23 +378,59 @@ class AggregateByKey(Flow):
             emitted_attr_name = self._aliases.get(col, None) or col
             if col in self._table._get_static_attrs(safe_key):
                 features[emitted_attr_name] = self._table._get_static_attrs(safe_key)[col]
-        event.key = key
-        event.body = features
-        await self._do_downstream(event)
+        return features
+
+    # Keys whose features may have changed since the last emission. Keys whose windows have all passed since their last
+    # event are emitted one last time, and are then no longer tracked.
+    def _get_keys_to_emit(self, timestamp):
+        if not self._emit_incrementally:
+            return list(self._table._get_keys())
+        keys = list(self._last_event_time_by_key)
+        horizon = max(
+            aggregate.windows.max_window_millis + aggregate.windows.period_millis
+            for aggregate in self._aggregates_metadata
+        )
+        for key in keys:
+            if self._last_event_time_by_key[key] <= timestamp - horizon:
+                del self._last_event_time_by_key[key]
+        return keys
 
     # Emit multiple events for every key in the store with the current time
     async def _emit_all_events(self, timestamp):
-        for key in self._table._get_keys():
-            await self._emit_event(key, Event({"key": key, "time": timestamp}, key, timestamp, None))
-
-    async def _emit_worker(self):
+        processing_time = datetime.fromtimestamp(timestamp / 1000, timezone.utc)
+        keys = self._get_keys_to_emit(timestamp)
+        if not self._emit_policy.columnar:
+            for key in keys:
+                await self._emit_event(key, Event({"key": key, "time": timestamp}, key, processing_time))
+            return
+        if not keys:
+            return
+        # Columns that are missing for some keys (e.g. static attributes) are None for those keys
+        columns = {}
+        for index, key in enumerate(keys):
+            body = await self._get_emitted_body(key, Event({"key": key, "time": timestamp}, key, processing_time))
+            for name, value in body.items():
+                column = columns.get(name)
+                if column is None:
+                    column = [None] * index
+                    columns[name] = column
+                column.append(value)
+            for column in columns.values():
+                if len(column) == index:
+                    column.append(None)
+        await self._do_downstream(Event(columns, processing_time=processing_time))
+
+    def _get_seconds_between_emits(self):
         if isinstance(self._emit_policy, EmitAfterPeriod):
-            seconds_to_sleep_between_emits = self._aggregates_metadata[0].windows.period_millis / 1000
+            return self._aggregates_metadata[0].windows.period_millis / 1000
         elif isinstance(self._emit_policy, EmitAfterWindow):
-            seconds_to_sleep_between_emits = self._aggregates_metadata[0].windows.windows[0][0] / 1000
+            return self._aggregates_metadata[0].windows.windows[0][0] / 1000
         else:
             raise TypeError(f'Emit policy "{type(self._emit_policy)}" is not supported')
 
+    async def _emit_worker(self):
+        seconds_to_sleep_between_emits = self._get_seconds_between_emits()
+
         current_time = datetime.now().timestamp()
         next_emit_time = (
             int(current_time / seconds_to_sleep_between_emits) * seconds_to_sleep_between_emits
@@ -302,6 +446,18 @@ class AggregateByKey(Flow):
             next_emit_time = next_emit_time + seconds_to_sleep_between_emits
 
 
+def _parse_aggregation_feature(feature):
+    # Returns the feature name, aggregate and window of an aggregation feature, such as number_of_stuff_sum_1h or
+    # number_of_stuff_approx_p95_1h, or None if it is not one
+    match = re.match(r"(.*)_([a-z]+)_([0-9]+[smhd])$", feature)
+    if match and is_aggregation_name(match.group(2)):
+        return match.groups()
+    match = re.match(r"(.*)_(approx_[a-z0-9]+)_([0-9]+[smhd])$", feature)
+    if match and is_approximate_aggregate(match.group(2)):
+        return match.groups()
+    return None
+
+
 class QueryByKey(AggregateByKey):
     """
     Query features by name
@@ -339,17 +495,13 @@ class QueryByKey(AggregateByKey):
                 raise TypeError("Table can not be string if no context was provided to the step")
             table = kwargs["context"].get_table(table)
         for feature in features:
-            match = re.match(r".*_([a-z]+)_[0-9]+[smhd]$", feature) if table.supports_aggregations() else None
-            if match and is_aggregation_name(match.group(1)):
-                name, window = feature.rsplit("_", 1)
-                if name in resolved_aggrs:
-                    resolved_aggrs[name].append(window)
-                else:
-                    resolved_aggrs[name] = [window]
+            parsed_feature = _parse_aggregation_feature(feature) if table.supports_aggregations() else None
+            if parsed_feature:
+                name, aggr, window = parsed_feature
+                resolved_aggrs.setdefault((name, aggr), []).append(window)
             else:
                 self._enrich_cols.append(feature)
-        for name, windows in resolved_aggrs.items():
-            feature, aggr = name.rsplit("_", 1)
+        for (feature, aggr), windows in resolved_aggrs.items():
             # setting as SlidingWindow temporarily until actual window type will be read from schema
             self._aggrs.append(
                 FieldAggregator(
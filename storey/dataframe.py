@@ -33,6 +33,8 @@ class ReduceToDataFrame(Flow):
 
     """
 
+    _read_only = True
+
     def __init__(
         self,
         index: Optional[str] = None,
@@ -96,6 +98,8 @@ class ToDataFrame(Flow):
     for additional params, see documentation of  :class:`storey.flow.Flow`
     """
 
+    _read_only = True
+
     def __init__(self, index: Optional[str] = None, columns: Optional[List[str]] = None, **kwargs):
         super().__init__(**kwargs)
         self._index = index
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import asyncio
 import base64
 import json
 import os
@@ -25,7 +26,7 @@ import v3io.aio.dataplane
 from v3io.dataplane import kv_array
 
 from .dtypes import V3ioError
-from .utils import schema_file_name
+from .utils import schema_file_name, sketches_aggregation_name
 
 
 class Driver:
@@ -40,12 +41,25 @@ class Driver:
     async def _save_key(self, container, table_path, key, aggr_item, partitioned_by_key, additional_data):
         pass
 
+    # Override if the storage can write several keys in one round trip. Items are (key, aggr_item, additional_data).
+    async def _save_keys(self, container, table_path, items, partitioned_by_key):
+        await asyncio.gather(
+            *[
+                self._save_key(container, table_path, key, aggr_item, partitioned_by_key, additional_data)
+                for key, aggr_item, additional_data in items
+            ]
+        )
+
     async def _load_aggregates_by_key(self, container, table_path, key):
         return None, None
 
     async def _load_by_key(self, container, table_path, key, attributes):
         pass
 
+    # Override if the storage can look up several keys in one round trip
+    async def _load_by_keys(self, container, table_path, keys, attributes):
+        return await asyncio.gather(*[self._load_by_key(container, table_path, key, attributes) for key in keys])
+
     async def close(self):
         pass
 
@@ -104,6 +118,7 @@ class V3ioDriver(NeedsV3ioAccess, Driver):
 
         self._aggregation_attribute_prefix = "aggr_"
         self._aggregation_time_attribute_prefix = "_"
+        self._sketch_attribute_prefix = "_sketch_"
         self._error_code_string = "ErrorCode"
         self._false_condition_error_code = "16777244"
         self._mtime_header_name = "X-v3io-transaction-verifier"
@@ -446,6 +461,12 @@ class V3ioDriver(NeedsV3ioAccess, Driver):
                                 f"{expected_time_expr},{array_time_attribute_name})"
                             )
 
+                    expressions.extend(
+                        self._build_sketch_update_expressions(
+                            bucket, name, bucket_start_time, index_to_update, feature_attr
+                        )
+                    )
+
         expressions.extend(times_update_expressions.values())
 
         return expressions, pending_updates
@@ -530,6 +551,13 @@ class V3ioDriver(NeedsV3ioAccess, Driver):
                                     f"{arr_at_index}={aggregation_value.get_update_expression(arr_at_index)}"
                                 )
 
+                    if cached_time <= expected_time:
+                        expressions.extend(
+                            self._build_sketch_update_expressions(
+                                bucket, name, bucket_start_time, index_to_update, feature_attr
+                            )
+                        )
+
         if use_parallel:
             for attr_name, d in pexpressions.items():
                 encoded_array = kv_array.encode_list(d["values"][d["first_index"] : d["last_index"] + 1]).decode()
@@ -546,6 +574,15 @@ class V3ioDriver(NeedsV3ioAccess, Driver):
             aggregation_element.aggregation_buckets[name].storage_specific_cache[attribute_name] = new_time
         return expressions, pending_updates
 
+    def _build_sketch_update_expressions(self, bucket, name, bucket_start_time, index_to_update, feature_attr):
+        # Sketches cannot be merged by the storage, so the sketches of a bucket are written as a whole. They carry the
+        # start time of their bucket, so that those of older buckets, which are left in storage, are ignored on load.
+        serialized_sketches = bucket.get_serialized_sketches(bucket_start_time)
+        if not serialized_sketches:
+            return []
+        sketch_attribute_name = f"{self._sketch_attribute_prefix}{name}_{index_to_update}_{feature_attr}"
+        return [f"{sketch_attribute_name}={self._convert_python_obj_to_expression_value(serialized_sketches)}"]
+
     @staticmethod
     def _convert_python_obj_to_expression_value(value):
         if isinstance(value, str):
@@ -592,7 +629,12 @@ class V3ioDriver(NeedsV3ioAccess, Driver):
         elif response.status_code == 200:
             aggregations, additional_data = {}, {}
             for name, value in response.output.item.items():
-                if name.startswith(self._aggregation_attribute_prefix):
+                if name.startswith(self._sketch_attribute_prefix) and isinstance(value, (bytes, bytearray)):
+                    # The name of the attribute ends with the index of the bucket and the relevant attribute (a or b)
+                    feature_name = name[len(self._sketch_attribute_prefix) :].rsplit("_", 2)[0]
+                    sketches_name = f"{feature_name}_{sketches_aggregation_name}"
+                    aggregations.setdefault(sketches_name, []).append(bytes(value))
+                elif name.startswith(self._aggregation_attribute_prefix):
                     feature_and_aggr_name = name[len(self._aggregation_attribute_prefix) : -2]
                     feature_name = feature_and_aggr_name[: feature_and_aggr_name.rindex("_")]
                     associated_time_attr = f"{self._aggregation_time_attribute_prefix}{feature_name}_{name[-1]}"
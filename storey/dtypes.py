@@ -12,7 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
-from datetime import datetime, timezone
+import math
+import time
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 from typing import Callable, List, Optional, Union
 
@@ -23,6 +25,8 @@ from .utils import bucketPerWindow, get_one_unit_of_duration, parse_duration
 
 _termination_obj = object()
 
+_utc_epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
 known_driver_schemes = ["v3io", "redis", "rediss"]
 
 
@@ -41,6 +45,28 @@ class Event:
     :type awaitable_result: AwaitableResult (Optional)
     """
 
+    # Events are created for every record, and may be held in large numbers by steps that buffer them, so their
+    # attributes are slotted. __dict__ is kept for arbitrary metadata (e.g. shard_id and offset), and is only allocated
+    # when such an attribute is set.
+    __slots__ = (
+        "body",
+        "key",
+        "_processing_time",
+        "_creation_time_ns",
+        "id",
+        "headers",
+        "method",
+        "path",
+        "content_type",
+        "_awaitable_result",
+        "_original_events",
+        "_shared_body",
+        "origin_state",
+        "error",
+        "__dict__",
+        "__weakref__",
+    )
+
     _serialize_event_marker = "full_event_wrapper"
     _serialize_fields = ["key", "id"]
 
@@ -68,15 +94,34 @@ class Event:
                     f"Event processing_time parameter must be a datetime, string, or int. "
                     f"Got {type(processing_time)} instead."
                 )
-        self.processing_time = processing_time or datetime.now(timezone.utc)
+        if processing_time:
+            self._processing_time = processing_time
+        else:
+            # Converting the creation time to a datetime is deferred until it is first accessed
+            self._processing_time = None
+            self._creation_time_ns = time.time_ns()
         self.id = id
         self.headers = headers
         self.method = method
         self.path = path
         self.content_type = content_type
         self._awaitable_result = awaitable_result
+        self._original_events = None
+        self._shared_body = None
         self.error = None
 
+    @property
+    def processing_time(self) -> datetime:
+        processing_time = self._processing_time
+        if processing_time is None:
+            processing_time = _utc_epoch + timedelta(microseconds=self._creation_time_ns // 1000)
+            self._processing_time = processing_time
+        return processing_time
+
+    @processing_time.setter
+    def processing_time(self, processing_time: datetime):
+        self._processing_time = processing_time
+
     def __eq__(self, other):
         if not isinstance(other, Event):
             return False
@@ -292,6 +337,42 @@ class SlidingWindows(WindowsBase):
     def get_window_start_time_by_time(self, timestamp):
         return int(timestamp / self.period_millis) * self.period_millis
 
+    def get_tiers(self):
+        """Splits the windows into tiers, each of which is a SlidingWindows with a period that is a multiple of this
+        period. Windows are grouped by their unit of duration (e.g. 1h and 6h, or 1d and 30d), and each group gets the
+        longest period that divides all of its windows and is no longer than the period its unit would get by
+        default. Groups that get the same period share a tier."""
+        period_millis = int(self.period_millis)
+        windows_by_unit = {}
+        for window in self.windows:
+            windows_by_unit.setdefault(get_one_unit_of_duration(window[1]), []).append(window)
+
+        windows_by_period = {}
+        for unit_millis, windows_tuples in windows_by_unit.items():
+            max_period_millis = max(period_millis, unit_millis / bucketPerWindow)
+            periods_per_window = int(get_window_optimal_period_millis(windows_tuples)) // period_millis
+            # The largest divisor of periods_per_window that does not make the tier's period exceed the maximum
+            multiplier = 1
+            for divisor in range(1, math.isqrt(periods_per_window) + 1):
+                if periods_per_window % divisor == 0:
+                    for candidate in (divisor, periods_per_window // divisor):
+                        if multiplier < candidate and candidate * period_millis <= max_period_millis:
+                            multiplier = candidate
+            windows_by_period.setdefault(multiplier * period_millis, []).extend(windows_tuples)
+
+        return [
+            _sliding_windows(tier_period_millis, sorted(windows_tuples, key=lambda tup: tup[0]))
+            for tier_period_millis, windows_tuples in sorted(windows_by_period.items())
+        ]
+
+
+# Creates SlidingWindows from windows given as (milliseconds, string) tuples and a period given in milliseconds, which
+# need not be the period that their unit of duration would get
+def _sliding_windows(period_millis, windows_tuples):
+    windows = SlidingWindows.__new__(SlidingWindows)
+    WindowsBase.__init__(windows, period_millis, windows_tuples)
+    return windows
+
 
 class EmissionType(Enum):
     All = 1
@@ -308,10 +389,16 @@ class EmitAfterPeriod(EmitPolicy):
     Emit event for next step after each period ends
 
     :param delay_in_seconds: Delay event emission by seconds (Optional)
+    :param emission_type: EmissionType.All to emit every key in the table, or EmissionType.Incremental to emit only
+        keys that received events since the previous emission, or whose windows still held data at the previous
+        emission, since the features of other keys did not change. Defaults to EmissionType.All.
+    :param columnar: Whether to emit all keys as a single event, whose body maps each column to a list of values with
+        an entry per key, rather than as an event per key. Defaults to False.
     """
 
-    def __init__(self, delay_in_seconds: Optional[int] = 0, emission_type=EmissionType.All):
+    def __init__(self, delay_in_seconds: Optional[int] = 0, emission_type=EmissionType.All, columnar: bool = False):
         self.delay_in_seconds = delay_in_seconds
+        self.columnar = columnar
         EmitPolicy.__init__(self, emission_type)
 
     @staticmethod
@@ -324,10 +411,16 @@ class EmitAfterWindow(EmitPolicy):
     Emit event for next step after each window ends
 
     :param delay_in_seconds: Delay event emission by seconds (Optional)
+    :param emission_type: EmissionType.All to emit every key in the table, or EmissionType.Incremental to emit only
+        keys that received events since the previous emission, or whose windows still held data at the previous
+        emission, since the features of other keys did not change. Defaults to EmissionType.All.
+    :param columnar: Whether to emit all keys as a single event, whose body maps each column to a list of values with
+        an entry per key, rather than as an event per key. Defaults to False.
     """
 
-    def __init__(self, delay_in_seconds: Optional[int] = 0, emission_type=EmissionType.All):
+    def __init__(self, delay_in_seconds: Optional[int] = 0, emission_type=EmissionType.All, columnar: bool = False):
         self.delay_in_seconds = delay_in_seconds
+        self.columnar = columnar
         EmitPolicy.__init__(self, emission_type)
 
     @staticmethod
@@ -340,7 +433,9 @@ class EmitAfterMaxEvent(EmitPolicy):
     Emit the Nth event
 
     :param max_events: Which number of event to emit
-    :param timeout_secs: Emit event after timeout expires even if it didn't reach max_events event (Optional)
+    :param timeout_secs: Emit event after timeout expires even if it didn't reach max_events event (Optional). When the
+        step is given a metrics collector, how late events were emitted is reported as the "<step name>.timer_lag"
+        gauge.
     """
 
     def __init__(
@@ -393,10 +488,16 @@ def _dict_to_emit_policy(policy_dict):
             raise ValueError("delay parameter must be specified for afterDelay emit policy")
 
         policy = EmitAfterDelay(policy_dict.pop("delay"))
-    elif mode == EmitAfterWindow.name():
-        policy = EmitAfterWindow(delay_in_seconds=policy_dict.pop("delay", 0))
-    elif mode == EmitAfterPeriod.name():
-        policy = EmitAfterPeriod(delay_in_seconds=policy_dict.pop("delay", 0))
+    elif mode == EmitAfterWindow.name() or mode == EmitAfterPeriod.name():
+        emission_type = policy_dict.pop("emissionType", EmissionType.All.name)
+        if emission_type not in EmissionType.__members__:
+            raise ValueError(f"unsupported emission type: {emission_type}")
+        policy_class = EmitAfterWindow if mode == EmitAfterWindow.name() else EmitAfterPeriod
+        policy = policy_class(
+            delay_in_seconds=policy_dict.pop("delay", 0),
+            emission_type=EmissionType[emission_type],
+            columnar=policy_dict.pop("columnar", False),
+        )
     else:
         raise TypeError(f"unsupported emit policy type: {mode}")
 
@@ -409,6 +510,7 @@ def _dict_to_emit_policy(policy_dict):
 class LateDataHandling(Enum):
     Nothing = 1
     Sort_before_emit = 2
+    Drop = 3
 
 
 class FieldAggregator:
@@ -418,7 +520,11 @@ class FieldAggregator:
     :param name: Name for the feature.
     :param field: Field in the event body to aggregate.
     :param aggr: List of aggregates to apply.
-        Valid values are: [count, sum, sqr, avg, max, min, last, first, sttdev, stdvar]
+        Valid values are: [count, sum, sqr, avg, max, min, last, first, sttdev, stdvar], as well as the approximate
+        aggregates approx_distinct (estimated number of distinct values), approx_p<percentile> (e.g. approx_p95 for the
+        estimated 95th percentile) and approx_top<k> (e.g. approx_top3 for a list of the estimated 3 most frequent
+        values). Approximate aggregates are calculated from fixed-size sketches, which are kept per bucket and written
+        to storage as a whole. Storage that does not support aggregations, such as SQL, does not keep them.
     :param windows: Time windows to aggregate the data by.
     :param aggr_filter: Filter specifying which events to aggregate. (Optional)
     :param max_value: Maximum value for the aggregation (Optional)
@@ -442,6 +548,7 @@ class FieldAggregator:
             self.value_extractor = lambda element: element.get(field)
 
         self.name = name
+        self.field = field
         self.aggregations = aggr
         self.windows = windows
         self.aggr_filter = aggr_filter
@@ -15,7 +15,10 @@
 import asyncio
 import copy
 import datetime
+import heapq
 import inspect
+import itertools
+import math
 import pickle
 import time
 import traceback
@@ -27,13 +30,27 @@ from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Union
 import aiohttp
 
 from .dtypes import Event, FlowError, V3ioError, _termination_obj, known_driver_schemes
+from .metrics import MetricsCollector
 from .queue import AsyncQueue
 from .table import Table
 from .utils import _split_path, get_in, stringify_key, update_in
 
 
+class _SharedBody:
+    """Reference count of the events that share a single body after it was fanned out to multiple outlets."""
+
+    def __init__(self):
+        self.num_events = 1
+
+
 class Flow:
     _legal_first_step = False
+    # Steps that never modify the bodies of the events they receive in place may share those bodies with other
+    # branches of the flow. Other steps get a private copy of a shared body on receipt (copy-on-write).
+    _read_only = False
+    # Whether this step may be fused with the steps around it into a synchronous segment (see _fuse). This is not
+    # inherited by subclasses, which may override _do.
+    _fusible = False
 
     def __init__(
         self,
@@ -62,6 +79,9 @@ class Flow:
         self._full_event = kwargs.get("full_event")
         self._input_path = kwargs.get("input_path")
         self._result_path = kwargs.get("result_path")
+        read_only = kwargs.get("read_only")
+        if read_only is not None:
+            self._read_only = read_only
         self._runnable = False
         name = kwargs.get("name", None)
         if name:
@@ -69,7 +89,19 @@ class Flow:
         else:
             self.name = type(self).__name__
 
+        self._metrics = getattr(context, "metrics", None) if context else None
+        if not isinstance(self._metrics, MetricsCollector):
+            self._metrics = None
+        # Sources do not process events of their own
+        collect_step_metrics = self._metrics and not self._legal_first_step
+        self._step_metrics = self._metrics._get_step_metrics(self.name) if collect_step_metrics else None
+
         self._closeables = []
+        self._fused_steps = None
+
+    def _register_queue_metrics(self, name, get_queue):
+        if self._metrics:
+            self._metrics.register_queue(name, get_queue)
 
     def _init(self):
         self._termination_received = 0
@@ -187,6 +219,7 @@ class Flow:
         if not self._legal_first_step and not self._runnable:
             raise ValueError("Flow must start with a source")
         self._init()
+        self._fuse()
         outlets = []
         outlets.extend(self._outlets)
         outlets.extend(self._get_recovery_steps())
@@ -206,33 +239,146 @@ class Flow:
     async def run_async(self):
         raise NotImplementedError
 
+    def _can_fuse(self):
+        return type(self).__dict__.get("_fusible", False) and not self.verbose and self._step_metrics is None
+
+    def _fuse(self):
+        """Finds the linear chain of fusible steps that starts with this step, where each step has a single outlet that
+        has no other inlet. Events are then processed by the whole chain as ordinary function calls, without
+        intermediate _do_downstream calls, so that the loop is only yielded to at the chain's boundaries. The graph
+        itself is unchanged."""
+        self._fused_steps = None
+        if not self._can_fuse():
+            return
+        steps = [self]
+        step = self
+        while len(step._outlets) == 1:
+            step = step._outlets[0]
+            if len(step._inlets) != 1 or not step._can_fuse():
+                break
+            steps.append(step)
+        if len(steps) > 1:
+            self._fused_steps = steps
+
+    def _process(self, event, out):
+        """Synchronously processes an event, appending the resulting events to out. Implemented by fusible steps."""
+        raise NotImplementedError
+
+    async def _do_fused_batch(self, events):
+        out = []
+        for event in events:
+            await self._do_fused_from(0, event, out)
+        await self._fused_steps[-1]._do_downstream_batch(out)
+
+    async def _do_fused_from(self, index, event, out):
+        """Processes an event by the fused steps, starting from the step at the given index. The resulting events are
+        appended to out, if given, or forwarded downstream otherwise. Errors are attributed to, and recovered by, the
+        step that raised them."""
+        steps = self._fused_steps
+        num_steps = len(steps)
+        while index < num_steps:
+            step = steps[index]
+            step_out = []
+            try:
+                step._claim_event_body(event)
+                step._process(event, step_out)
+            except BaseException as ex:
+                if index == 0 and out is None:
+                    # Left to the caller, as for a step that is not fused
+                    raise
+                if out:
+                    await steps[-1]._do_downstream_batch(out)
+                    out.clear()
+                await step._recover(event, ex)
+                return
+            index += 1
+            if len(step_out) != 1:
+                for event in step_out:
+                    await self._do_fused_from(index, event, out)
+                return
+            event = step_out[0]
+        if out is not None:
+            out.append(event)
+        elif steps[-1]._outlets:
+            await steps[-1]._do_downstream(event)
+
     async def _do(self, event):
         raise NotImplementedError
 
+    def _claim_event_body(self, event):
+        """Gives this step a body it may modify, if the event's body is shared with other branches of the flow. The
+        body is copied, unless this step is read-only or this event is the last one still sharing it."""
+        shared_body = getattr(event, "_shared_body", None)
+        if shared_body is None or self._read_only:
+            return
+        event._shared_body = None
+        shared_body.num_events -= 1
+        if shared_body.num_events > 0:
+            event.body = copy.deepcopy(event.body)
+
     async def _do_and_recover(self, event):
+        if self._step_metrics is not None and event is not _termination_obj:
+            return await self._do_and_recover_with_metrics(event)
+        try:
+            self._claim_event_body(event)
+            return await self._do(event)
+        except BaseException as ex:
+            return await self._recover(event, ex)
+
+    async def _do_and_recover_with_metrics(self, event):
+        start = time.perf_counter()
         try:
+            self._claim_event_body(event)
             return await self._do(event)
         except BaseException as ex:
-            if getattr(ex, "_raised_by_storey_step", None) is not None:
+            return await self._recover(event, ex)
+        finally:
+            self._step_metrics.observe(start, time.perf_counter())
+
+    # Must be awaited from within an except clause, so that the traceback of ex is available
+    async def _recover(self, event, ex):
+        if getattr(ex, "_raised_by_storey_step", None) is not None:
+            raise ex
+        ex._raised_by_storey_step = self
+        if self._step_metrics is not None:
+            self._step_metrics.errors += 1
+        recovery_step = self._get_recovery_step(ex)
+        if recovery_step is None:
+            if self.context and hasattr(self.context, "push_error"):
+                message = traceback.format_exc()
+                if event._awaitable_result:
+                    none_or_coroutine = event._awaitable_result._set_error(ex)
+                    if none_or_coroutine:
+                        await none_or_coroutine
+                if self.logger:
+                    self.logger.error(f"Pushing error to error stream: {ex}\n{message}")
+                self.context.push_error(event, f"{ex}\n{message}", source=self.name)
+                return
+            else:
                 raise ex
-            ex._raised_by_storey_step = self
-            recovery_step = self._get_recovery_step(ex)
-            if recovery_step is None:
-                if self.context and hasattr(self.context, "push_error"):
-                    message = traceback.format_exc()
-                    if event._awaitable_result:
-                        none_or_coroutine = event._awaitable_result._set_error(ex)
-                        if none_or_coroutine:
-                            await none_or_coroutine
-                    if self.logger:
-                        self.logger.error(f"Pushing error to error stream: {ex}\n{message}")
-                    self.context.push_error(event, f"{ex}\n{message}", source=self.name)
-                    return
-                else:
-                    raise ex
-            event.origin_state = self.name
-            event.error = ex
-            return await recovery_step._do(event)
+        event.origin_state = self.name
+        event.error = ex
+        recovery_step._claim_event_body(event)
+        return await recovery_step._do(event)
+
+    async def _do_batch(self, events):
+        """Processes a list of events. Steps that don't override this method process the events one by one."""
+        for event in events:
+            await self._do_and_recover(event)
+
+    async def _do_batch_with(self, events, fn):
+        """Applies fn(event, out) to each event, where fn appends its output events to out, and then forwards out
+        downstream as a single batch. Errors are handled per event, after the events that preceded the failed event
+        were forwarded, so that ordering is the same as when events are processed one by one."""
+        out = []
+        for event in events:
+            try:
+                fn(event, out)
+            except BaseException as ex:
+                await self._do_downstream_batch(out)
+                out = []
+                await self._recover(event, ex)
+        await self._do_downstream_batch(out)
 
     @staticmethod
     def _event_string(event):
@@ -269,19 +415,15 @@ class Flow:
         # If there is more than one outlet, allow concurrent execution.
         tasks = []
         if len(self._outlets) > 1:
-            awaitable_result = event._awaitable_result
-            event._awaitable_result = None
-            original_events = getattr(event, "_original_events", None)
-            # Temporarily delete self-reference to avoid deepcopy getting stuck in an infinite loop
-            event._original_events = None
+            # Outlets get shallow copies of the event that share its body, which is only copied by steps that modify it
+            shared_body = getattr(event, "_shared_body", None)
+            if shared_body is None:
+                shared_body = _SharedBody()
+                event._shared_body = shared_body
             for i in range(1, len(self._outlets)):
-                event_copy = copy.deepcopy(event)
-                event_copy._awaitable_result = awaitable_result
-                event_copy._original_events = original_events
+                event_copy = copy.copy(event)
+                shared_body.num_events += 1
                 tasks.append(asyncio.get_running_loop().create_task(self._outlets[i]._do_and_recover(event_copy)))
-            # Set self-reference back after deepcopy
-            event._original_events = original_events
-            event._awaitable_result = awaitable_result
         if self.verbose and self.logger:
             step_name = self.name
             event_string = self._event_string(event)
@@ -292,6 +434,16 @@ class Flow:
                 self.logger.debug(f"{step_name} -> {self._outlets[i].name} | {event_string}")
             await task
 
+    async def _do_downstream_batch(self, events):
+        if not self._outlets or not events:
+            return
+        # Sharing bodies between outlets, verbose logging and metrics collection are done per event
+        if len(self._outlets) > 1 or self.verbose or self._outlets[0]._step_metrics is not None:
+            for event in events:
+                await self._do_downstream(event)
+            return
+        await self._outlets[0]._do_batch(events)
+
     def _get_event_or_body(self, event):
         if self._full_event:
             return event
@@ -307,6 +459,10 @@ class Flow:
             return fn_result
         else:
             mapped_event = copy.copy(event)
+            shared_body = getattr(event, "_shared_body", None)
+            if shared_body is not None:
+                # The new event may reference the shared body, or parts of it, as well
+                shared_body.num_events += 1
             if self._result_path:
                 if not hasattr(event.body, "__getitem__"):
                     raise TypeError("result_path parameter supports only dict-like event bodies")
@@ -348,6 +504,8 @@ class Choice(Flow):
     :type full_event: boolean
     """
 
+    _read_only = True
+
     def __init__(self, choice_array, default=None, **kwargs):
         Flow.__init__(self, **kwargs)
 
@@ -369,12 +527,16 @@ class Choice(Flow):
                 chosen_outlet = outlet
                 break
         if chosen_outlet:
+            chosen_outlet._claim_event_body(event)
             await chosen_outlet._do(event)
         elif self._default:
+            self._default._claim_event_body(event)
             await self._default._do(event)
 
 
 class Recover(Flow):
+    _read_only = True
+
     def __init__(self, exception_to_downstream, **kwargs):
         Flow.__init__(self, **kwargs)
 
@@ -389,6 +551,7 @@ class Recover(Flow):
             except BaseException as ex:
                 typ = type(ex)
                 if typ in self._exception_to_downstream:
+                    self._exception_to_downstream[typ]._claim_event_body(event)
                     await self._exception_to_downstream[typ]._do(event)
                 else:
                     raise ex
@@ -421,29 +584,68 @@ class _UnaryFunctionFlow(Flow):
     async def _do_internal(self, element, fn_result):
         raise NotImplementedError()
 
+    def _do_internal_batch(self, event, fn_result, out):
+        raise NotImplementedError()
+
+    def _can_fuse(self):
+        return super()._can_fuse() and not self._is_async and not self._long_running
+
+    def _process(self, event, out):
+        kwargs = {}
+        if self._pass_context:
+            kwargs = {"context": self.context}
+        fn_result = self._fn(self._get_event_or_body(event), **kwargs)
+        self._do_internal_batch(event, fn_result, out)
+
     async def _do(self, event):
         if event is _termination_obj:
             return await self._do_downstream(_termination_obj)
+        elif self._fused_steps:
+            await self._do_fused_from(0, event, None)
         else:
             element = self._get_event_or_body(event)
             fn_result = await self._call(element)
             await self._do_internal(event, fn_result)
 
+    async def _do_batch(self, events):
+        if self._fused_steps:
+            await self._do_fused_batch(events)
+        elif self._is_async or self._long_running:
+            await super()._do_batch(events)
+        else:
+            await self._do_batch_with(events, self._process)
+
 
 class DropColumns(Flow):
+    _fusible = True
+
     def __init__(self, columns, **kwargs):
         super().__init__(**kwargs)
         if not isinstance(columns, list):
             columns = [columns]
         self._columns = columns
 
+    def _process(self, event, out):
+        new_body = copy.copy(event.body)
+        for column in self._columns:
+            new_body.pop(column, None)
+        event.body = new_body
+        out.append(event)
+
     async def _do(self, event):
-        if event is not _termination_obj:
-            new_body = copy.copy(event.body)
-            for column in self._columns:
-                new_body.pop(column, None)
-            event.body = new_body
-        return await self._do_downstream(event)
+        if event is _termination_obj:
+            return await self._do_downstream(event)
+        elif self._fused_steps:
+            await self._do_fused_from(0, event, None)
+        else:
+            self._process(event, [])
+            await self._do_downstream(event)
+
+    async def _do_batch(self, events):
+        if self._fused_steps:
+            await self._do_fused_batch(events)
+        else:
+            await self._do_batch_with(events, self._process)
 
 
 class Map(_UnaryFunctionFlow):
@@ -459,12 +661,20 @@ class Map(_UnaryFunctionFlow):
     :param full_event: Whether user functions should receive and/or return Event objects (when True),
         or only the payload (when False). Defaults to False.
     :type full_event: boolean
+    :param read_only: Whether fn never modifies the events it receives in place. Read-only steps share event bodies
+        with other branches of the flow instead of copying them. Defaults to False.
+    :type read_only: boolean
     """
 
+    _fusible = True
+
     async def _do_internal(self, event, fn_result):
         mapped_event = self._user_fn_output_to_event(event, fn_result)
         await self._do_downstream(mapped_event)
 
+    def _do_internal_batch(self, event, fn_result, out):
+        out.append(self._user_fn_output_to_event(event, fn_result))
+
 
 class Filter(_UnaryFunctionFlow):
     """Filters events based on a user-provided function.
@@ -479,12 +689,21 @@ class Filter(_UnaryFunctionFlow):
     :param full_event: Whether user functions should receive and/or return Event objects (when True), or only the
         payload (when False). Defaults to False.
     :type full_event: boolean
+    :param read_only: Whether fn never modifies the events it receives in place. Read-only steps share event bodies
+        with other branches of the flow instead of copying them. Defaults to False.
+    :type read_only: boolean
     """
 
+    _fusible = True
+
     async def _do_internal(self, event, keep):
         if keep:
             await self._do_downstream(event)
 
+    def _do_internal_batch(self, event, keep, out):
+        if keep:
+            out.append(event)
+
 
 class FlatMap(_UnaryFunctionFlow):
     """Maps, or transforms, each incoming event into any number of events.
@@ -501,11 +720,17 @@ class FlatMap(_UnaryFunctionFlow):
     :type full_event: boolean
     """
 
+    _fusible = True
+
     async def _do_internal(self, event, fn_result):
         for fn_result_element in fn_result:
             mapped_event = self._user_fn_output_to_event(event, fn_result_element)
             await self._do_downstream(mapped_event)
 
+    def _do_internal_batch(self, event, fn_result, out):
+        for fn_result_element in fn_result:
+            out.append(self._user_fn_output_to_event(event, fn_result_element))
+
 
 class Extend(_UnaryFunctionFlow):
     """Adds fields to each incoming event.
@@ -523,11 +748,18 @@ class Extend(_UnaryFunctionFlow):
     :type full_event: boolean
     """
 
+    _fusible = True
+
     async def _do_internal(self, event, fn_result):
         for key, value in fn_result.items():
             event.body[key] = value
         await self._do_downstream(event)
 
+    def _do_internal_batch(self, event, fn_result, out):
+        for key, value in fn_result.items():
+            event.body[key] = value
+        out.append(event)
+
 
 class _FunctionWithStateFlow(Flow):
     def __init__(self, initial_state, fn, group_by_key=False, **kwargs):
@@ -550,6 +782,8 @@ class _FunctionWithStateFlow(Flow):
         self._group_by_key = group_by_key
         if hasattr(self._state, "close"):
             self._closeables = [self._state]
+        if isinstance(self._state, Table):
+            self._register_queue_metrics(f"{self.name}.table", lambda: self._state._q)
 
     async def _call(self, event):
         element = self._get_event_or_body(event)
@@ -576,6 +810,8 @@ class _FunctionWithStateFlow(Flow):
     async def _do(self, event):
         if event is _termination_obj:
             return await self._do_downstream(_termination_obj)
+        elif self._fused_steps:
+            await self._do_fused_from(0, event, None)
         else:
             fn_result = await self._call(event)
             await self._do_internal(event, fn_result)
@@ -597,6 +833,16 @@ class MapWithState(_FunctionWithStateFlow):
     :type full_event: boolean
     """
 
+    _fusible = True
+
+    def _can_fuse(self):
+        # State that is grouped by key is kept in a table, which is accessed asynchronously
+        return super()._can_fuse() and not self._is_async and not self._group_by_key
+
+    def _process(self, event, out):
+        mapped_element, self._state = self._fn(self._get_event_or_body(event), self._state)
+        out.append(self._user_fn_output_to_event(event, mapped_element))
+
     async def _do_internal(self, event, mapped_element):
         mapped_event = self._user_fn_output_to_event(event, mapped_element)
         await self._do_downstream(mapped_event)
@@ -652,17 +898,33 @@ class Rename(Flow):
     :type name: string
     """
 
+    _fusible = True
+
     def __init__(self, mapping: Dict[str, str], **kwargs):
         super().__init__(**kwargs)
         self.mapping = mapping
 
+    def _process(self, event, out):
+        for old_name, new_name in self.mapping.items():
+            if old_name in event.body:
+                event.body[new_name] = event.body.get(old_name)
+                del event.body[old_name]
+        out.append(event)
+
     async def _do(self, event):
-        if event is not _termination_obj:
-            for old_name, new_name in self.mapping.items():
-                if old_name in event.body:
-                    event.body[new_name] = event.body.get(old_name)
-                    del event.body[old_name]
-        return await self._do_downstream(event)
+        if event is _termination_obj:
+            return await self._do_downstream(event)
+        elif self._fused_steps:
+            await self._do_fused_from(0, event, None)
+        else:
+            self._process(event, [])
+            await self._do_downstream(event)
+
+    async def _do_batch(self, events):
+        if self._fused_steps:
+            await self._do_fused_batch(events)
+        else:
+            await self._do_batch_with(events, self._process)
 
 
 class ReifyMetadata(Flow):
@@ -676,19 +938,29 @@ class ReifyMetadata(Flow):
     :type name: string
     """
 
+    _fusible = True
+
     def __init__(self, mapping: Iterable[str], **kwargs):
         super().__init__(**kwargs)
         self.mapping = mapping
 
+    def _process(self, event, out):
+        if isinstance(self.mapping, dict):
+            for attribute_name, entry_key in self.mapping.items():
+                event.body[entry_key] = getattr(event, attribute_name)
+        else:
+            for attribute_name in self.mapping:
+                event.body[attribute_name] = getattr(event, attribute_name)
+        out.append(event)
+
     async def _do(self, event):
-        if event is not _termination_obj:
-            if isinstance(self.mapping, dict):
-                for attribute_name, entry_key in self.mapping.items():
-                    event.body[entry_key] = getattr(event, attribute_name)
-            else:
-                for attribute_name in self.mapping:
-                    event.body[attribute_name] = getattr(event, attribute_name)
-        return await self._do_downstream(event)
+        if event is _termination_obj:
+            return await self._do_downstream(event)
+        elif self._fused_steps:
+            await self._do_fused_from(0, event, None)
+        else:
+            self._process(event, [])
+            await self._do_downstream(event)
 
 
 class Complete(Flow):
@@ -702,6 +974,8 @@ class Complete(Flow):
     :type full_event: boolean
     """
 
+    _read_only = True
+
     async def _do(self, event):
         termination_result = await self._do_downstream(event)
         if event is not _termination_obj:
@@ -727,8 +1001,13 @@ class Reduce(Flow):
     :param full_event: Whether user functions should receive and/or return Event objects (when True),
         or only the payload (when False). Defaults to False.
     :type full_event: boolean
+    :param read_only: Whether fn never modifies the events it receives in place. Read-only steps share event bodies
+        with other branches of the flow instead of copying them. Defaults to False.
+    :type read_only: boolean
     """
 
+    _fusible = True
+
     def __init__(self, initial_value, fn, **kwargs):
         kwargs["initial_value"] = initial_value
         super().__init__(**kwargs)
@@ -745,6 +1024,16 @@ class Reduce(Flow):
     def to(self, outlet):
         raise ValueError("Reduce is a terminal step. It cannot be piped further.")
 
+    def _can_fuse(self):
+        return super()._can_fuse() and not self._is_async
+
+    def _process(self, event, out):
+        if self._full_event:
+            elem = event
+        else:
+            elem = event.body
+        self._result = self._fn(self._result, elem)
+
     async def _do(self, event):
         if event is _termination_obj:
             return self._result
@@ -795,24 +1084,93 @@ class HttpResponse:
         self.body = body
 
 
+class _AdaptiveConcurrencyLimit:
+    """Adapts a concurrency limit to observed latency, using a variation on the gradient algorithm. Recent latency is
+    compared to its long-term average: the limit grows while the two are close, and shrinks as recent latency rises
+    above the average, which indicates that the backend is saturated. The limit also shrinks when jobs fail."""
+
+    _short_window = 10
+    _long_window = 500
+    # How much recent latency may exceed the long-term average before the limit shrinks
+    _tolerance = 1.5
+    _smoothing = 0.2
+    _backoff_ratio = 0.9
+
+    def __init__(self, min_limit, max_limit, clock=None):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        # Measures the latency of jobs
+        self.clock = clock or time.perf_counter
+        self.limit = float(min_limit)
+        self._short_latency = None
+        self._long_latency = None
+
+    def on_completed(self, latency, in_flight):
+        if self._long_latency is None:
+            self._short_latency = latency
+            self._long_latency = latency
+        else:
+            self._short_latency += (latency - self._short_latency) / self._short_window
+            self._long_latency += (latency - self._long_latency) / self._long_window
+            if self._long_latency > 2 * self._short_latency:
+                # Let the long-term average catch up with a lasting drop in latency
+                self._long_latency *= 0.95
+        if in_flight < self.limit / 2:
+            # The limit is not what holds processing back, so there is nothing to learn about it
+            return
+        gradient = max(0.5, min(1.0, self._tolerance * self._long_latency / self._short_latency))
+        new_limit = self.limit * gradient + math.sqrt(self.limit)
+        self._set_limit(self.limit * (1 - self._smoothing) + new_limit * self._smoothing)
+
+    def on_failed(self):
+        self._set_limit(self.limit * self._backoff_ratio)
+
+    def _set_limit(self, limit):
+        self.limit = min(self.max_limit, max(self.min_limit, limit))
+
+
 class _ConcurrentJobExecution(Flow):
     _BACKOFF_MAX = 120
     _DEFAULT_MAX_IN_FLIGHT = 8
 
-    def __init__(self, max_in_flight=None, retries=None, backoff_factor=None, **kwargs):
+    def __init__(
+        self, max_in_flight=None, retries=None, backoff_factor=None, ordered=None, min_in_flight=None, **kwargs
+    ):
         Flow.__init__(self, **kwargs)
         if max_in_flight is not None and max_in_flight < 1:
             raise ValueError(f"max_in_flight may not be less than 1 (got {max_in_flight})")
+        if ordered not in (None, True, False, "key"):
+            raise ValueError(f'ordered must be True, False, or "key" (got {ordered})')
+        if min_in_flight is not None and not 1 <= min_in_flight <= (max_in_flight or self._DEFAULT_MAX_IN_FLIGHT):
+            raise ValueError(
+                f"min_in_flight must be between 1 and max_in_flight ({max_in_flight or self._DEFAULT_MAX_IN_FLIGHT}), "
+                f"got {min_in_flight}"
+            )
         self.max_in_flight = max_in_flight
         self.retries = retries
         self.backoff_factor = backoff_factor
+        self.ordered = ordered
+        self.min_in_flight = min_in_flight
 
         self._queue_size = (max_in_flight or self._DEFAULT_MAX_IN_FLIGHT) - 1
+        self._register_queue_metrics(self.name, lambda: getattr(self, "_q", None))
+        if min_in_flight is not None and self._metrics:
+            self._metrics.register_gauge(f"{self.name}.in_flight_limit", self._get_in_flight_limit)
+            self._metrics.register_gauge(f"{self.name}.in_flight", lambda: getattr(self, "_running", 0))
 
     def _init(self):
         super()._init()
         self._q = None
         self._lazy_init_complete = False
+        self._running = 0
+        self._limiter = None
+        if self.min_in_flight is not None:
+            self._limiter = _AdaptiveConcurrencyLimit(self.min_in_flight, self._queue_size + 1)
+        self._job_done = None
+        # Used when results are not forwarded in arrival order
+        self._jobs = set()
+        self._last_job_by_key = {}
+        self._job_error = None
 
     async def _worker(self):
         event = None
@@ -831,25 +1189,8 @@ class _ConcurrentJobExecution(Flow):
                     await self._q.get()
                 except BaseException as ex:
                     await self._q.get()
-                    ex._raised_by_storey_step = self
-                    recovery_step = self._get_recovery_step(ex)
                     try:
-                        if recovery_step is not None:
-                            event.origin_state = self.name
-                            event.error = ex
-                            await recovery_step._do(event)
-                        else:
-                            if event._awaitable_result:
-                                none_or_coroutine = event._awaitable_result._set_error(ex)
-                                if none_or_coroutine:
-                                    await none_or_coroutine
-                            if self.context and hasattr(self.context, "push_error"):
-                                message = traceback.format_exc()
-                                if self.logger:
-                                    self.logger.error(f"Pushing error to error stream: {ex}\n{message}")
-                                self.context.push_error(event, f"{ex}\n{message}", source=self.name)
-                            else:
-                                raise ex
+                        await self._handle_job_error(event, ex)
                     except BaseException:
                         if not self._q.empty():
                             await self._q.get()
@@ -857,6 +1198,86 @@ class _ConcurrentJobExecution(Flow):
         finally:
             await self._cleanup()
 
+    # Must be awaited from within an except clause, so that the traceback of ex is available
+    async def _handle_job_error(self, event, ex):
+        ex._raised_by_storey_step = self
+        if self._step_metrics is not None:
+            self._step_metrics.errors += 1
+        recovery_step = self._get_recovery_step(ex)
+        if recovery_step is not None:
+            event.origin_state = self.name
+            event.error = ex
+            recovery_step._claim_event_body(event)
+            await recovery_step._do(event)
+        else:
+            if event._awaitable_result:
+                none_or_coroutine = event._awaitable_result._set_error(ex)
+                if none_or_coroutine:
+                    await none_or_coroutine
+            if self.context and hasattr(self.context, "push_error"):
+                message = traceback.format_exc()
+                if self.logger:
+                    self.logger.error(f"Pushing error to error stream: {ex}\n{message}")
+                self.context.push_error(event, f"{ex}\n{message}", source=self.name)
+            else:
+                raise ex
+
+    async def _run_job(self, event, processing, preceding_job):
+        try:
+            try:
+                completed = await processing
+            finally:
+                if preceding_job is not None:
+                    # Results of events with the same key are forwarded in arrival order
+                    await asyncio.wait([preceding_job])
+            await self._handle_completed(event, completed)
+        except BaseException as ex:
+            try:
+                await self._handle_job_error(event, ex)
+            except BaseException as job_error:
+                if self._job_error is None:
+                    self._job_error = job_error
+
+    def _start_job(self, event):
+        preceding_job = None
+        key = None
+        if self.ordered == "key":
+            key = stringify_key(event.key)
+            preceding_job = self._last_job_by_key.get(key)
+        job = asyncio.get_running_loop().create_task(self._run_job(event, self._start_processing(event), preceding_job))
+        self._jobs.add(job)
+        if self.ordered == "key":
+            self._last_job_by_key[key] = job
+
+        def on_done(_):
+            self._jobs.discard(job)
+            if self.ordered == "key" and self._last_job_by_key.get(key) is job:
+                del self._last_job_by_key[key]
+
+        job.add_done_callback(on_done)
+
+    async def _raise_job_error(self):
+        if self._job_error is not None:
+            if self._jobs:
+                await asyncio.wait(self._jobs)
+            await self._cleanup()
+            raise self._job_error
+
+    async def _do_unordered(self, event):
+        await self._raise_job_error()
+        if event is _termination_obj:
+            if self._jobs:
+                await asyncio.wait(self._jobs)
+            await self._raise_job_error()
+            await self._cleanup()
+            return await self._do_downstream(_termination_obj)
+        while len(self._jobs) > self._queue_size:
+            await asyncio.wait(self._jobs, return_when=asyncio.FIRST_COMPLETED)
+            await self._raise_job_error()
+        if self._limiter is not None:
+            await self._wait_for_capacity()
+        self._start_job(event)
+
     async def _process_event(self, event):
         raise NotImplementedError()
 
@@ -869,6 +1290,38 @@ class _ConcurrentJobExecution(Flow):
     async def _lazy_init(self):
         pass
 
+    def _get_in_flight_limit(self):
+        limiter = getattr(self, "_limiter", None)
+        return int(limiter.limit) if limiter else self.min_in_flight
+
+    async def _wait_for_capacity(self):
+        if self._job_done is None:
+            self._job_done = asyncio.Event()
+        while self._running >= int(self._limiter.limit):
+            self._job_done.clear()
+            await self._job_done.wait()
+
+    async def _process_event_with_limit(self, event):
+        start = self._limiter.clock()
+        try:
+            result = await self._process_event_with_retries(event)
+        except BaseException:
+            self._limiter.on_failed()
+            raise
+        else:
+            self._limiter.on_completed(self._limiter.clock() - start, self._running)
+            return result
+        finally:
+            self._running -= 1
+            self._job_done.set()
+
+    def _start_processing(self, event):
+        if self._limiter is None:
+            return self._process_event_with_retries(event)
+        # Counted on admission rather than when processing starts, so that the limit is not exceeded in the meantime
+        self._running += 1
+        return self._process_event_with_limit(event)
+
     async def _process_event_with_retries(self, event):
         times_attempted = 0
         max_attempts = (self.retries or 0) + 1
@@ -892,6 +1345,9 @@ class _ConcurrentJobExecution(Flow):
             await self._lazy_init()
             self._lazy_init_complete = True
 
+        if self.ordered in (False, "key") and self._queue_size > 0:
+            return await self._do_unordered(event)
+
         if not self._q and self._queue_size > 0:
             self._q = AsyncQueue(self._queue_size)
             self._worker_awaitable = asyncio.get_running_loop().create_task(self._worker())
@@ -908,7 +1364,9 @@ class _ConcurrentJobExecution(Flow):
                 await self._cleanup()
             return await self._do_downstream(_termination_obj)
         else:
-            coroutine = self._process_event_with_retries(event)
+            if self._limiter is not None:
+                await self._wait_for_capacity()
+            coroutine = self._start_processing(event)
             if self._queue_size == 0:
                 completed = await coroutine
                 await self._handle_completed(event, completed)
@@ -931,8 +1389,16 @@ class ConcurrentExecution(_ConcurrentJobExecution):
       * "multiprocessing" – for processing-intensive tasks
 
     :param max_in_flight: Maximum number of events to be processed at a time (default 8)
+    :param min_in_flight: If set, the number of events processed at a time is adapted to the observed processing
+      latency, between min_in_flight and max_in_flight. It grows while latency is stable, and shrinks as latency rises
+      or processing fails. Optional. By default, up to max_in_flight events are processed at a time.
     :param retries: Maximum number of retries per event (default 0)
     :param backoff_factor: Wait time in seconds between retries (default 1)
+    :param ordered: One of:
+      * True (default) – results are passed on in the order in which events were received
+      * False – results are passed on as soon as they are ready, so that a slow event does not hold back the others
+      * "key" – like False, except that results of events with the same key are passed on in the order in which the
+        events were received
     :param pass_context: If False, the process_event function will be called with just one parameter (event). If True,
       the process_event function will be called with two parameters (event, context). Defaults to False.
     """
@@ -998,6 +1464,14 @@ class SendToHttp(_ConcurrentJobExecution):
     :param full_event: Whether user functions should receive and/or return Event objects (when True),
         or only the payload (when False). Defaults to False.
     :type full_event: boolean
+    :param max_in_flight: Maximum number of requests to be sent at a time (default 8).
+    :type max_in_flight: int
+    :param min_in_flight: If set, the number of requests sent at a time is adapted to the observed response latency,
+        between min_in_flight and max_in_flight. Optional.
+    :type min_in_flight: int
+    :param ordered: Whether responses are passed on in the order in which events were received (True, the default),
+        as soon as they arrive (False), or in order only among events with the same key ("key").
+    :type ordered: boolean or string
     """
 
     def __init__(self, request_builder, join_from_response, **kwargs):
@@ -1028,6 +1502,79 @@ class SendToHttp(_ConcurrentJobExecution):
             await self._do_downstream(new_event)
 
 
+class _Timers:
+    """Deadlines of keys, in monotonic time, kept in a heap so that all keys that are due are found in one pass without
+    going over the others. Each key has at most one deadline. Also keeps the lag of the timers that fired, which is how
+    late they were handled relative to their deadlines."""
+
+    # The heap is rebuilt when most of its entries are of timers that were cancelled
+    _min_heap_size_to_compact = 64
+
+    def __init__(self):
+        self._heap = []
+        self._deadlines = {}
+        # Breaks ties between equal deadlines, since keys may not be comparable
+        self._sequence = itertools.count()
+        self.fired = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def schedule(self, key, deadline):
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._sequence), key))
+
+    def cancel(self, key):
+        if self._deadlines.pop(key, None) is not None and len(self._heap) > max(
+            self._min_heap_size_to_compact, 2 * len(self._deadlines)
+        ):
+            self._heap = [entry for entry in self._heap if self._deadlines.get(entry[2]) == entry[0]]
+            heapq.heapify(self._heap)
+
+    def next_deadline(self):
+        # Entries of cancelled timers are dropped when they reach the top of the heap
+        while self._heap:
+            deadline, _, key = self._heap[0]
+            if self._deadlines.get(key) == deadline:
+                return deadline
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now):
+        due_keys = []
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > now:
+                return due_keys
+            _, _, key = heapq.heappop(self._heap)
+            del self._deadlines[key]
+            due_keys.append(key)
+            lag = now - deadline
+            self.fired += 1
+            self.total_lag += lag
+            if lag > self.max_lag:
+                self.max_lag = lag
+
+    def get_lag_metrics(self):
+        return {
+            "fired": self.fired,
+            "mean_lag": self.total_lag / self.fired if self.fired else None,
+            "max_lag": self.max_lag,
+        }
+
+    async def run(self, fire):
+        """Sleeps until the earliest deadline, and then awaits fire(key) for every key that is due, until there are no
+        timers left."""
+        while self._deadlines:
+            delay = self.next_deadline() - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            for key in self.pop_due(time.monotonic()):
+                await fire(key)
+
+
 class _Batching(Flow):
     _do_downstream_per_event = True
 
@@ -1052,8 +1599,13 @@ class _Batching(Flow):
 
         if self._flush_after_seconds is not None and self._flush_after_seconds < 0:
             raise ValueError("flush_after_seconds cannot be negative")
+        if self._flush_after_seconds is not None and self._metrics:
+            self._metrics.register_gauge(f"{self.name}.timer_lag", self._get_timer_lag_metrics)
 
         self._extract_key: Optional[Callable[[Event], str]] = self._create_key_extractor(key_field, drop_key_field)
+        if drop_key_field and isinstance(key_field, str) and not key_field.startswith("$"):
+            # The key field is popped from event bodies
+            self._read_only = False
 
     def _init(self):
         super()._init()
@@ -1062,9 +1614,14 @@ class _Batching(Flow):
         self._batch_events: Dict[Optional[str], List[Any]] = defaultdict(list)
         self._batch_first_event_time: Dict[Optional[str], datetime.datetime] = {}
         self._batch_last_event_time: Dict[Optional[str], datetime.datetime] = {}
-        self._batch_start_time: Dict[Optional[str], float] = {}
+        # Batches are flushed when their timers, which start at their first event, fire
+        self._timers = _Timers()
         self._timeout_task: Optional[Task] = None
 
+    def _get_timer_lag_metrics(self):
+        timers = getattr(self, "_timers", None)
+        return timers.get_lag_metrics() if timers is not None else None
+
     @staticmethod
     def _create_key_extractor(key_field, drop_key_field) -> Callable:
         if key_field is None:
@@ -1103,8 +1660,9 @@ class _Batching(Flow):
 
         if len(self._batch[key]) == 0:
             self._batch_first_event_time[key] = event_time
-            self._batch_start_time[key] = time.monotonic()
             self._batch_last_event_time[key] = event_time
+            if self._flush_after_seconds is not None:
+                self._timers.schedule(key, time.monotonic() + self._flush_after_seconds)
         elif self._batch_last_event_time[key] < event_time:
             self._batch_last_event_time[key] = event_time
 
@@ -1122,12 +1680,7 @@ class _Batching(Flow):
 
     async def _sleep_and_emit(self):
         try:
-            while self._batch:
-                key = next(iter(self._batch.keys()))
-                delta_seconds = time.monotonic() - self._batch_start_time[key]
-                if delta_seconds < self._flush_after_seconds:
-                    await asyncio.sleep(self._flush_after_seconds - delta_seconds)
-                await self._emit_batch(key)
+            await self._timers.run(self._emit_batch)
         except Exception:
             message = traceback.format_exc()
             if self.logger:
@@ -1144,7 +1697,7 @@ class _Batching(Flow):
             return
         batch_time = self._batch_first_event_time.pop(batch_key)
         last_event_time = self._batch_last_event_time.pop(batch_key)
-        del self._batch_start_time[batch_key]
+        self._timers.cancel(batch_key)
         await self._emit(batch_to_emit, batch_key, batch_time, self._batch_events[batch_key], last_event_time)
         del self._batch_events[batch_key]
 
@@ -1160,7 +1713,8 @@ class Batch(_Batching):
 
     :param max_events: Maximum number of events per emitted batch. Set to None to emit all events in one batch on flow
         termination.
-    :param flush_after_seconds: Maximum number of seconds to wait before a batch is emitted.
+    :param flush_after_seconds: Maximum number of seconds to wait before a batch is emitted. When the step is given a
+        metrics collector, how late batches were flushed is reported as the "<step name>.timer_lag" gauge.
     :param key: The key by which events are grouped. By default (None), events are not grouped.
         Other options may be:
         Set to '$x' to group events by the x attribute of the event. E.g. "$key" or "$path".
@@ -1280,6 +1834,7 @@ class JoinWithTable(_ConcurrentJobExecution):
             if not self.context:
                 raise TypeError("Table can not be string if no context was provided to the step")
             self._table = self.context.get_table(table)
+        self._register_queue_metrics(f"{self.name}.table", lambda: self._table._q)
 
         if key_extractor:
             if callable(key_extractor):
@@ -1308,11 +1863,40 @@ class JoinWithTable(_ConcurrentJobExecution):
     def _init(self):
         super()._init()
         self._closeables = [self._table]
+        self._pending_lookups = {}
+        self._lookup_task = None
 
     async def _process_event(self, event):
         key = self._key_extractor(self._get_event_or_body(event))
         safe_key = stringify_key(key)
-        return await self._table._get_or_load_static_attributes_by_key(safe_key, self._attributes)
+        # Keys of events that are processed concurrently are looked up together, in a single call to the table
+        lookup = self._pending_lookups.get(safe_key)
+        if lookup is None:
+            lookup = asyncio.get_running_loop().create_future()
+            self._pending_lookups[safe_key] = lookup
+            if self._lookup_task is None:
+                self._lookup_task = asyncio.get_running_loop().create_task(self._lookup_pending())
+        return await asyncio.shield(lookup)
+
+    async def _lookup_pending(self):
+        lookups = self._pending_lookups
+        self._pending_lookups = {}
+        self._lookup_task = None
+        try:
+            results = await self._table._get_or_load_static_attributes_by_keys(list(lookups), self._attributes)
+        except BaseException as ex:
+            # Events that wait for the lookup are resolved however it fails, including when it is cancelled, so that
+            # they do not wait forever
+            for lookup in lookups.values():
+                if isinstance(ex, asyncio.CancelledError):
+                    lookup.cancel()
+                else:
+                    lookup.set_exception(ex)
+            if not isinstance(ex, Exception):
+                raise
+        else:
+            for lookup, result in zip(lookups.values(), results):
+                lookup.set_result(result)
 
     async def _handle_completed(self, event, response):
         if self._inner_join and not response:
@@ -1364,6 +1948,8 @@ class Context:
     :param initial_secrets: Initial dict of secrets.
     :param initial_parameters: Initial dict of parameters.
     :param initial_tables: Initial dict of tables.
+    :param metrics: Collector of the metrics of steps that are given this context. Optional. By default, metrics are
+        not collected.
     """
 
     def __init__(
@@ -1371,10 +1957,12 @@ class Context:
         initial_secrets: Optional[Dict[str, str]] = None,
         initial_parameters: Optional[Dict[str, object]] = None,
         initial_tables: Optional[Dict[str, Table]] = None,
+        metrics: Optional[MetricsCollector] = None,
     ):
         self._secrets = initial_secrets or {}
         self._parameters = initial_parameters or {}
         self._tables = initial_tables or {}
+        self.metrics = metrics
 
     def get_param(self, key, default):
         return self._parameters.get(key, default)
@@ -0,0 +1,129 @@
+# Copyright 2020 Iguazio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import bisect
+import threading
+from typing import Any, Callable, Dict, Optional, Sequence
+
+_default_latency_buckets = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+
+
+class _StepMetrics:
+    def __init__(self, buckets):
+        self._buckets = buckets
+        self.events = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        # The last bucket counts latencies greater than the largest bound
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.first_event_time = None
+        self.last_event_time = None
+
+    def observe(self, start, end):
+        latency = end - start
+        if self.first_event_time is None:
+            self.first_event_time = start
+        self.last_event_time = end
+        self.events += 1
+        self.total_latency += latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+        self.bucket_counts[bisect.bisect_left(self._buckets, latency)] += 1
+
+    def snapshot(self):
+        histogram = {str(bound): count for bound, count in zip(self._buckets, self.bucket_counts)}
+        histogram["+Inf"] = self.bucket_counts[-1]
+        events_per_second = None
+        if self.events and self.last_event_time > self.first_event_time:
+            events_per_second = self.events / (self.last_event_time - self.first_event_time)
+        return {
+            "events": self.events,
+            "errors": self.errors,
+            "total_latency": self.total_latency,
+            "mean_latency": self.total_latency / self.events if self.events else None,
+            "max_latency": self.max_latency,
+            "latency_histogram": histogram,
+            "events_per_second": events_per_second,
+        }
+
+
+class MetricsCollector:
+    """Collects per-step metrics of the flows it is attached to, and the occupancy of their internal queues. To attach
+    a collector, pass it to the Context of the flow's steps (e.g. Context(metrics=MetricsCollector())). Steps that are
+    not given a collector do not collect metrics, and incur no overhead.
+
+    For each step, the number of events it processed, the number of errors it raised, and the latency of its
+    processing of each event are collected. Since steps pass events on to their outlets as part of processing them,
+    the latency of a step includes the latency of the downstream steps it awaits. Steps are measured one by one, so
+    chains of steps are not fused, and micro-batches are processed event by event, while metrics are collected.
+
+    Steps are identified by name, so steps that share a name also share their metrics.
+
+    :param latency_buckets: Upper bounds, in seconds, of the buckets of the latency histogram. Optional. Defaults to
+        bounds from 10 microseconds to 10 seconds.
+    """
+
+    def __init__(self, latency_buckets: Optional[Sequence[float]] = None):
+        self._buckets = tuple(sorted(latency_buckets or _default_latency_buckets))
+        self._steps: Dict[str, _StepMetrics] = {}
+        self._queues: Dict[str, Callable[[], Any]] = {}
+        self._gauges: Dict[str, Callable[[], Any]] = {}
+        self._lock = threading.Lock()
+
+    def _get_step_metrics(self, name):
+        with self._lock:
+            step_metrics = self._steps.get(name)
+            if step_metrics is None:
+                step_metrics = _StepMetrics(self._buckets)
+                self._steps[name] = step_metrics
+            return step_metrics
+
+    def register_queue(self, name: str, get_queue: Callable[[], Any]):
+        """Registers a queue whose occupancy is to be reported.
+
+        :param name: Name under which the queue is reported.
+        :param get_queue: Function that returns the queue, or None if it does not currently exist. The queue must have
+            a qsize() method.
+        """
+        with self._lock:
+            self._queues[name] = get_queue
+
+    def register_gauge(self, name: str, get_value: Callable[[], Any]):
+        """Registers a value to be reported as is, such as a limit that a step adjusts as it runs.
+
+        :param name: Name under which the value is reported.
+        :param get_value: Function that returns the current value.
+        """
+        with self._lock:
+            self._gauges[name] = get_value
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Returns the metrics collected so far, as a dictionary with a "steps" entry that maps step names to their
+        metrics, a "queues" entry that maps queue names to their current size and capacity, and a "gauges" entry that
+        maps gauge names to their current values."""
+        with self._lock:
+            steps = list(self._steps.items())
+            queues = list(self._queues.items())
+            gauges = list(self._gauges.items())
+        result = {"steps": {}, "queues": {}, "gauges": {}}
+        for name, step_metrics in steps:
+            result["steps"][name] = step_metrics.snapshot()
+        for name, get_queue in queues:
+            q = get_queue()
+            size = q.qsize() if q is not None else 0
+            result["queues"][name] = {"size": size, "max_size": getattr(q, "maxsize", None)}
+        for name, get_value in gauges:
+            result["gauges"][name] = get_value()
+        return result
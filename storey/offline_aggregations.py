@@ -0,0 +1,275 @@
+# Copyright 2020 Iguazio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from datetime import datetime
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+from pandas.api.indexers import BaseIndexer
+
+from .aggregation_utils import (
+    get_all_raw_aggregates_with_hidden,
+    get_implied_aggregates,
+    is_raw_aggregate,
+)
+from .aggregations import AggregateByKey
+from .drivers import NoopDriver
+from .dtypes import FieldAggregator, FixedWindows
+from .flow import Reduce, build_flow
+from .sketches import is_approximate_aggregate
+from .sources import DataframeSource
+from .table import Table
+
+
+class _WindowIndexer(BaseIndexer):
+    """Rolling window indexer with precalculated bounds for each row."""
+
+    def __init__(self, starts, ends):
+        super().__init__()
+        self._starts = starts
+        self._ends = ends
+
+    def get_window_bounds(self, num_values=0, min_periods=None, center=None, closed=None, step=None):
+        return self._starts, self._ends
+
+
+def _avg(count, sum):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(count == 0, np.nan, sum / count)
+
+
+def _stdvar(count, sum, sqr):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(count <= 1, np.nan, (count * sqr - sum * sum) / (count * (count - 1)))
+
+
+def _stddev(count, sum, sqr):
+    with np.errstate(invalid="ignore"):
+        return np.sqrt(_stdvar(count, sum, sqr))
+
+
+_virtual_aggregation_funcs = {"avg": _avg, "stdvar": _stdvar, "stddev": _stddev}
+
+
+def _get_timestamps_millis(times, time_format):
+    if pd.api.types.is_numeric_dtype(times):
+        return times.to_numpy(dtype=np.float64)
+    if not pd.api.types.is_datetime64_any_dtype(times):
+        times = pd.to_datetime(times, format=time_format)
+    if times.dt.tz is None:
+        # Like AggregateByKey, timestamps without a timezone are taken to be in the local timezone
+        times = times.dt.tz_localize(datetime.now().astimezone().tzinfo)
+    nanos = times.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    return nanos / 1_000_000
+
+
+def _get_window_starts(codes, times, lower_bounds):
+    # The window of each row starts at the first row of its key whose time is at least the row's lower bound. Sorting
+    # the lower bounds together with the rows, with each lower bound placed before rows of the same time, gives the
+    # number of rows that precede it, which is the index of that first row.
+    num_rows = len(codes)
+    all_codes = np.concatenate([codes, codes])
+    all_times = np.concatenate([lower_bounds, times])
+    is_row = np.concatenate([np.zeros(num_rows, dtype=np.int8), np.ones(num_rows, dtype=np.int8)])
+    order = np.lexsort((is_row, all_times, all_codes))
+    rows_before = np.cumsum(is_row[order]) - is_row[order]
+    starts = np.empty(num_rows, dtype=np.int64)
+    is_lower_bound = order < num_rows
+    starts[order[is_lower_bound]] = rows_before[is_lower_bound]
+    return starts
+
+
+def _get_window_bounds(codes, valid, starts):
+    # Like AggregateByKey, a row that is not aggregated gets the features of the last aggregated row of its key, or
+    # those of an empty window if there is none
+    indices = np.arange(len(codes))
+    new_key = np.ones(len(codes), dtype=bool)
+    new_key[1:] = codes[1:] != codes[:-1]
+    key_starts = np.maximum.accumulate(np.where(new_key, indices, 0))
+    prev_valid = np.maximum.accumulate(np.where(valid, indices, -1))
+    has_prev_valid = prev_valid >= key_starts
+    ends = np.where(has_prev_valid, prev_valid + 1, key_starts)
+    starts = np.where(valid, starts, np.where(has_prev_valid, starts[np.maximum(prev_valid, 0)], key_starts))
+    return starts, ends
+
+
+def _get_values(aggregate, df, records):
+    if isinstance(aggregate.field, str):
+        values = pd.to_numeric(df[aggregate.field]).to_numpy(dtype=np.float64)
+    else:
+        values = np.array([aggregate.value_extractor(record) for record in records], dtype=np.float64)
+    if aggregate.aggr_filter:
+        should_aggregate = np.array([bool(aggregate.aggr_filter(record)) for record in records], dtype=bool)
+        values = np.where(should_aggregate, values, np.nan)
+    return values
+
+
+def _aggregate_window(values, valid, starts, ends, raw_aggregates):
+    indexer = _WindowIndexer(starts, ends)
+    series = pd.Series(values)
+    result = {}
+    for aggregation_name in raw_aggregates:
+        if aggregation_name == "count":
+            result[aggregation_name] = (
+                pd.Series(valid, dtype=np.float64).rolling(indexer, min_periods=0).sum().to_numpy()
+            )
+        elif aggregation_name == "sum":
+            result[aggregation_name] = series.rolling(indexer, min_periods=1).sum().to_numpy()
+        elif aggregation_name == "sqr":
+            result[aggregation_name] = (series * series).rolling(indexer, min_periods=1).sum().to_numpy()
+        elif aggregation_name == "min":
+            result[aggregation_name] = series.rolling(indexer, min_periods=1).min().to_numpy()
+        elif aggregation_name == "max":
+            result[aggregation_name] = series.rolling(indexer, min_periods=1).max().to_numpy()
+    return result
+
+
+def _get_flow_aggregations(aggregate):
+    # AggregateByKey calculates the features of fixed windows, and first and last, differently depending on whether it
+    # updates its pre-aggregates or recalculates them from its buckets, which rolling operations cannot reproduce
+    if isinstance(aggregate.windows, FixedWindows):
+        return list(aggregate.aggregations)
+    return [aggregation_name for aggregation_name in aggregate.aggregations if aggregation_name in ("first", "last")]
+
+
+def _append_body(bodies, body):
+    bodies.append(body)
+    return bodies
+
+
+def _aggregate_by_flow(rows, aggregates, key_columns, time_field, time_format):
+    key_field = key_columns if len(key_columns) > 1 else key_columns[0]
+    controller = build_flow(
+        [
+            DataframeSource(rows, key_field=key_field),
+            AggregateByKey(
+                aggregates, Table("aggregate_dataframe", NoopDriver()), time_field=time_field, time_format=time_format
+            ),
+            Reduce([], _append_body),
+        ]
+    ).run()
+    return controller.await_termination()
+
+
+def aggregate_dataframe(
+    df,
+    aggregates: Union[List[FieldAggregator], List[Dict[str, object]]],
+    key_field: Union[str, List[str]],
+    time_field: str,
+    aliases: Optional[Dict[str, str]] = None,
+    time_format: Optional[str] = None,
+) -> pd.DataFrame:
+    """Calculates the features that AggregateByKey with EmitEveryEvent would emit for each row of a DataFrame. The rows
+    of each key are aggregated in time order, and rows of the same key and time in the order of the DataFrame, so the
+    features are those that AggregateByKey emits when the rows of each key arrive in time order, and the table holds no
+    prior data. A row that is not aggregated, because its value is missing or it does not pass the aggregation filter,
+    gets the features of the last aggregated row of its key.
+
+    Features of sliding windows are calculated by vectorized rolling operations over all rows rather than by running
+    each row through the flow as an event. Features of fixed windows, and first and last, depend on how AggregateByKey
+    maintains its buckets, so they are calculated by running the rows through AggregateByKey, and are no faster.
+
+    :param df: pandas DataFrame or pyarrow Table to aggregate.
+    :param aggregates: List of aggregates, as FieldAggregator objects or dictionaries, as for AggregateByKey. Fields
+        that are not column names, and aggregation filters, are evaluated for each row. Approximate aggregates and
+        max_value are not supported.
+    :param key_field: Column, or list of columns, by which to group the rows.
+    :param time_field: Column holding the time of each row, as datetimes, strings, or milliseconds since the epoch.
+    :param aliases: Dictionary specifying aliases for aggregate columns, of the format `{'col_name': 'new_col_name'}`.
+        (Optional)
+    :param time_format: If the time column holds strings, the format to parse them with. (Optional)
+
+    :returns: DataFrame with the aggregate columns followed by the columns of df, in the order and with the index of
+        df.
+    """
+    if not isinstance(df, pd.DataFrame):
+        df = df.to_pandas()
+    aggregates = AggregateByKey._parse_aggregates(aggregates)
+    names = [aggregate.name for aggregate in aggregates]
+    if len(set(names)) != len(names):
+        raise TypeError(f"Aggregates should have unique names, got {names}")
+    for aggregate in aggregates:
+        for aggregation_name in aggregate.aggregations:
+            if is_approximate_aggregate(aggregation_name):
+                raise ValueError(f"Approximate aggregate {aggregation_name} is not supported by aggregate_dataframe")
+        if aggregate.max_value is not None:
+            raise ValueError(f"max_value of aggregate {aggregate.name} is not supported by aggregate_dataframe")
+    aliases = aliases or {}
+    key_columns = key_field if isinstance(key_field, list) else [key_field]
+
+    key_codes = df.groupby(key_columns, sort=False, dropna=False).ngroup().to_numpy()
+    timestamps = _get_timestamps_millis(df[time_field], time_format)
+    order = np.lexsort((np.arange(len(df)), timestamps, key_codes))
+    codes = key_codes[order]
+    times = timestamps[order]
+    records = (
+        df.to_dict("records")
+        if any(not isinstance(aggregate.field, str) or aggregate.aggr_filter for aggregate in aggregates)
+        else None
+    )
+
+    flow_aggregates = []
+    for aggregate in aggregates:
+        flow_aggregations = _get_flow_aggregations(aggregate)
+        if flow_aggregations:
+            flow_aggregates.append(
+                FieldAggregator(
+                    aggregate.name, aggregate.field, flow_aggregations, aggregate.windows, aggregate.aggr_filter
+                )
+            )
+    # The rows are run through the flow in the order in which they are aggregated
+    flow_bodies = (
+        _aggregate_by_flow(df.iloc[order], flow_aggregates, key_columns, time_field, time_format)
+        if flow_aggregates
+        else None
+    )
+
+    features = {}
+    for aggregate in aggregates:
+        flow_aggregations = _get_flow_aggregations(aggregate)
+        vectorized_aggregations = [name for name in aggregate.aggregations if name not in flow_aggregations]
+        values_by_window = {}
+        if vectorized_aggregations:
+            values = _get_values(aggregate, df, records)[order]
+            valid = ~np.isnan(values)
+            raw_aggregates = get_all_raw_aggregates_with_hidden(vectorized_aggregations)
+            windows = aggregate.windows
+            for window_millis, window_str in windows.windows:
+                lower_bounds = (np.floor(times / windows.period_millis) + 1) * windows.period_millis - window_millis
+                starts, ends = _get_window_bounds(codes, valid, _get_window_starts(codes, times, lower_bounds))
+                values_by_window[window_str] = _aggregate_window(values, valid, starts, ends, raw_aggregates)
+
+        # Features are ordered like those of AggregateByKey, with the raw aggregates first
+        aggregation_names = [name for name in aggregate.aggregations if is_raw_aggregate(name)]
+        aggregation_names += [name for name in aggregate.aggregations if not is_raw_aggregate(name)]
+        for aggregation_name in aggregation_names:
+            for _, window_str in aggregate.windows.windows:
+                feature_name = f"{aggregate.name}_{aggregation_name}_{window_str}"
+                if aggregation_name in flow_aggregations:
+                    feature = np.array([body[feature_name] for body in flow_bodies], dtype=np.float64)
+                elif is_raw_aggregate(aggregation_name):
+                    feature = values_by_window[window_str][aggregation_name]
+                else:
+                    values_by_aggregate = values_by_window[window_str]
+                    args = [values_by_aggregate[name] for name in get_implied_aggregates(aggregation_name)]
+                    feature = _virtual_aggregation_funcs[aggregation_name](*args)
+                unsorted_feature = np.empty(len(feature), dtype=feature.dtype)
+                unsorted_feature[order] = feature
+                features[aliases.get(feature_name, feature_name)] = unsorted_feature
+
+    features = pd.DataFrame(
+        {name: feature for name, feature in features.items() if name not in df.columns}, index=df.index
+    )
+    return pd.concat([features, df], axis=1)
@@ -14,6 +14,7 @@
 #
 import asyncio
 import collections
+import threading
 
 
 class AsyncQueue(asyncio.Queue):
@@ -23,7 +24,7 @@ class AsyncQueue(asyncio.Queue):
 
     async def peek(self):
         while self.empty():
-            getter = self._loop.create_future()
+            getter = asyncio.get_running_loop().create_future()
             self._getters.append(getter)
             try:
                 await getter
@@ -59,6 +60,11 @@ def _release_waiter(waiter):
         waiter.set_result(False)
 
 
+def _wake_up_waiter(waiter):
+    if not waiter.done():
+        waiter.set_result(True)
+
+
 class SimpleAsyncQueue:
     """
     A simple async queue with built-in timeout.
@@ -94,5 +100,82 @@ class SimpleAsyncQueue:
 
         return self._deque.append(item)
 
+    def get_nowait(self):
+        if not self._deque:
+            raise asyncio.QueueEmpty
+        return self._deque.popleft()
+
+    def empty(self):
+        return len(self._deque) == 0
+
+
+class ThreadSafeAsyncQueue:
+    """
+    A bounded queue for handing items over from synchronous threads to an asyncio loop. put() blocks while the queue is
+    full, and only wakes up the loop when it is waiting for the queue to become non-empty, so that the loop drains all
+    items that were put in the meantime with a single wakeup. No executor thread is occupied by waiting for items.
+    """
+
+    def __init__(self, capacity):
+        self._capacity = capacity
+        self._deque = collections.deque()
+        self._not_full = threading.Condition()
+        self._loop = None
+        self._not_empty_future = None
+
+    def put(self, item):
+        with self._not_full:
+            while len(self._deque) >= self._capacity:
+                self._not_full.wait()
+            self._deque.append(item)
+            not_empty_future = self._not_empty_future
+            self._not_empty_future = None
+        if not_empty_future is not None:
+            self._loop.call_soon_threadsafe(_wake_up_waiter, not_empty_future)
+
+    async def get(self, timeout=None):
+        with self._not_full:
+            if self._deque:
+                not_empty_future = None
+            else:
+                self._loop = asyncio.get_running_loop()
+                not_empty_future = self._loop.create_future()
+                self._not_empty_future = not_empty_future
+        if not_empty_future is None:
+            # Yield to the loop even when an item is available, so that other tasks are not starved
+            await asyncio.sleep(0)
+        elif timeout is None:
+            await not_empty_future
+        else:
+            timeout_handle = self._loop.call_later(timeout, _release_waiter, not_empty_future)
+            got_result = await not_empty_future
+            timeout_handle.cancel()
+            if not got_result:
+                with self._not_full:
+                    if self._not_empty_future is not_empty_future:
+                        self._not_empty_future = None
+                    # An item may have been put after the timeout expired
+                    if not self._deque:
+                        raise TimeoutError(f"Queue get() timed out after {timeout} seconds")
+        return self.get_nowait()
+
+    def get_nowait(self):
+        with self._not_full:
+            if not self._deque:
+                raise asyncio.QueueEmpty
+            return self._get()
+
+    def _get(self):
+        item = self._deque.popleft()
+        self._not_full.notify()
+        return item
+
     def empty(self):
         return len(self._deque) == 0
+
+    def qsize(self):
+        return len(self._deque)
+
+    @property
+    def maxsize(self):
+        return self._capacity
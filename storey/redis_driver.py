@@ -13,6 +13,7 @@
 # limitations under the License.
 #
 import asyncio
+import base64
 import json
 import math
 import os
@@ -27,7 +28,7 @@ import redis.cluster
 
 from .drivers import Driver
 from .dtypes import RedisError
-from .utils import schema_file_name
+from .utils import schema_file_name, sketches_aggregation_name
 
 
 class NeedsRedisAccess:
@@ -54,6 +55,7 @@ class RedisDriver(NeedsRedisAccess, Driver):
     DEFAULT_KEY_PREFIX = "storey:"
     AGGREGATION_ATTRIBUTE_PREFIX = INTERFNAL_FIELD_PREFIX + "aggr_"
     AGGREGATION_TIME_ATTRIBUTE_PREFIX = INTERFNAL_FIELD_PREFIX + "mtaggr_"
+    SKETCH_ATTRIBUTE_PREFIX = INTERFNAL_FIELD_PREFIX + "sketch_"
     OBJECT_MTIME_ATTRIBUTE_PREFIX = INTERFNAL_FIELD_PREFIX + "_mtime_"
 
     def __init__(
@@ -352,11 +354,26 @@ class RedisDriver(NeedsRedisAccess, Driver):
                                     f'arr[{lua_index_to_update}]=string.format("%.17f",{new_value_expression});\n'
                                     'redis.call("HSET", redis_hash, aggr_key, table.concat(arr, ","))\n'
                                 )
+
+                        # Sketches cannot be merged by Redis, so the sketches of a bucket are written as a whole. They
+                        # carry the start time of their bucket, so that those of older buckets are ignored on load.
+                        serialized_sketches = bucket.get_serialized_sketches(bucket_start_time)
+                        if serialized_sketches and cached_time <= expected_time:
+                            sketch_attribute_name = (
+                                f"{RedisDriver.SKETCH_ATTRIBUTE_PREFIX}{name}_{lua_index_to_update - 1}_{feature_attr}"
+                            )
+                            encoded_sketches = base64.b64encode(serialized_sketches).decode("ascii")
+                            lua_script = (
+                                f'{lua_script}redis.call("HSET",redis_hash,"{sketch_attribute_name}",'
+                                f'"{encoded_sketches}");\n'
+                            )
                         lua_script = f'{lua_script}\
                             redis.call("HSET",redis_hash,"{aggr_mtime_attr_name}",{expected_time});'
         return lua_script, condition_expression, pending_updates, redis_keys_involved
 
-    async def _save_key(self, container, table_path, key, aggr_item, partitioned_by_key, additional_data):
+    def _build_save_key_script(
+        self, container, table_path, key, aggr_item, partitioned_by_key, additional_data, current_time
+    ):
         redis_key_prefix = self._make_key(container, table_path, key)
         static_redis_key_prefix = self._static_data_key(redis_key_prefix)
         (
@@ -368,8 +385,7 @@ class RedisDriver(NeedsRedisAccess, Driver):
             redis_key_prefix, aggr_item, partitioned_by_key, additional_data
         )
         if not update_expression:
-            return
-        current_time = int(time.time_ns() / 1000)
+            return None, None
         if mtime_condition is not None:
             update_expression = (
                 f'if redis.call("HGET", "{static_redis_key_prefix}","{self._mtime_name}") == "{mtime_condition}" then\n'
@@ -384,16 +400,56 @@ class RedisDriver(NeedsRedisAccess, Driver):
             )
 
         redis_keys_involved.append(static_redis_key_prefix)
+        return update_expression, redis_keys_involved
+
+    async def _save_key(self, container, table_path, key, aggr_item, partitioned_by_key, additional_data):
+        current_time = int(time.time_ns() / 1000)
+        update_expression, redis_keys_involved = self._build_save_key_script(
+            container, table_path, key, aggr_item, partitioned_by_key, additional_data, current_time
+        )
+        if not update_expression:
+            return
         update_ok = await self.asyncify(self.redis.eval)(
             update_expression, len(redis_keys_involved), *redis_keys_involved
         )
+        await self._handle_save_key_result(
+            container, table_path, key, aggr_item, additional_data, update_ok, current_time
+        )
 
+    async def _save_keys(self, container, table_path, items, partitioned_by_key):
+        """
+        Save several keys, like _save_key does, but with a single pipelined round trip in the common case. Keys whose
+        conditional update fails are then updated one by one.
+        """
+        current_time = int(time.time_ns() / 1000)
+        scripts = [
+            self._build_save_key_script(
+                container, table_path, key, aggr_item, partitioned_by_key, additional_data, current_time
+            )
+            for key, aggr_item, additional_data in items
+        ]
+        pipeline = self.redis.pipeline(transaction=False)
+        for update_expression, redis_keys_involved in scripts:
+            if update_expression:
+                pipeline.eval(update_expression, len(redis_keys_involved), *redis_keys_involved)
+        results = iter(await RedisDriver.asyncify(pipeline.execute)())
+        for (key, aggr_item, additional_data), (update_expression, _) in zip(items, scripts):
+            if update_expression:
+                await self._handle_save_key_result(
+                    container, table_path, key, aggr_item, additional_data, next(results), current_time
+                )
+
+    async def _handle_save_key_result(
+        self, container, table_path, key, aggr_item, additional_data, update_ok, current_time
+    ):
         if update_ok:
             if aggr_item:
                 aggr_item.storage_specific_cache[self._mtime_name] = current_time
         # In case Mtime condition evaluated to False, we run the conditioned
         # expression, then fetch and cache the latest key's state
         else:
+            redis_key_prefix = self._make_key(container, table_path, key)
+            static_redis_key_prefix = self._static_data_key(redis_key_prefix)
             (
                 update_expression,
                 _,
@@ -451,6 +507,42 @@ class RedisDriver(NeedsRedisAccess, Driver):
             values = await self._get_specific_fields(static_key, attributes)
         return values
 
+    async def _load_by_keys(self, container, table_path, keys, attributes):
+        """
+        Return all static attributes, or certain attributes, of each of the given keys, like _load_by_key does, but
+        in a single pipelined round trip.
+        """
+        static_keys = [self._static_data_key(self._make_key(container, table_path, key)) for key in keys]
+        if attributes != "*":
+            attributes = [name for name in attributes if not name.startswith(RedisDriver.INTERFNAL_FIELD_PREFIX)]
+        pipeline = self.redis.pipeline(transaction=False)
+        for static_key in static_keys:
+            if attributes == "*":
+                pipeline.hgetall(static_key)
+            else:
+                pipeline.hmget(static_key, attributes)
+        try:
+            responses = await RedisDriver.asyncify(pipeline.execute)()
+        except redis.ResponseError as e:
+            raise RedisError(f"Failed to get keys {static_keys}. Response error was: {e}") from e
+        results = []
+        for response in responses:
+            if attributes == "*":
+                fields = [
+                    (name, value)
+                    for name, value in response.items()
+                    if not RedisDriver.convert_to_str(name).startswith(RedisDriver.INTERFNAL_FIELD_PREFIX)
+                ]
+            else:
+                fields = [(name, value) for name, value in zip(attributes, response) if value is not None]
+            results.append(
+                {
+                    RedisDriver.convert_to_str(name): RedisDriver.convert_redis_value_to_python_obj(value)
+                    for name, value in fields
+                }
+            )
+        return results
+
     async def _get_associated_time_attr(self, redis_key_prefix, aggr_name):
         aggr_without_relevant_attr = aggr_name[:-2]
         feature_name_only = aggr_without_relevant_attr[: aggr_without_relevant_attr.rindex("_")]
@@ -517,6 +609,14 @@ class RedisDriver(NeedsRedisAccess, Driver):
             ]
             aggregations[feature_and_aggr_name][associated_time_attr] = time_in_millis
 
+        sketch_values = await self.redis_hscan(redis_key, f"{self.SKETCH_ATTRIBUTE_PREFIX}*")
+        for sketch_key, value in sketch_values.items():
+            # The key ends with the index of the bucket and the relevant attribute (a or b)
+            sketch_key = RedisDriver.convert_to_str(sketch_key)[len(self.SKETCH_ATTRIBUTE_PREFIX) :]
+            feature_name = sketch_key.rsplit("_", 2)[0]
+            sketches_name = f"{feature_name}_{sketches_aggregation_name}"
+            aggregations.setdefault(sketches_name, []).append(base64.b64decode(value))
+
         # Story expects to get None back if there were no aggregations, and the
         # same for additional data.
         aggregations_to_return = aggregations if aggregations else None
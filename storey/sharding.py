@@ -0,0 +1,304 @@
+# Copyright 2020 Iguazio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import asyncio
+import copy
+import multiprocessing
+import pickle
+import queue
+import zlib
+from typing import Callable, List, Optional, Union
+
+from .dtypes import FlowError
+from .flow import Flow, _termination_obj, build_flow
+from .sources import SyncEmitSource
+from .utils import stringify_key
+
+
+def _run_shard(flow_factory, shard, batches, results):
+    """Entry point of a shard's worker process. Runs the flow returned by flow_factory, and emits the batches received
+    into it until a None is received. Reports the termination result (or error) of the flow back to the parent."""
+    controller = None
+    error = None
+    try:
+        steps = flow_factory(shard)
+        if not isinstance(steps, list):
+            steps = [steps]
+        controller = build_flow([SyncEmitSource(), *steps]).run()
+    except BaseException as ex:
+        error = ex
+    # Keep consuming batches after an error, so that the parent process is not blocked on a full queue.
+    for batch in iter(batches.get, None):
+        if error is None:
+            try:
+                controller.emit_many(batch)
+            except BaseException as ex:
+                error = ex
+    result = None
+    if controller:
+        try:
+            if error is None:
+                controller.terminate()
+            result = controller.await_termination()
+        except BaseException as ex:
+            error = error or ex
+    if error is not None:
+        result = None
+        # The step that raised the error only exists in this process
+        error.__dict__.pop("_raised_by_storey_step", None)
+        try:
+            pickle.dumps(error)
+        except Exception:
+            error = FlowError(f"Shard {shard} failed: {error!r}")
+    results.put((shard, result, error))
+
+
+class ShardedExecution(Flow):
+    """Runs a copy of a flow in each of several worker processes, and routes every event to one of them according to
+    its key. All events with the same key are processed by the same process, so that state kept per key (e.g. by
+    AggregateByKey, MapWithState with group_by_key=True, or a Table) stays local to that process. This is a terminal
+    step. On termination, the termination results of the worker flows are merged using termination_result_fn.
+
+    :param flow_factory: Function that receives the shard index, and returns the step, or list of steps, to be run in
+        that shard's worker process (as passed to build_flow, without a source). Must be picklable when a start method
+        other than "fork" is used.
+    :param num_shards: Number of worker processes. Defaults to the number of CPUs.
+    :param key_field: Field, or list of fields, of the event body to shard by. Optional. If not set, events are sharded
+        by their key. Events without a key are spread across all shards.
+    :param max_events: Maximum number of events to send to a worker process at once (default 100).
+    :param flush_after_seconds: Maximum number of seconds to hold events before sending them to a worker process
+        (default 0.1).
+    :param max_pending_batches: Maximum number of batches waiting to be consumed by each worker process before this
+        step blocks (default 8). If a worker process dies, a FlowError naming its shard is raised rather than blocking.
+    :param start_method: multiprocessing start method to use (e.g. "spawn"). Defaults to the platform's default.
+
+    for additional params, see documentation of  :class:`storey.flow.Flow`
+    """
+
+    _read_only = True
+    # Seconds to wait on a worker process's queue between checks that the process is still alive
+    _liveness_check_interval_seconds = 1
+
+    def __init__(
+        self,
+        flow_factory: Callable[[int], Union[Flow, List[Flow]]],
+        num_shards: Optional[int] = None,
+        key_field: Optional[Union[str, List[str]]] = None,
+        max_events: Optional[int] = None,
+        flush_after_seconds: Optional[float] = None,
+        max_pending_batches: Optional[int] = None,
+        start_method: Optional[str] = None,
+        **kwargs,
+    ):
+        if num_shards is not None:
+            kwargs["num_shards"] = num_shards
+        if key_field is not None:
+            kwargs["key_field"] = key_field
+        if max_events is not None:
+            kwargs["max_events"] = max_events
+        if flush_after_seconds is not None:
+            kwargs["flush_after_seconds"] = flush_after_seconds
+        if max_pending_batches is not None:
+            kwargs["max_pending_batches"] = max_pending_batches
+        if start_method is not None:
+            kwargs["start_method"] = start_method
+        super().__init__(**kwargs)
+
+        if num_shards is not None and num_shards < 1:
+            raise ValueError(f"num_shards may not be less than 1 (got {num_shards})")
+        if max_events is not None and max_events < 1:
+            raise ValueError(f"max_events may not be less than 1 (got {max_events})")
+
+        self._flow_factory = flow_factory
+        self._num_shards = num_shards or multiprocessing.cpu_count()
+        self._key_field = key_field
+        self._max_events = max_events or 100
+        self._flush_after_seconds = 0.1 if flush_after_seconds is None else flush_after_seconds
+        self._max_pending_batches = max_pending_batches or 8
+        self._mp_context = multiprocessing.get_context(start_method)
+        self._processes = []
+
+    def to(self, outlet):
+        """Pipe this step to next one. Throws exception since illegal"""
+        raise ValueError("ShardedExecution is a terminal step. It cannot be piped further.")
+
+    def _init(self):
+        super()._init()
+        self._batches = [[] for _ in range(self._num_shards)]
+        self._next_keyless_shard = 0
+        self._flush_task = None
+        self._stop_flush_event = None
+        self._send_lock = None
+
+    def run(self):
+        closeables = super().run()
+        self._batch_queues = []
+        self._results_queue = self._mp_context.Queue()
+        self._processes = []
+        for shard in range(self._num_shards):
+            batch_queue = self._mp_context.Queue(self._max_pending_batches)
+            process = self._mp_context.Process(
+                target=_run_shard,
+                args=(self._flow_factory, shard, batch_queue, self._results_queue),
+                name=f"{self.name}-{shard}",
+                daemon=True,
+            )
+            process.start()
+            self._batch_queues.append(batch_queue)
+            self._processes.append(process)
+        closeables.append(self)
+        return closeables
+
+    def close(self):
+        for process in self._processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self._processes = []
+
+    def _get_shard(self, event):
+        if self._key_field is None:
+            key = event.key
+        elif isinstance(self._key_field, list):
+            key = [event.body[field] for field in self._key_field]
+        else:
+            key = event.body[self._key_field]
+        if key is None:
+            shard = self._next_keyless_shard
+            self._next_keyless_shard = (shard + 1) % self._num_shards
+            return shard
+        # Python's built-in hash() of strings differs between processes, so a stable hash is used instead.
+        return zlib.crc32(stringify_key(key).encode()) % self._num_shards
+
+    async def _send(self, shard):
+        # The batch is taken under the lock, so that once termination holds the lock, no batch has been taken without
+        # being sent
+        async with self._get_send_lock():
+            await self._send_locked(shard)
+
+    async def _send_locked(self, shard):
+        batch = self._batches[shard]
+        if batch:
+            self._batches[shard] = []
+            await self._put(shard, batch)
+
+    def _get_send_lock(self):
+        # The lock keeps batches of the same shard in order when one of them has to wait for room in the queue.
+        if self._send_lock is None:
+            self._send_lock = asyncio.Lock()
+        return self._send_lock
+
+    def _check_shard_alive(self, shard):
+        process = self._processes[shard]
+        if not process.is_alive():
+            raise FlowError(f"Worker process of shard {shard} exited unexpectedly with exit code {process.exitcode}")
+
+    async def _put(self, shard, item):
+        batch_queue = self._batch_queues[shard]
+        try:
+            batch_queue.put_nowait(item)
+            return
+        except queue.Full:
+            pass
+        loop = asyncio.get_running_loop()
+        while True:
+            # A worker process that died will never make room in its queue
+            self._check_shard_alive(shard)
+            try:
+                await loop.run_in_executor(None, batch_queue.put, item, True, self._liveness_check_interval_seconds)
+                return
+            except queue.Full:
+                pass
+
+    async def _get_results(self):
+        loop = asyncio.get_running_loop()
+        results = {}
+        dead_shards = set()
+        while len(results) < self._num_shards:
+            try:
+                shard, result, error = await loop.run_in_executor(
+                    None, self._results_queue.get, True, self._liveness_check_interval_seconds
+                )
+                results[shard] = result, error
+                continue
+            except queue.Empty:
+                pass
+            # A process that exited after reporting its result may not have had it read yet, so a shard is only taken
+            # to be dead if it was already dead at the previous check
+            for shard, process in enumerate(self._processes):
+                if shard not in results and not process.is_alive():
+                    if shard in dead_shards:
+                        self._check_shard_alive(shard)
+                    dead_shards.add(shard)
+        return [results[shard] for shard in range(self._num_shards)]
+
+    async def _flush_after_delay(self):
+        # Termination signals the flush task to stop waiting, and sends the pending batches itself
+        stopped = self._get_stop_flush_event()
+        try:
+            await asyncio.wait_for(stopped.wait(), self._flush_after_seconds)
+            return
+        except asyncio.TimeoutError:
+            pass
+        self._flush_task = None
+        for shard in range(self._num_shards):
+            await self._send(shard)
+
+    def _get_stop_flush_event(self):
+        if self._stop_flush_event is None:
+            self._stop_flush_event = asyncio.Event()
+        return self._stop_flush_event
+
+    async def _terminate(self):
+        # The flush task is only referenced while it waits, so it is stopped before it takes any batch
+        if self._flush_task:
+            self._get_stop_flush_event().set()
+            await self._flush_task
+            self._flush_task = None
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._get_send_lock():
+                # A flush that is already sending finishes its current batch before the lock is taken, and finds no
+                # batches left after it
+                for shard in range(self._num_shards):
+                    await self._send_locked(shard)
+                for shard in range(self._num_shards):
+                    await self._put(shard, None)
+            results_and_errors = await self._get_results()
+        finally:
+            await loop.run_in_executor(None, self.close)
+        for _, error in results_and_errors:
+            if error is not None:
+                raise error
+        results = [result for result, _ in results_and_errors]
+        termination_result = results[0]
+        for result in results[1:]:
+            termination_result = self._termination_result_fn(termination_result, result)
+        return termination_result
+
+    async def _do(self, event):
+        if event is _termination_obj:
+            return await self._terminate()
+        shard = self._get_shard(event)
+        to_send = copy.copy(event)
+        to_send._awaitable_result = None
+        to_send._original_events = None
+        to_send._shared_body = None
+        batch = self._batches[shard]
+        batch.append(to_send)
+        if len(batch) >= self._max_events:
+            await self._send(shard)
+        elif self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_after_delay())
@@ -0,0 +1,306 @@
+# Copyright 2020 Iguazio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import asyncio
+import multiprocessing
+import os
+import pickle
+import struct
+from multiprocessing import shared_memory
+from typing import List, Optional
+
+import pyarrow
+
+from .dtypes import Event, FlowError
+
+_header = struct.Struct("<q")
+# Process ids of the producer and the consumer, which precede the slots, so that each can tell whether the other died
+_pids = struct.Struct("<qq")
+_producer = 0
+_consumer = 1
+_end_of_stream = -1
+_key_column = "__storey_key__"
+_id_column = "__storey_id__"
+_processing_time_column = "__storey_processing_time__"
+# Marks which events of a batch have a body field, for fields that some of the events lack
+_has_field_column_prefix = "__storey_has__"
+_pickled_metadata = b"storey.pickled"
+# Column, attribute and default value of the other event attributes that are passed along
+_optional_attributes = [
+    ("__storey_headers__", "headers", None),
+    ("__storey_method__", "method", None),
+    ("__storey_path__", "path", "/"),
+    ("__storey_content_type__", "content_type", None),
+    ("__storey_origin_state__", "origin_state", None),
+    ("__storey_error__", "error", None),
+    ("__storey_metadata__", "__dict__", {}),
+]
+
+
+class SharedMemoryRingBuffer:
+    """A ring buffer of fixed-size slots in shared memory, used to pass batches of events from one process to another
+    (see SharedMemoryTarget and SharedMemorySource). Each slot holds one batch of events, serialized as an Arrow
+    record batch, so that the consumer reads the batch directly from shared memory rather than from a pipe. Body fields
+    whose values Arrow cannot hold in one column, such as values of mixed types or dictionaries, are pickled.
+
+    The ring buffer should be created by the parent process, and passed to the producer and consumer processes as an
+    argument when they are started. It supports a single producer and a single consumer. The creating process should
+    call unlink() once the buffer is no longer needed. If the producer or the consumer exits while the other waits for
+    it, the one that waits raises a FlowError rather than blocking.
+
+    :param num_slots: Number of batches that may be pending at the same time. Defaults to 8.
+    :param slot_size: Size of each slot, in bytes. Batches that do not fit in a slot are split. Defaults to 4MiB.
+    :param mp_context: multiprocessing context to create the ring buffer's semaphores with. Optional.
+    """
+
+    def __init__(self, num_slots: Optional[int] = None, slot_size: Optional[int] = None, mp_context=None):
+        self._num_slots = num_slots or 8
+        self._slot_size = slot_size or 4 * 1024 * 1024
+        if self._num_slots < 1:
+            raise ValueError(f"num_slots may not be less than 1 (got {num_slots})")
+        if self._slot_size <= _header.size:
+            raise ValueError(f"slot_size must be greater than {_header.size} (got {slot_size})")
+        mp_context = mp_context or multiprocessing
+        self._shm = shared_memory.SharedMemory(create=True, size=_pids.size + self._num_slots * self._slot_size)
+        self._free_slots = mp_context.Semaphore(self._num_slots)
+        self._filled_slots = mp_context.Semaphore(0)
+        self._init_indices()
+
+    def _init_indices(self):
+        # There is only one producer and one consumer, so each keeps its own position in the ring
+        self._write_index = 0
+        self._read_index = 0
+        self._pid_registered = False
+
+    def __getstate__(self):
+        return {
+            "name": self._shm.name,
+            "num_slots": self._num_slots,
+            "slot_size": self._slot_size,
+            "free_slots": self._free_slots,
+            "filled_slots": self._filled_slots,
+        }
+
+    def __setstate__(self, state):
+        self._num_slots = state["num_slots"]
+        self._slot_size = state["slot_size"]
+        self._free_slots = state["free_slots"]
+        self._filled_slots = state["filled_slots"]
+        self._shm = shared_memory.SharedMemory(name=state["name"])
+        self._init_indices()
+
+    # How often to check whether the other process is still alive, while waiting for it
+    _liveness_check_interval_secs = 1
+
+    def _register_pid(self, role):
+        if not self._pid_registered:
+            struct.pack_into("<q", self._shm.buf, role * 8, os.getpid())
+            self._pid_registered = True
+
+    def _is_peer_alive(self, role):
+        peer = _consumer if role == _producer else _producer
+        pid = _pids.unpack_from(self._shm.buf, 0)[peer]
+        # A peer that has not started using the ring buffer yet cannot be told apart from a slow one
+        if pid == 0:
+            return True
+        # Reaps child processes that have exited, which would otherwise still appear to exist
+        multiprocessing.active_children()
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    async def _acquire(self, semaphore, role):
+        self._register_pid(role)
+        if semaphore.acquire(False):
+            return
+        loop = asyncio.get_running_loop()
+        while not await loop.run_in_executor(None, semaphore.acquire, True, self._liveness_check_interval_secs):
+            # The peer may have released the semaphore just before it exited
+            if not self._is_peer_alive(role) and not semaphore.acquire(False):
+                peer_name = "consumer" if role == _producer else "producer"
+                raise FlowError(f"The {peer_name} process of the shared memory ring buffer exited unexpectedly")
+
+    def _slot(self, index):
+        offset = _pids.size + index * self._slot_size
+        return self._shm.buf[offset : offset + self._slot_size]
+
+    async def write(self, events: List[Event]):
+        """Writes a batch of events to the ring buffer, waiting for a free slot if there is none. Event bodies must be
+        dictionaries."""
+        if not events:
+            return
+        await self._acquire(self._free_slots, _producer)
+        try:
+            fits = self._write_slot(events)
+        except BaseException:
+            self._free_slots.release()
+            raise
+        if fits:
+            self._commit_write()
+        else:
+            self._free_slots.release()
+            if len(events) == 1:
+                raise ValueError(
+                    f"Event {events[0].id} does not fit in a shared memory slot of {self._slot_size} bytes. "
+                    f"Use a larger slot_size."
+                )
+            middle = len(events) // 2
+            await self.write(events[:middle])
+            await self.write(events[middle:])
+
+    async def write_end_of_stream(self):
+        """Marks the end of the stream of batches. Once the consumer reaches this mark, it terminates."""
+        await self._acquire(self._free_slots, _producer)
+        slot = self._slot(self._write_index)
+        _header.pack_into(slot, 0, _end_of_stream)
+        slot.release()
+        self._commit_write()
+
+    def _commit_write(self):
+        self._write_index = (self._write_index + 1) % self._num_slots
+        self._filled_slots.release()
+
+    def _write_slot(self, events):
+        record_batch = _events_to_record_batch(events)
+        slot = self._slot(self._write_index)
+        try:
+            sink = pyarrow.FixedSizeBufferWriter(pyarrow.py_buffer(slot[_header.size :]))
+            try:
+                with pyarrow.ipc.new_stream(sink, record_batch.schema) as writer:
+                    writer.write_batch(record_batch)
+            except OSError:
+                # The batch is larger than the slot
+                return False
+            _header.pack_into(slot, 0, sink.tell())
+            return True
+        finally:
+            slot.release()
+
+    async def read(self) -> Optional[List[Event]]:
+        """Reads the next batch of events from the ring buffer, waiting for one if there is none. Returns None once the
+        end of the stream is reached."""
+        await self._acquire(self._filled_slots, _consumer)
+        try:
+            events = self._read_slot()
+        finally:
+            self._read_index = (self._read_index + 1) % self._num_slots
+            self._free_slots.release()
+        return events
+
+    def _read_slot(self):
+        slot = self._slot(self._read_index)
+        try:
+            (size,) = _header.unpack_from(slot, 0)
+            if size == _end_of_stream:
+                return None
+            reader = pyarrow.ipc.open_stream(pyarrow.py_buffer(slot[_header.size : _header.size + size]))
+            # The batch is read directly from shared memory. Converting it to Python objects copies it out, so the
+            # slot can be reused right away.
+            return _record_batch_to_events(reader.read_next_batch())
+        finally:
+            slot.release()
+
+    def close(self):
+        """Detaches this process from the ring buffer's shared memory."""
+        self._shm.close()
+
+    def unlink(self):
+        """Releases the ring buffer's shared memory. To be called once, by the process that created it."""
+        self._shm.close()
+        self._shm.unlink()
+
+
+def _contains_struct(arrow_type):
+    if pyarrow.types.is_struct(arrow_type):
+        return True
+    value_type = getattr(arrow_type, "value_type", None)
+    return value_type is not None and _contains_struct(value_type)
+
+
+def _to_array(values):
+    # Values that Arrow cannot hold in a single column, such as a mix of ints and strings, are pickled. So are
+    # dictionaries, which Arrow would turn into structs that have the keys of all the dictionaries of the column.
+    try:
+        array = pyarrow.array(values)
+        if not _contains_struct(array.type):
+            return array, False
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, pyarrow.ArrowNotImplementedError):
+        pass
+    return pyarrow.array([pickle.dumps(value) for value in values], pyarrow.binary()), True
+
+
+def _events_to_record_batch(events):
+    names = {}
+    for event in events:
+        if not isinstance(event.body, dict):
+            raise TypeError(f"Only dictionary event bodies can be written to shared memory, not {type(event.body)}")
+        for name in event.body:
+            names.setdefault(name, None)
+    fields = []
+    arrays = []
+
+    def add_column(name, values):
+        array, pickled = _to_array(values)
+        fields.append(pyarrow.field(name, array.type, metadata={_pickled_metadata: b"1"} if pickled else None))
+        arrays.append(array)
+
+    for name in names:
+        add_column(name, [event.body.get(name) for event in events])
+        has_field = [name in event.body for event in events]
+        if not all(has_field):
+            add_column(_has_field_column_prefix + name, has_field)
+    add_column(_key_column, [event.key for event in events])
+    add_column(_id_column, [event.id for event in events])
+    add_column(_processing_time_column, [event.processing_time for event in events])
+    # Other attributes are only written when an event in the batch has a value for them
+    for column, attribute, default in _optional_attributes:
+        values = [getattr(event, attribute, default) for event in events]
+        if any(value != default for value in values):
+            add_column(column, values)
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=pyarrow.schema(fields))
+
+
+def _record_batch_to_events(record_batch):
+    columns = record_batch.to_pydict()
+    for field in record_batch.schema:
+        if field.metadata and field.metadata.get(_pickled_metadata):
+            columns[field.name] = [pickle.loads(value) for value in columns[field.name]]
+    num_events = record_batch.num_rows
+    keys = columns.pop(_key_column)
+    ids = columns.pop(_id_column)
+    processing_times = columns.pop(_processing_time_column)
+    attributes = [
+        (attribute, columns.pop(column, None) or [default] * num_events)
+        for column, attribute, default in _optional_attributes
+    ]
+    has_field = {
+        name[len(_has_field_column_prefix) :]: columns.pop(name)
+        for name in list(columns)
+        if name.startswith(_has_field_column_prefix)
+    }
+    events = []
+    for i in range(num_events):
+        body = {name: values[i] for name, values in columns.items() if name not in has_field or has_field[name][i]}
+        event = Event(body, key=keys[i], id=ids[i], processing_time=processing_times[i])
+        for attribute, values in attributes:
+            if attribute == "__dict__":
+                event.__dict__.update(values[i])
+            else:
+                setattr(event, attribute, values[i])
+        events.append(event)
+    return events
@@ -0,0 +1,322 @@
+# Copyright 2020 Iguazio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import base64
+import json
+import math
+import re
+
+import numpy
+import xxhash
+
+# approx_distinct, approx_p<percentile> (e.g. approx_p95), and approx_top<k> (e.g. approx_top3)
+_approximate_aggregate_pattern = re.compile(r"^approx_(?:(distinct)|p([0-9]{1,3})|top([0-9]+))$")
+
+
+def _parse_approximate_aggregate(aggregate):
+    match = _approximate_aggregate_pattern.match(aggregate)
+    if not match:
+        return None
+    distinct, percentile, k = match.groups()
+    if distinct:
+        return "distinct", None
+    if percentile is not None:
+        percentile = int(percentile)
+        return ("quantile", percentile / 100) if percentile <= 100 else None
+    k = int(k)
+    return ("top", k) if k > 0 else None
+
+
+def is_approximate_aggregate(aggregate):
+    return _parse_approximate_aggregate(aggregate) is not None
+
+
+class _HyperLogLog:
+    """Estimates the number of distinct values, with a standard error of about 1.04/sqrt(2^precision)."""
+
+    def __init__(self, precision=10):
+        self._precision = precision
+        self._registers = numpy.zeros(1 << precision, dtype=numpy.uint8)
+
+    def add(self, value):
+        value_hash = xxhash.xxh64_intdigest(str(value).encode())
+        index = value_hash >> (64 - self._precision)
+        remaining_bits = 64 - self._precision
+        # The position of the leftmost 1 in the bits that remain after the register index
+        rank = remaining_bits - (value_hash & ((1 << remaining_bits) - 1)).bit_length() + 1
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def merge(self, other):
+        numpy.maximum(self._registers, other._registers, out=self._registers)
+
+    def copy(self):
+        result = _HyperLogLog.__new__(_HyperLogLog)
+        result._precision = self._precision
+        result._registers = self._registers.copy()
+        return result
+
+    def get_state(self):
+        return {"precision": self._precision, "registers": base64.b64encode(self._registers.tobytes()).decode("ascii")}
+
+    @staticmethod
+    def from_state(state):
+        result = _HyperLogLog.__new__(_HyperLogLog)
+        result._precision = state["precision"]
+        result._registers = numpy.frombuffer(base64.b64decode(state["registers"]), dtype=numpy.uint8).copy()
+        return result
+
+    def estimate(self):
+        num_registers = len(self._registers)
+        alpha = 0.7213 / (1 + 1.079 / num_registers)
+        estimate = alpha * num_registers * num_registers / numpy.sum(numpy.ldexp(1.0, -self._registers.astype(int)))
+        zeros = int(numpy.count_nonzero(self._registers == 0))
+        # Small cardinalities are estimated more accurately by the number of empty registers
+        if estimate <= 2.5 * num_registers and zeros:
+            estimate = num_registers * math.log(num_registers / zeros)
+        return int(round(estimate))
+
+
+class _TDigest:
+    """Estimates quantiles with a merging t-digest, which keeps at most about compression centroids, and is most
+    accurate near the extreme quantiles."""
+
+    def __init__(self, compression=100):
+        self._compression = compression
+        self._centroids = []
+        self._buffer = []
+        self._count = 0
+        self._min = math.inf
+        self._max = -math.inf
+
+    def add(self, value):
+        if math.isnan(value):
+            return
+        self._buffer.append((value, 1))
+        self._count += 1
+        self._min = min(self._min, value)
+        self._max = max(self._max, value)
+        if len(self._buffer) >= 5 * self._compression:
+            self._compress()
+
+    def merge(self, other):
+        self._buffer.extend(other._centroids)
+        self._buffer.extend(other._buffer)
+        self._count += other._count
+        self._min = min(self._min, other._min)
+        self._max = max(self._max, other._max)
+        if len(self._buffer) >= 5 * self._compression:
+            self._compress()
+
+    def copy(self):
+        result = _TDigest.__new__(_TDigest)
+        result.__dict__.update(self.__dict__)
+        result._centroids = self._centroids.copy()
+        result._buffer = self._buffer.copy()
+        return result
+
+    def get_state(self):
+        self._compress()
+        return {
+            "compression": self._compression,
+            "centroids": self._centroids,
+            "count": self._count,
+            "min": self._min,
+            "max": self._max,
+        }
+
+    @staticmethod
+    def from_state(state):
+        result = _TDigest(state["compression"])
+        result._centroids = [(mean, weight) for mean, weight in state["centroids"]]
+        result._count = state["count"]
+        result._min = state["min"]
+        result._max = state["max"]
+        return result
+
+    def _max_quantile(self, quantile):
+        # The k1 scale function limits each centroid to one unit of k(q) = compression / (2 * pi) * asin(2q - 1)
+        k = self._compression / (2 * math.pi) * math.asin(2 * quantile - 1) + 1
+        if k >= self._compression / 4:
+            return 1
+        return (math.sin(k * 2 * math.pi / self._compression) + 1) / 2
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = sorted(self._centroids + self._buffer)
+        self._buffer = []
+        centroids = []
+        mean, weight = points[0]
+        weight_before = 0
+        max_quantile = self._max_quantile(0)
+        for point_mean, point_weight in points[1:]:
+            if (weight_before + weight + point_weight) / self._count <= max_quantile:
+                weight += point_weight
+                mean += (point_mean - mean) * point_weight / weight
+            else:
+                centroids.append((mean, weight))
+                weight_before += weight
+                max_quantile = self._max_quantile(weight_before / self._count)
+                mean, weight = point_mean, point_weight
+        centroids.append((mean, weight))
+        self._centroids = centroids
+
+    def quantile(self, quantile):
+        if self._count == 0:
+            return math.nan
+        self._compress()
+        if quantile <= 0:
+            return self._min
+        if quantile >= 1:
+            return self._max
+        # Values are interpolated between the centers of adjacent centroids
+        target = quantile * self._count
+        previous_mean, previous_center = self._min, 0
+        weight_before = 0
+        for mean, weight in self._centroids:
+            center = weight_before + weight / 2
+            if target < center:
+                return previous_mean + (mean - previous_mean) * (target - previous_center) / (center - previous_center)
+            previous_mean, previous_center = mean, center
+            weight_before += weight
+        if self._count == previous_center:
+            return self._max
+        return previous_mean + (self._max - previous_mean) * (target - previous_center) / (
+            self._count - previous_center
+        )
+
+
+class _SpaceSaving:
+    """Finds the most frequent values with the space-saving algorithm, which counts at most capacity values."""
+
+    def __init__(self, capacity):
+        self._capacity = capacity
+        self._counts = {}
+
+    def add(self, value, count=1):
+        if value in self._counts:
+            self._counts[value] += count
+        elif len(self._counts) < self._capacity:
+            self._counts[value] = count
+        else:
+            # The least frequent value is replaced, and the new value inherits its count as an upper bound
+            least_frequent = min(self._counts, key=self._counts.get)
+            self._counts[value] = self._counts.pop(least_frequent) + count
+
+    def merge(self, other):
+        for value, count in other._counts.items():
+            self._counts[value] = self._counts.get(value, 0) + count
+        if len(self._counts) > self._capacity:
+            most_frequent = sorted(self._counts.items(), key=lambda item: item[1], reverse=True)[: self._capacity]
+            self._counts = dict(most_frequent)
+
+    def copy(self):
+        result = _SpaceSaving(self._capacity)
+        result._counts = self._counts.copy()
+        return result
+
+    def get_state(self):
+        return {"capacity": self._capacity, "counts": list(self._counts.items())}
+
+    @staticmethod
+    def from_state(state):
+        result = _SpaceSaving(state["capacity"])
+        result._counts = {value: count for value, count in state["counts"]}
+        return result
+
+    def top(self, k):
+        return [value for value, _ in sorted(self._counts.items(), key=lambda item: item[1], reverse=True)[:k]]
+
+
+_sketch_classes = {"distinct": _HyperLogLog, "quantile": _TDigest, "top": _SpaceSaving}
+
+
+def get_sketch_kinds(aggregates):
+    """Returns the kinds of sketches that the given approximate aggregates are calculated from."""
+    return {
+        _parse_approximate_aggregate(aggregate)[0] for aggregate in aggregates if is_approximate_aggregate(aggregate)
+    }
+
+
+class ApproximateAggregates:
+    """The approximate aggregates of a feature, each of which is calculated from a fixed-size sketch. Sketches of
+    different buckets can be merged, so that the aggregates of a window are calculated from those of its buckets.
+
+    :param aggregates: Names of the approximate aggregates.
+    """
+
+    def __init__(self, aggregates):
+        self.aggregates = aggregates
+        self._parsed_aggregates = {aggregate: _parse_approximate_aggregate(aggregate) for aggregate in aggregates}
+        kinds = {kind for kind, _ in self._parsed_aggregates.values()}
+        self._distinct = "distinct" in kinds
+        self._quantiles = "quantile" in kinds
+        max_k = max([k for kind, k in self._parsed_aggregates.values() if kind == "top"], default=0)
+        # The top k values are estimated more accurately when more values are counted
+        self._top_capacity = max(10 * max_k, 100) if max_k else 0
+
+    def new_sketches(self):
+        sketches = {}
+        if self._distinct:
+            sketches["distinct"] = _HyperLogLog()
+        if self._quantiles:
+            sketches["quantile"] = _TDigest()
+        if self._top_capacity:
+            sketches["top"] = _SpaceSaving(self._top_capacity)
+        return sketches
+
+    @staticmethod
+    def add(sketches, value):
+        for kind, sketch in sketches.items():
+            if kind != "quantile" or isinstance(value, (int, float)):
+                sketch.add(value)
+
+    @staticmethod
+    def merge(sketches, other):
+        if sketches is None:
+            return {kind: sketch.copy() for kind, sketch in other.items()}
+        for kind, sketch in sketches.items():
+            sketch.merge(other[kind])
+        return sketches
+
+    @staticmethod
+    def serialize(bucket_start_time, sketches):
+        """Serializes the sketches of a bucket, together with the start time of the bucket, to bytes."""
+        state = {kind: sketch.get_state() for kind, sketch in sketches.items()}
+        state["time"] = bucket_start_time
+        # Values that JSON does not support, such as datetimes, are counted by approx_top<k> as strings
+        return json.dumps(state, default=str).encode()
+
+    def deserialize(self, data):
+        """Returns the start time of the bucket and the sketches that were serialized to the given bytes. Sketches
+        that these aggregates need, but were not serialized, are empty."""
+        state = json.loads(data)
+        sketches = self.new_sketches()
+        for kind in sketches:
+            if kind in state:
+                sketches[kind] = _sketch_classes[kind].from_state(state[kind])
+        return state["time"], sketches
+
+    def get_features(self, sketches):
+        features = {}
+        for aggregate, (kind, argument) in self._parsed_aggregates.items():
+            sketch = sketches[kind] if sketches else None
+            if kind == "distinct":
+                features[aggregate] = sketch.estimate() if sketch else 0
+            elif kind == "quantile":
+                features[aggregate] = sketch.quantile(argument) if sketch else math.nan
+            else:
+                features[aggregate] = sketch.top(argument) if sketch else []
+        return features
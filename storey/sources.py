@@ -22,7 +22,7 @@ import traceback
 import uuid
 import warnings
 import weakref
-from collections import defaultdict
+from collections import defaultdict, deque
 from datetime import datetime, timezone
 from typing import Callable, Coroutine, Iterable, List, Optional, Union
 
@@ -35,7 +35,8 @@ from nuclio_sdk import QualifiedOffset
 
 from .dtypes import Event, _termination_obj
 from .flow import Complete, Flow
-from .queue import SimpleAsyncQueue
+from .queue import SimpleAsyncQueue, ThreadSafeAsyncQueue
+from .shared_memory import SharedMemoryRingBuffer
 from .utils import find_filters, find_partitions, url_to_file_system
 
 
@@ -53,6 +54,7 @@ class AwaitableResult:
         self._on_error = on_error
         self._expected_number_of_results = expected_number_of_results
         self._number_of_results = 0
+        self._error = None
         self._q = queue.Queue(expected_number_of_results)
 
     def await_result(self):
@@ -77,6 +79,8 @@ class AwaitableResult:
             self._q.put(element)
 
     def _set_error(self, ex):
+        if self._number_of_results < self._expected_number_of_results:
+            self._error = ex
         self._set_result(ex)
 
 
@@ -94,6 +98,14 @@ def _convert_to_datetime(obj, time_format: Optional[str] = None):
         raise ValueError(f"Could not parse '{obj}' (of type {type(obj)}) as a time.")
 
 
+def _validate_micro_batch_size(micro_batch_size):
+    if micro_batch_size is None:
+        return 1
+    if micro_batch_size < 1:
+        raise ValueError(f"micro_batch_size may not be less than 1 (got {micro_batch_size})")
+    return micro_batch_size
+
+
 class WithUUID:
     def __init__(self):
         self._current_uuid_base = None
@@ -158,6 +170,25 @@ class FlowControllerBase(WithUUID):
         else:
             return Event(body, id=self._get_uuid(), key=key)
 
+    def _build_event_chunks(self, elements, chunk_size, awaitable_result_class):
+        """Builds an event from each element, and yields the events in lists of at most chunk_size events. Each such
+        chunk is handed over to the flow as a single item."""
+        if chunk_size is None:
+            chunk_size = 1000
+        elif chunk_size < 1:
+            raise ValueError(f"chunk_size may not be less than 1 (got {chunk_size})")
+        chunk = []
+        for element in elements:
+            event = self._build_event(element, None)
+            event._awaitable_result = awaitable_result_class() if awaitable_result_class else None
+            event._original_events = [event]
+            chunk.append(event)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
 
 class FlowController(FlowControllerBase):
     """Used to emit events into the associated flow, terminate the flow, and await the flow's termination.
@@ -211,6 +242,24 @@ class FlowController(FlowControllerBase):
         self._emit_fn(event)
         return awaitable_result
 
+    def emit_many(self, elements: Iterable[object], chunk_size: Optional[int] = None):
+        """Emits multiple events into the associated flow. The events are handed over to the flow in chunks, rather
+        than one by one, which is much cheaper for bulk ingestion.
+
+        :param elements: The event data, or payloads. To set metadata as well, pass Event objects. Keys are extracted
+            using the source's key_field, if set.
+        :param chunk_size: Maximum number of events to hand over to the flow together. Defaults to 1000.
+
+        :returns: A list of AwaitableResult, one per event, if a Complete appears in the flow. None otherwise.
+        """
+        awaitable_results = [] if self._return_awaitable_result else None
+        awaitable_result_class = AwaitableResult if self._return_awaitable_result else None
+        for chunk in self._build_event_chunks(elements, chunk_size, awaitable_result_class):
+            if awaitable_results is not None:
+                awaitable_results.extend(event._awaitable_result for event in chunk)
+            self._emit_fn(chunk)
+        return awaitable_results
+
     def terminate(self):
         """Terminates the associated flow."""
         self._emit_fn(_termination_obj)
@@ -257,6 +306,8 @@ class SyncEmitSource(Flow):
     :param max_time_before_commit: Maximum number of seconds before committing offsets. Defaults to 45.
     :param max_wait_before_commit: Maximum number of seconds to wait for an event before committing offsets.
     :param explicit_ack: Whether to explicitly commit offsets. Defaults to False.
+    :param micro_batch_size: Maximum number of already buffered events to propagate through the flow together, as a
+      single batch. Steps that support it process the whole batch in one call. Defaults to 1 (no batching).
     :param name: Name of this step, as it should appear in logs. Defaults to class name (SyncEmitSource).
     :type name: string
 
@@ -273,6 +324,7 @@ class SyncEmitSource(Flow):
         max_time_before_commit=None,
         max_wait_before_commit=None,
         explicit_ack=False,
+        micro_batch_size: Optional[int] = None,
         **kwargs,
     ):
         if buffer_size is None:
@@ -281,9 +333,12 @@ class SyncEmitSource(Flow):
             kwargs["buffer_size"] = buffer_size
         if key_field is not None:
             kwargs["key_field"] = key_field
+        if micro_batch_size is not None:
+            kwargs["micro_batch_size"] = micro_batch_size
         super().__init__(**kwargs)
         if buffer_size <= 0:
             raise ValueError("Buffer size must be positive")
+        self._micro_batch_size = _validate_micro_batch_size(micro_batch_size)
         self._buffer_size = buffer_size
         self._key_field = key_field
         self._max_events_before_commit = max_events_before_commit or 20000
@@ -292,10 +347,11 @@ class SyncEmitSource(Flow):
         self._explicit_ack = explicit_ack
         self._ex = None
         self._closeables = []
+        self._register_queue_metrics(self.name, lambda: getattr(self, "_q", None))
 
     def _init(self):
         super()._init()
-        self._q = queue.Queue(self._buffer_size)
+        self._q = ThreadSafeAsyncQueue(self._buffer_size)
         self._termination_q = queue.Queue(1)
         self._is_terminated = False
         self._outstanding_offsets = defaultdict(list)
@@ -309,9 +365,16 @@ class SyncEmitSource(Flow):
         last_commit_time = time.monotonic()
         if self._explicit_ack and hasattr(self.context, "platform") and hasattr(self.context.platform, "explicit_ack"):
             committer = self.context.platform.explicit_ack
+        held_event = None
+        # Events that were emitted together, and were not yet propagated
+        pending = deque()
         while True:
-            event = None
-            if committer:
+            event = held_event
+            # Release references to the previous batch, so that its offsets may be committed
+            events = held_event = None
+            if event is None and pending:
+                event = pending.popleft()
+            if committer and event is None:
                 if (
                     events_handled_since_commit >= self._max_events_before_commit
                     or num_offsets_not_committed > 1
@@ -324,28 +387,34 @@ class SyncEmitSource(Flow):
                 # TODO: Fix after transitioning to AsyncEmitSource, which would solve the underlying problem
                 while num_offsets_not_committed > 1:
                     try:
-                        event = await loop.run_in_executor(None, self._q.get, True, self._max_wait_before_commit)
+                        event = await self._q.get(self._max_wait_before_commit)
                         break
-                    except queue.Empty:
+                    except TimeoutError:
                         pass
                     num_offsets_not_committed = await _commit_handled_events(self._outstanding_offsets, committer)
                     events_handled_since_commit = 0
                     last_commit_time = time.monotonic()
             if event is None:
-                event = await loop.run_in_executor(None, self._q.get)
-            if committer and hasattr(event, "path") and hasattr(event, "shard_id") and hasattr(event, "offset"):
-                qualified_shard = (event.path, event.shard_id)
-                offsets = self._outstanding_offsets[qualified_shard]
-                offsets.append(_EventOffset(event))
-                num_offsets_not_committed += 1
-                events_handled_since_commit += 1
+                event = await self._q.get()
+            if type(event) is list:
+                pending.extend(event)
+                event = pending.popleft()
+            events, held_event = _drain_micro_batch(event, self._q, self._micro_batch_size, pending)
+            if committer:
+                num_tracked = _track_offsets(self._outstanding_offsets, events)
+                num_offsets_not_committed += num_tracked
+                events_handled_since_commit += num_tracked
             try:
-                termination_result = await self._do_downstream(event)
                 if event is _termination_obj:
+                    termination_result = await self._do_downstream(event)
                     # We can commit all at this point because termination of
                     # all downstream steps completed successfully.
                     await _commit_handled_events(self._outstanding_offsets, committer, commit_all=True)
                     self._termination_future.set_result(termination_result)
+                elif len(events) > 1:
+                    await self._do_downstream_batch(events)
+                else:
+                    await self._do_downstream(event)
             except BaseException as ex:
                 if self.logger:
                     message = "An error was raised"
@@ -353,13 +422,12 @@ class SyncEmitSource(Flow):
                     if raised_by:
                         message += f" by step {type(raised_by)}"
                     self.logger.error(f"{message}: {traceback.format_exc()}")
-                if event is not _termination_obj and event._awaitable_result:
-                    event._awaitable_result._set_error(ex)
+                _set_error_on_events(events, ex)
+                _set_error_on_events(pending, ex)
                 self._ex = ex
                 if not self._q.empty():
-                    event = self._q.get()
-                    if event is not _termination_obj and event._awaitable_result:
-                        event._awaitable_result._set_error(ex)
+                    item = self._q.get_nowait()
+                    _set_error_on_events(item if type(item) is list else [item], ex)
                 self._termination_future.set_result(None)
                 break
             if event is _termination_obj:
@@ -395,9 +463,21 @@ class SyncEmitSource(Flow):
         else:
             self._is_terminated = True
         self._q.put(event)
-        if event is not _termination_obj:
+        if event is not _termination_obj and not self._error_reported_through_results(event, self._ex):
             self._raise_on_error(self._ex)
 
+    @staticmethod
+    def _error_reported_through_results(event, ex):
+        # The flow may fail on the emitted events themselves before emit returns, in which case the error is reported
+        # through their awaitable results rather than raised by emit. In a chunk of emit_many, events that precede the
+        # failing one complete normally, while the failing one and all that follow it get its error. Errors of other
+        # events are still raised.
+        if ex is None:
+            return False
+        events = event if type(event) is list else [event]
+        has_error = [bool(event._awaitable_result) and event._awaitable_result._error is ex for event in events]
+        return any(has_error) and all(has_error[has_error.index(True) :])
+
     def run(self):
         """Starts the flow"""
         self._closeables = super().run()
@@ -516,6 +596,32 @@ class AsyncFlowController(FlowControllerBase):
                 raise result
             return result
 
+    async def emit_many(self, elements: Iterable[object], chunk_size: Optional[int] = None) -> Optional[List[object]]:
+        """Emits multiple events into the associated flow. The events are handed over to the flow in chunks, rather
+        than one by one, which is much cheaper for bulk ingestion.
+
+        :param elements: The event data, or payloads. To set metadata as well, pass Event objects. Keys are extracted
+            using the source's key_field, if set.
+        :param chunk_size: Maximum number of events to hand over to the flow together. Defaults to 1000.
+
+        :returns: The results received from the flow, one per event, if a Complete step appears in the flow. None
+            otherwise.
+        """
+        awaitables = [] if self._await_result else None
+        awaitable_result_class = AsyncAwaitableResult if self._await_result else None
+        for chunk in self._build_event_chunks(elements, chunk_size, awaitable_result_class):
+            if awaitables is not None:
+                awaitables.extend(event._awaitable_result for event in chunk)
+            await self._emit_fn(chunk)
+        if awaitables is not None:
+            results = []
+            for awaitable in awaitables:
+                result = await awaitable.await_result()
+                if isinstance(result, BaseException):
+                    raise result
+                results.append(result)
+            return results
+
     async def terminate(self):
         """Terminates the associated flow."""
         await self._emit_fn(_termination_obj)
@@ -553,6 +659,44 @@ async def _commit_handled_events(outstanding_offsets_by_qualified_shard, committ
     return num_offsets_not_handled
 
 
+def _drain_micro_batch(event, q, micro_batch_size, pending):
+    """Returns the list of events to propagate together with event, taking already buffered events from pending and
+    then from q. A termination object that was taken from q is returned separately, to be propagated after the
+    batch."""
+    events = [event]
+    if micro_batch_size > 1 and event is not _termination_obj:
+        while len(events) < micro_batch_size:
+            if not pending:
+                if q.empty():
+                    break
+                item = q.get_nowait()
+                if item is _termination_obj:
+                    return events, item
+                # Items are single events, or lists of events that were emitted together (see emit_many)
+                if type(item) is list:
+                    pending.extend(item)
+                else:
+                    pending.append(item)
+            events.append(pending.popleft())
+    return events, None
+
+
+def _track_offsets(outstanding_offsets, events):
+    num_tracked = 0
+    for event in events:
+        if hasattr(event, "path") and hasattr(event, "shard_id") and hasattr(event, "offset"):
+            qualified_shard = (event.path, event.shard_id)
+            outstanding_offsets[qualified_shard].append(_EventOffset(event))
+            num_tracked += 1
+    return num_tracked
+
+
+def _set_error_on_events(events, ex):
+    for event in events:
+        if event is not _termination_obj and event._awaitable_result:
+            event._awaitable_result._set_error(ex)
+
+
 class AsyncEmitSource(Flow):
     """
     Asynchronous entry point into a flow. Produces an AsyncFlowController when run, for use from inside an async def.
@@ -565,6 +709,8 @@ class AsyncEmitSource(Flow):
     :param max_time_before_commit: Maximum number of seconds before committing offsets. Defaults to 45.
     :param max_wait_before_commit: Maximum number of seconds to wait for an event before committing offsets.
     :param explicit_ack: Whether to explicitly commit offsets. Defaults to False.
+    :param micro_batch_size: Maximum number of already buffered events to propagate through the flow together, as a
+      single batch. Steps that support it process the whole batch in one call. Defaults to 1 (no batching).
     :param name: Name of this step, as it should appear in logs. Defaults to class name (AsyncEmitSource).
     :type name: string
 
@@ -581,9 +727,13 @@ class AsyncEmitSource(Flow):
         max_time_before_commit=None,
         max_wait_before_commit=None,
         explicit_ack=False,
+        micro_batch_size: Optional[int] = None,
         **kwargs,
     ):
+        if micro_batch_size is not None:
+            kwargs["micro_batch_size"] = micro_batch_size
         super().__init__(**kwargs)
+        self._micro_batch_size = _validate_micro_batch_size(micro_batch_size)
         if buffer_size is None:
             self._buffer_size = 8
         elif buffer_size <= 0:
@@ -611,9 +761,16 @@ class AsyncEmitSource(Flow):
         last_commit_time = time.monotonic()
         if self._explicit_ack and hasattr(self.context, "platform") and hasattr(self.context.platform, "explicit_ack"):
             committer = self.context.platform.explicit_ack
+        held_event = None
+        # Events that were emitted together, and were not yet propagated
+        pending = deque()
         while True:
-            event = None
-            if committer:
+            event = held_event
+            # Release references to the previous batch, so that its offsets may be committed
+            events = held_event = None
+            if event is None and pending:
+                event = pending.popleft()
+            if committer and event is None:
                 if (
                     events_handled_since_commit >= self._max_events_before_commit
                     or num_offsets_not_handled > 0
@@ -634,19 +791,25 @@ class AsyncEmitSource(Flow):
                     last_commit_time = time.monotonic()
             if not event:
                 event = await self._q.get()
-            if committer and hasattr(event, "path") and hasattr(event, "shard_id") and hasattr(event, "offset"):
-                qualified_shard = (event.path, event.shard_id)
-                offsets = self._outstanding_offsets[qualified_shard]
-                offsets.append(_EventOffset(event))
-                num_offsets_not_handled += 1
-                events_handled_since_commit += 1
+            if type(event) is list:
+                pending.extend(event)
+                event = pending.popleft()
+            events, held_event = _drain_micro_batch(event, self._q, self._micro_batch_size, pending)
+            if committer:
+                num_tracked = _track_offsets(self._outstanding_offsets, events)
+                num_offsets_not_handled += num_tracked
+                events_handled_since_commit += num_tracked
             try:
-                termination_result = await self._do_downstream(event)
                 if event is _termination_obj:
+                    termination_result = await self._do_downstream(event)
                     # We can commit all at this point because termination of
                     # all downstream steps completed successfully.
                     await _commit_handled_events(self._outstanding_offsets, committer, commit_all=True)
                     return termination_result
+                elif len(events) > 1:
+                    await self._do_downstream_batch(events)
+                else:
+                    await self._do_downstream(event)
             except BaseException as ex:
                 if self.logger:
                     message = "An error was raised"
@@ -655,10 +818,12 @@ class AsyncEmitSource(Flow):
                         message += f" by step {type(raised_by)}"
                     self.logger.error(f"{message}: {traceback.format_exc()}")
                 self._ex = ex
-                if event is not _termination_obj and event._awaitable_result:
-                    awaitable = event._awaitable_result._set_error(ex)
-                    if awaitable:
-                        await awaitable
+                if event is not _termination_obj:
+                    for batch_event in [*events, *pending]:
+                        if batch_event._awaitable_result:
+                            awaitable = batch_event._awaitable_result._set_error(ex)
+                            if awaitable:
+                                await awaitable
                 if not self._q.empty():
                     await self._q.get()
                 self._raise_on_error()
@@ -761,6 +926,8 @@ class DataframeSource(_IterableSource, WithUUID):
     :param dfs: A pandas dataframe, or dataframes, to be used as input source for the flow.
     :param key_field: column to be used as key for events. can be list of columns
     :param id_field: column to be used as ID for events.
+    :param micro_batch_size: Number of rows to propagate through the flow together, as a single batch. Steps that
+        support it process the whole batch in one call. Defaults to 1 (no batching).
 
     for additional params, see documentation of  :class:`~storey.flow.Flow`
     """
@@ -770,14 +937,18 @@ class DataframeSource(_IterableSource, WithUUID):
         dfs: Union[pandas.DataFrame, Iterable[pandas.DataFrame]],
         key_field: Optional[Union[str, List[str]]] = None,
         id_field: Optional[str] = None,
+        micro_batch_size: Optional[int] = None,
         **kwargs,
     ):
         if key_field is not None:
             kwargs["key_field"] = key_field
         if id_field is not None:
             kwargs["id_field"] = id_field
+        if micro_batch_size is not None:
+            kwargs["micro_batch_size"] = micro_batch_size
         _IterableSource.__init__(self, **kwargs)
         WithUUID.__init__(self)
+        self._micro_batch_size = _validate_micro_batch_size(micro_batch_size)
         #  in order to raise exception also for key_field=0
         if key_field is not None:
             key_fields = [key_field] if not isinstance(key_field, list) else key_field
@@ -806,6 +977,7 @@ class DataframeSource(_IterableSource, WithUUID):
         return keys
 
     async def _run_loop(self):
+        batch = []
         for df in self._dfs:
             columns = list(df.columns)
             is_df_index_nonempty = not df.index.empty and not (len(df.index.names) == 1 and df.index.names[0] is None)
@@ -832,7 +1004,14 @@ class DataframeSource(_IterableSource, WithUUID):
                     elif not isinstance(self._key_field, list):
                         keys = keys[0]
                     event = Event(element, keys, id=line_id)
-                    await self._do_downstream(event)
+                    if self._micro_batch_size > 1:
+                        batch.append(event)
+                        if len(batch) == self._micro_batch_size:
+                            await self._do_downstream_batch(batch)
+                            batch = []
+                    else:
+                        await self._do_downstream(event)
+        await self._do_downstream_batch(batch)
         return await self._do_downstream(_termination_obj)
 
     def _validate_fields(self, df, path=""):
@@ -1172,3 +1351,35 @@ class SQLSource(_IterableSource, WithUUID):
                     event = Event(body, key=key, id=event_id)
                     await self._do_downstream(event)
         return await self._do_downstream(_termination_obj)
+
+
+class SharedMemorySource(_IterableSource):
+    """Use a shared memory ring buffer, written to by a SharedMemoryTarget in another process, as input source for a
+    flow. The flow terminates once the writing flow terminates.
+
+    :param ring_buffer: The ring buffer to read from.
+    :param micro_batch_size: Number of events to propagate through the flow together, as a single batch. Steps that
+        support it process the whole batch in one call. Defaults to 1 (no batching).
+
+    for additional params, see documentation of  :class:`~storey.flow.Flow`
+    """
+
+    def __init__(self, ring_buffer: SharedMemoryRingBuffer, micro_batch_size: Optional[int] = None, **kwargs):
+        if micro_batch_size is not None:
+            kwargs["micro_batch_size"] = micro_batch_size
+        _IterableSource.__init__(self, **kwargs)
+        self._ring_buffer = ring_buffer
+        self._micro_batch_size = _validate_micro_batch_size(micro_batch_size)
+
+    async def _run_loop(self):
+        while True:
+            events = await self._ring_buffer.read()
+            if events is None:
+                break
+            if self._micro_batch_size > 1:
+                for i in range(0, len(events), self._micro_batch_size):
+                    await self._do_downstream_batch(events[i : i + self._micro_batch_size])
+            else:
+                for event in events:
+                    await self._do_downstream(event)
+        return await self._do_downstream(_termination_obj)
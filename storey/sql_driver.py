@@ -67,6 +67,30 @@ class SQLDriver(Driver):
         except db.exc.IntegrityError:
             self._update_by_key(key, additional_data, table)
 
+    async def _save_keys(self, container, table_path, items, partitioned_by_key):
+        import sqlalchemy as db
+
+        self._lazy_init()
+        table = self._table(table_path)
+        rows = []
+        for key, _, additional_data in items:
+            key = self._extract_list_of_keys(key)
+            row = dict(additional_data or {})
+            for i in range(len(self._primary_key)):
+                row[self._primary_key[i]] = key[i]
+            rows.append((key, row))
+        key_columns = [getattr(table.c, name) for name in self._primary_key]
+        select_object = db.select(*key_columns).where(self._keys_condition(table, [key for key, _ in rows]))
+        existing_keys = {tuple(str(value) for value in row) for row in self._sql_connection.execute(select_object)}
+        # New keys are inserted together, with a single statement, and existing keys are updated
+        new_rows = [row for key, row in rows if tuple(str(part) for part in key) not in existing_keys]
+        if new_rows:
+            df = pd.DataFrame(new_rows)
+            df.to_sql(table.name, con=self._sql_connection, if_exists="append", index=False)
+        for key, row in rows:
+            if tuple(str(part) for part in key) in existing_keys:
+                self._update_by_key(key, row, table)
+
     async def _load_aggregates_by_key(self, container, table_path, key):
         self._lazy_init()
         table = self._table(table_path)
@@ -85,6 +109,34 @@ class SQLDriver(Driver):
             values = await self._get_specific_fields(key, table, attributes)
         return values
 
+    async def _load_by_keys(self, container, table_path, keys, attributes):
+        import sqlalchemy as db
+
+        self._lazy_init()
+        table = self._table(table_path)
+        key_lists = [self._extract_list_of_keys(key) for key in keys]
+        condition = self._keys_condition(table, key_lists)
+        if attributes == "*":
+            select_object = db.select(table).where(condition)
+        else:
+            # The primary key columns are needed to match the rows to the keys
+            columns = list(dict.fromkeys([*attributes, *self._primary_key]))
+            select_object = db.select(*[getattr(table.c, name) for name in columns]).where(condition)
+        try:
+            rows = pd.read_sql(select_object, con=self._sql_connection, parse_dates=self._time_fields).to_dict(
+                orient="records"
+            )
+        except Exception as e:
+            raise RuntimeError(f"Failed to get keys {keys}") from e
+
+        rows_by_key = {}
+        for row in rows:
+            row_key = tuple(str(row[name]) for name in self._primary_key)
+            if attributes != "*":
+                row = {name: row[name] for name in attributes}
+            rows_by_key[row_key] = row
+        return [rows_by_key.get(tuple(str(part) for part in key)) for key in key_lists]
+
     async def close(self):
         if self._sql_connection:
             self._sql_connection.close()
@@ -122,6 +174,14 @@ class SQLDriver(Driver):
     def supports_aggregations(self):
         return False
 
+    def _keys_condition(self, table, key_lists):
+        import sqlalchemy as db
+
+        key_columns = [getattr(table.c, name) for name in self._primary_key]
+        if len(key_columns) == 1:
+            return key_columns[0].in_([key[0] for key in key_lists])
+        return db.tuple_(*key_columns).in_([tuple(key) for key in key_lists])
+
     def _update_by_key(self, key, data, sql_table):
         import sqlalchemy as db
 
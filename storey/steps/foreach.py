@@ -18,6 +18,11 @@ from storey.flow import _UnaryFunctionFlow
 class ForEach(_UnaryFunctionFlow):
     """Applies given function on each event in the stream, passes original event downstream."""
 
+    _fusible = True
+
     async def _do_internal(self, element, fn_result):
         self._user_fn_output_to_event(element, fn_result)
         await self._do_downstream(element)
+
+    def _do_internal_batch(self, event, fn_result, out):
+        out.append(event)
@@ -15,9 +15,15 @@
 import asyncio
 import copy
 import math
+import time
 from asyncio import Lock
+from collections import OrderedDict, deque
+from contextlib import AsyncExitStack
+from functools import partial
 from typing import List, Optional
 
+import numpy
+
 from . import utils
 from .aggregation_utils import (
     get_all_raw_aggregates,
@@ -33,8 +39,10 @@ from .dtypes import (
     FixedWindowType,
     FlowError,
     SlidingWindows,
+    _sliding_windows,
     _termination_obj,
 )
+from .sketches import ApproximateAggregates, get_sketch_kinds, is_approximate_aggregate
 from .utils import _split_path
 
 
@@ -48,8 +56,35 @@ class Table:
     :param flush_interval_secs: How often the cache will be flushed in seconds. None for flush every event.
         Default is 300 (5 minutes)
     :param max_updates_in_flight: Maximum number of concurrent updates.
+    :param missing_key_ttl_secs: How long to remember that a key does not exist in storage, in seconds, so that lookups
+        of that key do not read it from storage again in the meantime. Optional. By default, keys that were not found
+        are read again on every lookup.
+    :param flush_batch_size: Maximum number of keys to write to storage in a single call when the cache is flushed.
+        Defaults to 1000.
+    :param max_cached_keys: Maximum number of keys to keep in the cache. Optional. When the cache is full, the least
+        recently used keys are evicted, and are loaded from storage again if they are needed later. Keys with changes
+        that were not yet written to storage are written before they are evicted. By default, the cache is unbounded.
+    :param expire_idle_keys: Whether to evict keys from the cache once all of their aggregation windows have passed
+        since their last event, as measured by the latest event time seen by the table. The aggregations of such keys
+        have no data left in any window. Changed keys are written to storage before they are evicted, and evicted keys
+        are loaded from storage again if they receive more events or are queried. Note that when aggregations are
+        emitted for all keys (e.g. with EmitAfterPeriod), evicted keys are not included. Defaults to False.
+    :param aggregation_backend: How to store the aggregation buckets of each key. "python" stores an object per bucket
+        and aggregate, while "numpy" stores each aggregate in a NumPy array, which takes less memory and computes
+        features over many buckets faster. Both produce the same features. Defaults to "python".
+    :param tiered_aggregation_buckets: Whether to roll up the buckets of sliding windows into tiers of coarser periods,
+        so that long windows (e.g. 30d alongside 1h) are kept in far fewer buckets, and their features are updated as
+        events are aggregated rather than recalculated from the buckets. Windows are grouped by their unit of duration,
+        and each group gets the longest period that divides all of its windows and is no longer than the period its unit
+        would get by default. A window of a coarser tier ends at the end of the bucket of its event, as without tiers,
+        but starts at the start of the bucket of its tier, so it may be longer by less than one period of its tier.
+        Windows with a max_value, and aggregates with first, last or approximate aggregates, are calculated without
+        tiers. Data is stored at the period of the windows either way. Defaults to False.
     """
 
+    # Maximum number of keys to check for eviction each time a key is added to the cache
+    _max_eviction_scan = 100
+
     def __init__(
         self,
         table_path: str,
@@ -57,11 +92,24 @@ class Table:
         partitioned_by_key: bool = True,
         flush_interval_secs: Optional[int] = 300,
         max_updates_in_flight: int = 8,
+        missing_key_ttl_secs: Optional[float] = None,
+        flush_batch_size: int = 1000,
+        max_cached_keys: Optional[int] = None,
+        expire_idle_keys: bool = False,
+        aggregation_backend: str = "python",
+        tiered_aggregation_buckets: bool = False,
     ):
         self._container, self._table_path = _split_path(table_path)
         self._storage = storage
         self._partitioned_by_key = partitioned_by_key
-        self._attrs_cache = {}
+        if max_cached_keys is not None and max_cached_keys < 1:
+            raise ValueError(f"max_cached_keys may not be less than 1 (got {max_cached_keys})")
+        if aggregation_backend not in ("python", "numpy"):
+            raise ValueError(f'aggregation_backend must be "python" or "numpy" (got {aggregation_backend})')
+        self._aggregation_backend = aggregation_backend
+        self._tiered_aggregation_buckets = tiered_aggregation_buckets
+        # Ordered from least to most recently used
+        self._attrs_cache = OrderedDict()
         self._aggregates = None
         self._schema = None
         self._schema_lock = None
@@ -77,6 +125,22 @@ class Table:
         self._changed_keys = set()
         self._pending_events = []
         self.fixed_window_type = None
+        self._missing_key_ttl_secs = missing_key_ttl_secs
+        self._flush_batch_size = flush_batch_size
+        self._max_cached_keys = max_cached_keys
+        # Keys that are being written to storage so that they can be evicted from the cache
+        self._keys_flushed_for_eviction = set()
+        self._eviction_flush_tasks = set()
+        self._expire_idle_keys = expire_idle_keys
+        # Time of the last event of each key, roughly ordered from oldest to newest
+        self._last_event_time_by_key = OrderedDict()
+        self._latest_event_time = None
+        # Keys whose aggregation windows have passed, to be evicted once they are written to storage
+        self._idle_keys = set()
+        # Maps keys that were not found in storage to the time until which they are considered missing
+        self._missing_key_expiry = {}
+        # Storage reads of static attributes that are in progress, by key, to be shared by concurrent lookups
+        self._loads_in_flight = {}
 
     def __str__(self):
         return f"{self._container}/{self._table_path}"
@@ -91,6 +155,12 @@ class Table:
             self._partitioned_by_key,
             self._flush_interval_secs,
             self._max_updates_in_flight,
+            self._missing_key_ttl_secs,
+            self._flush_batch_size,
+            self._max_cached_keys,
+            self._expire_idle_keys,
+            self._aggregation_backend,
+            self._tiered_aggregation_buckets,
         )
         new_table._container = self._container
         new_table._table_path = self._table_path
@@ -101,6 +171,9 @@ class Table:
         if cache_element is None:
             cache_element = _CacheElement({}, None)
             self._attrs_cache[key] = cache_element
+            self._evict()
+        elif self._max_cached_keys:
+            self._attrs_cache.move_to_end(key)
         if cache_element.lock is None:
             cache_element.lock = Lock()
         return cache_element.lock
@@ -124,32 +197,96 @@ class Table:
             raise self._flush_exception
         async with self._get_lock(key):
             if self._aggregations_read_only or not self._get_aggregations_attrs(key):
-                # Try load from the store, and create a new one only if the key really is new
-                (
-                    aggregate_initial_data,
-                    additional_data,
-                ) = await self._storage._load_aggregates_by_key(self._container, self._table_path, key)
+                await self._load_key_with_aggregates(key, timestamp)
 
-                # Create new aggregation element
-                await self._add_aggregation_by_key(key, timestamp, aggregate_initial_data)
+    # Must be called while holding the key's lock
+    async def _load_key_with_aggregates(self, key, timestamp):
+        # Try load from the store, and create a new one only if the key really is new
+        (
+            aggregate_initial_data,
+            additional_data,
+        ) = await self._storage._load_aggregates_by_key(self._container, self._table_path, key)
 
-                if additional_data:
-                    # Add additional data to simple cache
-                    self._update_static_attrs(key, additional_data)
+        # Create new aggregation element
+        await self._add_aggregation_by_key(key, timestamp, aggregate_initial_data)
+
+        if additional_data:
+            # Add additional data to simple cache
+            self._update_static_attrs(key, additional_data)
 
     async def _get_or_load_static_attributes_by_key(self, key, attributes="*"):
+        (attrs,) = await self._get_or_load_static_attributes_by_keys([key], attributes)
+        return attrs
+
+    async def _get_or_load_static_attributes_by_keys(self, keys, attributes="*"):
         if self._flush_exception is not None:
             raise self._flush_exception
         self._init_flush_task()
-        async with self._get_lock(key):
-            attrs = self._get_static_attrs(key)
-            if not attrs:
-                res = await self._storage._load_by_key(self._container, self._table_path, key, attributes)
-                if res:
-                    self._set_static_attrs(key, res)
-                else:
-                    self._set_static_attrs(key, {})
-            return self._get_static_attrs(key)
+        loads = []
+        keys_to_load = []
+        for key in dict.fromkeys(keys):
+            if not self._get_static_attrs(key) and not self._is_missing_key(key):
+                # Concurrent lookups of the same key share a single storage read
+                load = self._loads_in_flight.get(key)
+                if load is None:
+                    keys_to_load.append(key)
+                elif load not in loads:
+                    loads.append(load)
+        if keys_to_load:
+            load = asyncio.get_running_loop().create_task(
+                self._load_static_attributes_by_keys(keys_to_load, attributes)
+            )
+            for key in keys_to_load:
+                self._loads_in_flight[key] = load
+            load.add_done_callback(partial(self._forget_loads_in_flight, keys_to_load))
+            loads.append(load)
+        for load in loads:
+            await asyncio.shield(load)
+        result = []
+        for key in keys:
+            async with self._get_lock(key):
+                result.append(self._get_static_attrs(key))
+        return result
+
+    def _forget_loads_in_flight(self, keys, load):
+        for key in keys:
+            if self._loads_in_flight.get(key) is load:
+                del self._loads_in_flight[key]
+
+    async def _load_static_attributes_by_keys(self, keys, attributes):
+        if len(keys) == 1:
+            (key,) = keys
+            async with self._get_lock(key):
+                if not self._get_static_attrs(key) and not self._is_missing_key(key):
+                    res = await self._storage._load_by_key(self._container, self._table_path, key, attributes)
+                    self._set_loaded_static_attrs(key, res)
+            return
+        results = await self._storage._load_by_keys(self._container, self._table_path, keys, attributes)
+        for key, res in zip(keys, results):
+            async with self._get_lock(key):
+                if not self._get_static_attrs(key) and not self._is_missing_key(key):
+                    self._set_loaded_static_attrs(key, res)
+
+    def _set_loaded_static_attrs(self, key, res):
+        # Attributes that were just loaded from storage do not need to be written back to it
+        changed = key in self._changed_keys
+        if res:
+            self._set_static_attrs(key, res)
+        else:
+            self._set_static_attrs(key, {})
+            if self._missing_key_ttl_secs:
+                self._missing_key_expiry[key] = time.monotonic() + self._missing_key_ttl_secs
+        if not changed:
+            self._changed_keys.discard(key)
+
+    def _is_missing_key(self, key):
+        expiry = self._missing_key_expiry.get(key)
+        if expiry is None:
+            return False
+        if time.monotonic() < expiry:
+            return True
+        del self._missing_key_expiry[key]
+        return False
 
     async def _internal_persist_key(self, key, event_data_to_persist, aggr_by_key=None, additional_data_persist=None):
         async with self._get_lock(key):
@@ -188,8 +325,14 @@ class Table:
             await self._load_and_update_schema()
         async with self._get_lock(key):
             cache_item = self._get_aggregations_attrs(key)
+            if cache_item is None:
+                # The key was evicted from the cache after it was loaded
+                await self._load_key_with_aggregates(key, timestamp)
+                cache_item = self._get_aggregations_attrs(key)
             await cache_item.aggregate(data, timestamp)
             self._changed_keys.add(key)
+        if self._expire_idle_keys:
+            self._record_event_time(key, timestamp)
         if self._flush_task:
             self._pending_events.append(event)
 
@@ -199,6 +342,9 @@ class Table:
         if not self._schema:
             await self._load_and_update_schema()
 
+        if key not in self._attrs_cache:
+            # The key was evicted from the cache after it was loaded
+            await self._lazy_load_key_with_aggregates(key, timestamp)
         attrs = self._get_aggregations_attrs(key)
 
         if attrs is None:
@@ -209,7 +355,10 @@ class Table:
     def _new_aggregated_store_element(self):
         if self._aggregations_read_only:
             return ReadOnlyAggregatedStoreElement
-        return AggregatedStoreElement
+        buckets_class = NumpyAggregationBuckets if self._aggregation_backend == "numpy" else AggregationBuckets
+        if self._tiered_aggregation_buckets:
+            buckets_class = partial(TieredAggregationBuckets, tier_class=buckets_class)
+        return partial(AggregatedStoreElement, buckets_class=buckets_class)
 
     async def _add_aggregation_by_key(self, key, base_timestamp, initial_data):
         if not self._schema:
@@ -270,10 +419,15 @@ class Table:
             else:
                 new_aggregates = get_all_raw_aggregates(schema_aggr["aggregates"])
                 old_aggregates = get_all_raw_aggregates(old[name]["aggregates"])
+                approximate_aggregates = set(schema_aggr.get("approximate_aggregates", [])).union(
+                    old[name].get("approximate_aggregates", [])
+                )
                 old[name] = {
                     "period_millis": schema_aggr["period_millis"],
                     "aggregates": list(new_aggregates.union(old_aggregates)),
                 }
+                if approximate_aggregates:
+                    old[name]["approximate_aggregates"] = sorted(approximate_aggregates)
 
         return old
 
@@ -304,9 +458,27 @@ class Table:
                     f"Requested aggregates for feature {aggr.name} do not match with existing aggregates"
                     f"at {self._table_path}. Requested: {aggr.aggregations}, existing: {schema_aggr['aggregates']}"
                 )
+            # Approximate aggregates need the sketches they are calculated from to have been stored
+            existing_approximate_aggregates = schema_aggr.get("approximate_aggregates", [])
+            requested_sketch_kinds = get_sketch_kinds(aggr.aggregations)
+            if self._aggregations_read_only and not requested_sketch_kinds.issubset(
+                get_sketch_kinds(existing_approximate_aggregates)
+            ):
+                raise ValueError(
+                    f"Requested approximate aggregates for feature {aggr.name} are not calculated from the sketches "
+                    f"stored at {self._table_path}. Requested: {aggr.aggregations}, existing: "
+                    f"{existing_approximate_aggregates}"
+                )
             # Check if more raw aggregates are requested, in which case a schema update is required
             if not self._aggregations_read_only and requested_raw_aggregates != existing_raw_aggregates:
                 should_update = True
+            requested_approximate_aggregates = {
+                aggregate for aggregate in aggr.aggregations if is_approximate_aggregate(aggregate)
+            }
+            if not self._aggregations_read_only and not requested_approximate_aggregates.issubset(
+                existing_approximate_aggregates
+            ):
+                should_update = True
 
         return should_update
 
@@ -323,6 +495,11 @@ class Table:
                 "window_type": window_type,
                 "max_window_millis": aggr.windows.max_window_millis,
             }
+            approximate_aggregates = [
+                aggregate for aggregate in aggr.aggregations if is_approximate_aggregate(aggregate)
+            ]
+            if approximate_aggregates:
+                schema[aggr.name]["approximate_aggregates"] = approximate_aggregates
 
         return schema
 
@@ -337,6 +514,8 @@ class Table:
 
     def _get_aggregations_attrs(self, key):
         if key in self._attrs_cache:
+            if self._max_cached_keys:
+                self._attrs_cache.move_to_end(key)
             return self._attrs_cache[key].aggregations
         else:
             return None
@@ -348,22 +527,127 @@ class Table:
         else:
             self._init_flush_task()
             self._attrs_cache[key] = _CacheElement({}, element)
+            self._evict()
 
     def _get_static_attrs(self, key):
         if key in self._attrs_cache:
+            if self._max_cached_keys:
+                self._attrs_cache.move_to_end(key)
             return self._attrs_cache[key].static_attrs
         else:
             return None
 
     def _set_static_attrs(self, key, value):
+        if value:
+            self._missing_key_expiry.pop(key, None)
         if key in self._attrs_cache:
             self._attrs_cache[key].static_attrs = value
             self._changed_keys.add(key)
         else:
             self._attrs_cache[key] = _CacheElement(value, None)
+            self._evict()
 
     def _get_keys(self):
-        return self._attrs_cache.keys()
+        # A copy, since keys may be loaded or evicted while the caller iterates over them
+        return list(self._attrs_cache)
+
+    def _evict(self):
+        if not self._max_cached_keys:
+            return
+        dirty_keys = []
+        # Each key is checked at most once, except for the one that was just added, which is the most recently used
+        for _ in range(min(len(self._attrs_cache) - 1, self._max_eviction_scan)):
+            if len(self._attrs_cache) <= self._max_cached_keys:
+                break
+            key, cache_element = next(iter(self._attrs_cache.items()))
+            if key in self._changed_keys and key not in self._keys_flushed_for_eviction:
+                dirty_keys.append(key)
+            if self._can_evict(key, cache_element):
+                self._drop_key(key)
+            else:
+                # Keys that are in use, or that are not yet written to storage, are not evicted for now
+                self._attrs_cache.move_to_end(key)
+        if dirty_keys:
+            self._flush_for_eviction(dirty_keys)
+
+    def _can_evict(self, key, cache_element):
+        return not (
+            key in self._changed_keys
+            or key in self._pending_by_key
+            or key in self._loads_in_flight
+            or (cache_element.lock is not None and cache_element.lock.locked())
+        )
+
+    def _drop_key(self, key):
+        del self._attrs_cache[key]
+        self._missing_key_expiry.pop(key, None)
+        self._last_event_time_by_key.pop(key, None)
+        self._idle_keys.discard(key)
+
+    def _record_event_time(self, key, timestamp):
+        last_event_time = self._last_event_time_by_key.pop(key, None)
+        if last_event_time is not None and last_event_time > timestamp:
+            timestamp = last_event_time
+        self._last_event_time_by_key[key] = timestamp
+        self._idle_keys.discard(key)
+        if self._latest_event_time is None or timestamp > self._latest_event_time:
+            self._latest_event_time = timestamp
+        self._evict_idle_keys()
+
+    def _evict_idle_keys(self):
+        # A data point stays in a sliding window for up to the window's length plus one period
+        horizon = self._latest_event_time - max(
+            aggregate.windows.max_window_millis + aggregate.windows.period_millis for aggregate in self._aggregates
+        )
+        # Events may arrive out of order, so keys are only checked until one that is not idle is found
+        new_idle_keys = []
+        while self._last_event_time_by_key:
+            key, last_event_time = next(iter(self._last_event_time_by_key.items()))
+            if last_event_time >= horizon:
+                break
+            del self._last_event_time_by_key[key]
+            self._idle_keys.add(key)
+            new_idle_keys.append(key)
+        # Keys that cannot be evicted yet are retried once they are written to storage
+        self._evict_idle_keys_of(new_idle_keys)
+
+    def _evict_idle_keys_of(self, keys):
+        dirty_keys = [key for key in keys if key in self._idle_keys and not self._evict_idle_key(key)]
+        if dirty_keys:
+            self._flush_for_eviction(dirty_keys)
+
+    def _evict_idle_key(self, key):
+        """Evicts an idle key if it can be evicted. Returns False if the key must first be written to storage."""
+        cache_element = self._attrs_cache.get(key)
+        if cache_element is None:
+            self._idle_keys.discard(key)
+        elif self._can_evict(key, cache_element):
+            self._drop_key(key)
+        elif key in self._changed_keys and key not in self._keys_flushed_for_eviction:
+            return False
+        return True
+
+    def _flush_for_eviction(self, keys):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Not running in a flow. The keys are written when the flow terminates.
+            return
+        self._keys_flushed_for_eviction.update(keys)
+        task = loop.create_task(self._persist_for_eviction(keys))
+        self._eviction_flush_tasks.add(task)
+        task.add_done_callback(self._eviction_flush_tasks.discard)
+
+    async def _persist_for_eviction(self, keys):
+        try:
+            persisted_keys = await self._persist_batch(keys)
+        except BaseException as ex:
+            if not isinstance(ex, asyncio.CancelledError):
+                self._flush_exception = ex
+            return
+        finally:
+            self._keys_flushed_for_eviction.difference_update(keys)
+        self._evict_idle_keys_of(persisted_keys)
 
     def __setitem__(self, key, value):
         """Sets attribute in table.
@@ -384,10 +668,10 @@ class Table:
         try:
             while not self._terminated:
                 await asyncio.sleep(self._flush_interval_secs)
-                for key in self._changed_keys.copy():
-                    if key not in self._pending_by_key:
-                        await self._persist(_PersistJob(key, None, None))
-                        self._changed_keys.discard(key)
+                for keys in self._get_keys_to_flush():
+                    persisted_keys = await self._persist_batch(keys)
+                    if self._idle_keys:
+                        self._evict_idle_keys_of(persisted_keys)
 
         except BaseException as ex:
             if not isinstance(ex, asyncio.CancelledError):
@@ -446,6 +730,8 @@ class Table:
                     self_sent_jobs[tail_position] = jobs_at_tail
                 else:
                     del self._pending_by_key[job.key]
+                    if job.key in self._idle_keys:
+                        self._evict_idle_key(job.key)
         except BaseException as ex:
             if task and task is not _termination_obj:
                 if task[0].extra_data and task[0].extra_data._awaitable_result:
@@ -461,9 +747,10 @@ class Table:
                 raise self._flush_exception
         if not self._terminated:
             self._terminated = True
-            for key in self._changed_keys.copy():
-                if key not in self._pending_by_key:
-                    await self._persist(_PersistJob(key, None, None), from_terminate=True)
+            if self._eviction_flush_tasks:
+                await asyncio.wait(self._eviction_flush_tasks)
+            for keys in self._get_keys_to_flush():
+                await self._persist_batch(keys, from_terminate=True)
             if self._q:
                 # in case there was no _persist for this table, q and worker_awaitable were never created
                 await self._q.put(_termination_obj)
@@ -474,7 +761,12 @@ class Table:
             self._flush_task = None
             self._flush_exception = None
 
-    async def _persist(self, job, from_terminate=False):
+    def _get_keys_to_flush(self):
+        keys = [key for key in self._changed_keys if key not in self._pending_by_key]
+        for i in range(0, len(keys), self._flush_batch_size):
+            yield keys[i : i + self._flush_batch_size]
+
+    def _prepare_persist_job(self, job):
         if not self._flush_interval_secs:
             job.additional_data_persist = self._get_static_attrs(job.key)
             job.aggr_by_key = self._get_aggregations_attrs(job.key)
@@ -482,6 +774,7 @@ class Table:
             job.save_additional_data_from_table(self)
             self._flush_pending(job.key)
 
+    async def _init_persist_worker(self, from_terminate):
         if self._flush_exception is not None:
             raise self._flush_exception
         if not self._q:
@@ -494,22 +787,58 @@ class Table:
         if self._worker_awaitable.done():
             await self._worker_awaitable
             raise FlowError("Persist worker has already terminated")
-        else:
-            # Initializing the key with 2 lists. One for pending requests and one for
-            # requests that an update request has been issued for.
-            if job.key not in self._pending_by_key:
-                self._pending_by_key[job.key] = _PendingEvent()
-
-            # If there is a current update in flight for the key, add the event to
-            # the pending list. Otherwise update the key.
-            self._pending_by_key[job.key].pending.append(job)
-            if len(self._pending_by_key[job.key].in_flight) == 0:
-                self._pending_by_key[job.key].in_flight = self._pending_by_key[job.key].pending
-                self._pending_by_key[job.key].pending = []
-                task = self._safe_process_events(self._pending_by_key[job.key].in_flight)
-                await self._q.put((job, asyncio.get_running_loop().create_task(task)))
-                if self._worker_awaitable.done():
-                    await self._worker_awaitable
+
+    async def _persist_batch(self, keys, from_terminate=False):
+        # Keys that were updated in the meantime are persisted by the pending update
+        jobs = [_PersistJob(key, None, None) for key in keys if key not in self._pending_by_key]
+        if not jobs:
+            return []
+        for job in jobs:
+            self._prepare_persist_job(job)
+        # The keys are clean once their data is taken, before anything is awaited, so that a key that changes while the
+        # batch is queued or written is marked as changed again, and written later
+        self._changed_keys.difference_update(job.key for job in jobs)
+        await self._init_persist_worker(from_terminate)
+        # The whole batch is written with a single call to the storage. Each of its keys is registered as being in
+        # flight, so that later updates of the same key wait for the batch to complete, as they would for an update of
+        # that key alone.
+        for job in jobs:
+            pending_event = _PendingEvent()
+            pending_event.in_flight = [job]
+            self._pending_by_key[job.key] = pending_event
+        task = asyncio.get_running_loop().create_task(self._process_batch(jobs))
+        for job in jobs:
+            if self._worker_awaitable.done():
+                await self._worker_awaitable
+                raise FlowError("Persist worker has already terminated")
+            await self._q.put((job, task))
+        return [job.key for job in jobs]
+
+    async def _process_batch(self, jobs):
+        async with AsyncExitStack() as stack:
+            for job in jobs:
+                await stack.enter_async_context(self._get_lock(job.key))
+            items = [(job.key, job.aggr_by_key, job.additional_data_persist) for job in jobs]
+            await self._storage._save_keys(self._container, self._table_path, items, self._partitioned_by_key)
+
+    async def _persist(self, job, from_terminate=False):
+        self._prepare_persist_job(job)
+        await self._init_persist_worker(from_terminate)
+        # Initializing the key with 2 lists. One for pending requests and one for
+        # requests that an update request has been issued for.
+        if job.key not in self._pending_by_key:
+            self._pending_by_key[job.key] = _PendingEvent()
+
+        # If there is a current update in flight for the key, add the event to
+        # the pending list. Otherwise update the key.
+        self._pending_by_key[job.key].pending.append(job)
+        if len(self._pending_by_key[job.key].in_flight) == 0:
+            self._pending_by_key[job.key].in_flight = self._pending_by_key[job.key].pending
+            self._pending_by_key[job.key].pending = []
+            task = self._safe_process_events(self._pending_by_key[job.key].in_flight)
+            await self._q.put((job, asyncio.get_running_loop().create_task(task)))
+            if self._worker_awaitable.done():
+                await self._worker_awaitable
 
     async def _safe_process_events(self, jobs):
         try:
@@ -605,10 +934,28 @@ class ReadOnlyAggregatedStoreElement:
                 self.options,
             )
 
+        # Add all approximate aggregates, which are calculated from the stored sketches of each feature
+        self.approximate_aggregation_buckets = []
+        for aggregation_metadata in aggregates:
+            approximate_aggregates = [
+                aggr for aggr in aggregation_metadata.aggregations if is_approximate_aggregate(aggr)
+            ]
+            if approximate_aggregates:
+                sketches_column_name = f"{aggregation_metadata.name}_{utils.sketches_aggregation_name}"
+                self.approximate_aggregation_buckets.append(
+                    ReadOnlyApproximateAggregationBuckets(
+                        aggregation_metadata.name,
+                        approximate_aggregates,
+                        aggregation_metadata.windows,
+                        initial_data.get(sketches_column_name) if initial_data else None,
+                        self.options,
+                    )
+                )
+
         # Add all virtual aggregates
         for aggregation_metadata in aggregates:
             for aggr in aggregation_metadata.aggregations:
-                if not is_raw_aggregate(aggr):
+                if not is_raw_aggregate(aggr) and not is_approximate_aggregate(aggr):
                     dependant_aggregate_names = get_implied_aggregates(aggr)
                     dependant_buckets = []
                     for dep in dependant_aggregate_names:
@@ -641,6 +988,8 @@ class ReadOnlyAggregatedStoreElement:
                     timestamp, aggregation_bucket.explicit_windows.windows
                 )
                 result.update(aggregation_bucket.get_features(timestamp, count_features=count_features))
+        for approximate_aggregation_bucket in self.approximate_aggregation_buckets:
+            result.update(approximate_aggregation_bucket.get_features(timestamp))
 
         return result
 
@@ -1121,6 +1470,48 @@ class VirtualAggregationBuckets:
         return result
 
 
+class ReadOnlyApproximateAggregationBuckets:
+    """Approximate aggregates of a feature, calculated from the sketches of its buckets that were read from storage."""
+
+    def __init__(self, name, approximate_aggregations, windows, serialized_sketches=None, fixed_window_type=None):
+        self.name = name
+        self.windows = windows
+        self.should_persist = False
+        self._approximate_aggregates = ApproximateAggregates(approximate_aggregations)
+        self._fixed_window_type = None
+        if isinstance(windows, FixedWindows):
+            self._fixed_window_type = fixed_window_type or FixedWindowType.CurrentOpenWindow
+        self._sketches_by_time = {}
+        for data in serialized_sketches or []:
+            bucket_start_time, sketches = self._approximate_aggregates.deserialize(data)
+            self._sketches_by_time[bucket_start_time] = self._approximate_aggregates.merge(
+                self._sketches_by_time.get(bucket_start_time), sketches
+            )
+
+    def aggregate(self, timestamp, value):
+        pass
+
+    def get_features(self, timestamp):
+        result = {}
+        for window_millis, window_str in self.windows.windows:
+            # The window covers the same buckets as those of the raw aggregates
+            if self._fixed_window_type is None:
+                end_time = (int(timestamp / self.windows.period_millis) + 1) * self.windows.period_millis
+                start_time = end_time - window_millis
+            else:
+                start_time = int(timestamp / window_millis) * window_millis
+                if self._fixed_window_type == FixedWindowType.LastClosedWindow:
+                    start_time -= window_millis
+                end_time = start_time + window_millis
+            sketches = None
+            for bucket_start_time, bucket_sketches in self._sketches_by_time.items():
+                if start_time <= bucket_start_time < end_time:
+                    sketches = self._approximate_aggregates.merge(sketches, bucket_sketches)
+            for aggregation_name, value in self._approximate_aggregates.get_features(sketches).items():
+                result[f"{self.name}_{aggregation_name}_{window_str}"] = value
+        return result
+
+
 class AggregationValue:
     default_value = math.nan
 
@@ -1334,12 +1725,14 @@ class AggregatedStoreElement:
         initial_data=None,
         options=None,
         persist_func=None,
+        buckets_class=None,
     ):
         self.aggregation_buckets = {}
         self.key = key
         self.aggregates = aggregates
         self.storage_specific_cache = {}
         self.persist_func = persist_func
+        buckets_class = buckets_class or AggregationBuckets
 
         # Group init data by feature name
         initial_data_by_feature = {}
@@ -1356,17 +1749,22 @@ class AggregatedStoreElement:
             explicit_raw_aggregates = []
             hidden_raw_aggregates = []
             virtual_aggregates = []
+            approximate_aggregates = []
             for aggregation in aggregation_metadata.aggregations:
                 if is_raw_aggregate(aggregation):
                     explicit_raw_aggregates.append(aggregation)
+                elif is_approximate_aggregate(aggregation):
+                    approximate_aggregates.append(aggregation)
                 else:
                     dependant_aggregate_names = get_implied_aggregates(aggregation)
                     hidden_raw_aggregates.extend(dependant_aggregate_names)
                     virtual_aggregates.append(VirtualAggregation(aggregation, dependant_aggregate_names))
             initial_column_data = None
+            initial_sketches = None
             if initial_data_by_feature and aggregation_metadata.name in initial_data_by_feature:
                 initial_column_data = initial_data_by_feature[aggregation_metadata.name]
-            self.aggregation_buckets[aggregation_metadata.name] = AggregationBuckets(
+                initial_sketches = initial_column_data.pop(utils.sketches_aggregation_name, None)
+            self.aggregation_buckets[aggregation_metadata.name] = buckets_class(
                 aggregation_metadata.name,
                 explicit_raw_aggregates,
                 hidden_raw_aggregates,
@@ -1375,8 +1773,10 @@ class AggregatedStoreElement:
                 base_time,
                 aggregation_metadata.max_value,
                 key,
-                initial_column_data,
+                initial_column_data or None,
                 persist_func,
+                approximate_aggregates,
+                initial_sketches=initial_sketches,
             )
 
     def __deepcopy__(self, memo):  # memo is a dict of id's to copies
@@ -1421,6 +1821,8 @@ class AggregationBuckets:
         key,
         initial_data=None,
         persist_func=None,
+        approximate_aggregations=None,
+        initial_sketches=None,
     ):
         self.key = key
         self.name = name
@@ -1468,6 +1870,20 @@ class AggregationBuckets:
                         aggr, max_value
                     )
 
+        # Min and max over sliding windows are maintained with a monotonic deque of (bucket start time, value) per
+        # aggregate and window, so that they need not be recalculated from the buckets when old buckets leave the window
+        self._extremum_deques = {}
+        if self._precalculated_aggregations and not self.is_fixed_window:
+            for aggr, window_millis in self._current_aggregate_values:
+                if aggr == "min" or aggr == "max":
+                    self._extremum_deques[(aggr, window_millis)] = deque()
+
+        # Approximate aggregates are kept as sketches per bucket that are merged to calculate features
+        self._approximate_aggregates = None
+        self._sketches = [None] * self.total_number_of_buckets
+        if approximate_aggregations:
+            self._approximate_aggregates = ApproximateAggregates(approximate_aggregations)
+
         if initial_data:
             self.last_bucket_start_time = None
 
@@ -1483,6 +1899,9 @@ class AggregationBuckets:
 
             self.initialize_column()
 
+        if initial_sketches and self._approximate_aggregates:
+            self._load_sketches(initial_sketches)
+
     def __deepcopy__(self, memo):  # memo is a dict of id's to copies
         cls = self.__class__
         result = cls.__new__(cls)
@@ -1519,12 +1938,40 @@ class AggregationBuckets:
     def get_nearest_window_index_by_timestamp(self, timestamp, window_millis):
         return int((timestamp - self.first_bucket_start_time) / window_millis)
 
+    def _get_bucket_value(self, index, aggregation_name):
+        return self.buckets[index][aggregation_name].value
+
+    def _aggregate_bucket(self, index, timestamp, value):
+        for aggr in self.buckets[index].values():
+            aggr.aggregate(timestamp, value)
+
+    # Aggregates the buckets in the given range, from the latest to the earliest, into the intermediate values
+    def _aggregate_buckets(self, first_index, last_index):
+        for bucket_index in range(last_index, first_index - 1, -1):
+            if bucket_index < len(self.buckets):
+                for aggregation_name in self._all_raw_aggregates:
+                    bucket = self.buckets[bucket_index][aggregation_name]
+                    self._intermediate_aggregation_values[aggregation_name].aggregate(bucket.time, bucket.value)
+
+    # Drops the given number of oldest buckets, and reuses them as empty buckets at the end
+    def _shift_buckets(self, count):
+        buckets_to_reuse = self.buckets[:count]
+        self.buckets = self.buckets[count:]
+        for bucket_to_reuse in buckets_to_reuse:
+            for _, aggr_value in bucket_to_reuse.items():
+                aggr_value.reset()
+            self.buckets.append(bucket_to_reuse)
+
     def remove_old_values_from_pre_aggregations(self, timestamp):
         if self._precalculated_aggregations:
             for (
                 aggr_name,
                 current_window_millis,
             ), aggr in self._current_aggregate_values.items():
+                extremums = self._extremum_deques.get((aggr_name, current_window_millis))
+                if extremums is not None:
+                    self._remove_old_extremums(extremums, aggr, current_window_millis, timestamp)
+                    continue
                 if self.is_fixed_window:
                     previous_window_start_time = self.get_window_start_time_from_timestamp(
                         self._last_data_point_timestamp, current_window_millis
@@ -1543,14 +1990,14 @@ class AggregationBuckets:
 
                     previous_window_start = max(0, previous_window_start)
                     current_window_start = max(0, current_window_start)
-                    previous_window_start = min(len(self.buckets) - 1, previous_window_start)
-                    current_window_start = min(len(self.buckets), current_window_start)
+                    previous_window_start = min(self.total_number_of_buckets - 1, previous_window_start)
+                    current_window_start = min(self.total_number_of_buckets, current_window_start)
 
                 for bucket_id in range(previous_window_start, current_window_start):
                     current_pre_aggregated_value = aggr.value
                     if bucket_id >= self.total_number_of_buckets:
                         break
-                    bucket_aggregated_value = self.buckets[bucket_id][aggr_name].value
+                    bucket_aggregated_value = self._get_bucket_value(bucket_id, aggr_name)
                     if aggr_name == "min" or aggr_name == "max" or aggr_name == "first" or aggr_name == "last":
                         if current_pre_aggregated_value == bucket_aggregated_value:
                             self._need_to_recalculate_pre_aggregates = True
@@ -1558,6 +2005,36 @@ class AggregationBuckets:
                     else:
                         aggr._set_value(current_pre_aggregated_value - bucket_aggregated_value)
 
+    def _remove_old_extremums(self, extremums, aggr, window_millis, timestamp):
+        window_start = self.get_window_range(self.get_end_bucket(timestamp), window_millis)
+        window_start_time = self.first_bucket_start_time + window_start * self.period_millis
+        while extremums and extremums[0][0] < window_start_time:
+            extremums.popleft()
+        aggr.reset(extremums[0][1] if extremums else None)
+
+    @staticmethod
+    def _push_extremum(extremums, aggr_name, bucket_start_time, value):
+        if math.isnan(value):
+            return
+        # Values that can no longer be the extremum of the window, since a newer value is as extreme, are dropped
+        if aggr_name == "min":
+            while extremums and extremums[-1][1] >= value:
+                extremums.pop()
+        else:
+            while extremums and extremums[-1][1] <= value:
+                extremums.pop()
+        if not extremums or extremums[-1][0] != bucket_start_time:
+            extremums.append((bucket_start_time, value))
+
+    def _rebuild_extremum_deques(self, end_bucket_index):
+        for (aggr_name, window_millis), extremums in self._extremum_deques.items():
+            extremums.clear()
+            window_start = max(0, self.get_window_range(end_bucket_index, window_millis))
+            for bucket_index in range(window_start, min(end_bucket_index, self.total_number_of_buckets - 1) + 1):
+                bucket_start_time = self.first_bucket_start_time + bucket_index * self.period_millis
+                value = self._get_bucket_value(bucket_index, aggr_name)
+                self._push_extremum(extremums, aggr_name, bucket_start_time, value)
+
     async def advance_window_period(self, advance_to):
         desired_bucket_index = int((advance_to - self.first_bucket_start_time) / self.period_millis)
         buckets_to_advance = desired_bucket_index - (self.total_number_of_buckets - 1)
@@ -1569,16 +2046,13 @@ class AggregationBuckets:
                 await self.persist_func(_PersistJob(self.key, None, None))
             if buckets_to_advance > self.total_number_of_buckets:
                 self.initialize_column()
+                self._sketches = [None] * self.total_number_of_buckets
                 self._need_to_recalculate_pre_aggregates = True
             else:
                 # Updating the pre-aggregated data per window
                 self.remove_old_values_from_pre_aggregations(advance_to)
-                buckets_to_reuse = self.buckets[:buckets_to_advance]
-                self.buckets = self.buckets[buckets_to_advance:]
-                for bucket_to_reuse in buckets_to_reuse:
-                    for _, aggr_value in bucket_to_reuse.items():
-                        aggr_value.reset()
-                    self.buckets.append(bucket_to_reuse)
+                self._shift_buckets(buckets_to_advance)
+                self._sketches = self._sketches[buckets_to_advance:] + [None] * buckets_to_advance
 
             # fixed windows are advancing in integral window size
             if self.is_fixed_window:
@@ -1611,13 +2085,17 @@ class AggregationBuckets:
 
         # Only aggregate points that are in range
         if index >= 0:
-            for aggr in self.buckets[index].values():
-                aggr.aggregate(timestamp, value)
-            self.add_to_pending(timestamp, value)
+            self._aggregate_bucket(index, timestamp, value)
+            if self.should_persist:
+                self.add_to_pending(timestamp, value)
+            if self._approximate_aggregates:
+                if self._sketches[index] is None:
+                    self._sketches[index] = self._approximate_aggregates.new_sketches()
+                self._approximate_aggregates.add(self._sketches[index], value)
 
             if self._precalculated_aggregations:
                 for (
-                    _,
+                    aggr_name,
                     current_window_millis,
                 ), aggr in self._current_aggregate_values.items():
                     current_window_start_time = self.get_window_start_time_from_timestamp(
@@ -1631,7 +2109,13 @@ class AggregationBuckets:
                     if timestamp >= self._last_data_point_timestamp and index in range(
                         current_window_start_index, current_window_end_index + 1
                     ):
-                        aggr.aggregate(timestamp, value)
+                        extremums = self._extremum_deques.get((aggr_name, current_window_millis))
+                        if extremums is None:
+                            aggr.aggregate(timestamp, value)
+                        else:
+                            bucket_start_time = self.first_bucket_start_time + index * self.period_millis
+                            self._push_extremum(extremums, aggr_name, bucket_start_time, value)
+                            aggr.reset(extremums[0][1] if extremums else None)
                 if timestamp > self._last_data_point_timestamp:
                     self._last_data_point_timestamp = timestamp
 
@@ -1683,8 +2167,56 @@ class AggregationBuckets:
                     result[f"{self.name}_{aggregation_name}_{window_str}"] = value
 
         self.augment_virtual_features(result)
+        if self._approximate_aggregates:
+            self.add_approximate_features(result, timestamp)
         return result
 
+    def add_approximate_features(self, features, timestamp):
+        end_bucket_index = self.get_end_bucket(timestamp)
+        sketches = None
+        prev_windows_millis = 0
+        for window_millis, window_str in self.explicit_windows.windows:
+            if self.is_fixed_window:
+                # Like the pre aggregates, each fixed window starts at a multiple of its duration, so that it is merged
+                # from its own buckets
+                window_start_time = self.get_window_start_time_from_timestamp(timestamp, window_millis)
+                first_bucket_index = max(0, self.get_bucket_index_by_timestamp(window_start_time))
+                sketches = None
+            else:
+                # Like in calculate_features, each window adds the buckets that precede those of the previous window
+                first_bucket_index = max(
+                    0, end_bucket_index - int((window_millis - prev_windows_millis) / self.period_millis) + 1
+                )
+            last_bucket_index = min(end_bucket_index, self.total_number_of_buckets - 1)
+            for bucket_index in range(last_bucket_index, first_bucket_index - 1, -1):
+                if self._sketches[bucket_index] is not None:
+                    sketches = self._approximate_aggregates.merge(sketches, self._sketches[bucket_index])
+            for aggregation_name, value in self._approximate_aggregates.get_features(sketches).items():
+                features[f"{self.name}_{aggregation_name}_{window_str}"] = value
+            if not self.is_fixed_window:
+                end_bucket_index = first_bucket_index - 1
+                prev_windows_millis = window_millis
+
+    def _load_sketches(self, serialized_sketches):
+        for data in serialized_sketches:
+            bucket_start_time, sketches = self._approximate_aggregates.deserialize(data)
+            # Sketches of buckets that are no longer in range, which remain in storage, are ignored
+            bucket_index = self.get_bucket_index_by_timestamp(bucket_start_time)
+            if 0 <= bucket_index < self.total_number_of_buckets:
+                self._sketches[bucket_index] = self._approximate_aggregates.merge(
+                    self._sketches[bucket_index], sketches
+                )
+
+    def get_serialized_sketches(self, bucket_start_time):
+        """Returns the sketches of the bucket that starts at the given time, serialized to bytes, or None if it has
+        none."""
+        if not self._approximate_aggregates:
+            return None
+        bucket_index = self.get_bucket_index_by_timestamp(bucket_start_time)
+        if 0 <= bucket_index < self.total_number_of_buckets and self._sketches[bucket_index] is not None:
+            return self._approximate_aggregates.serialize(bucket_start_time, self._sketches[bucket_index])
+        return None
+
     def augment_virtual_features(self, features):
         if not self._virtual_aggregations:
             return
@@ -1706,6 +2238,7 @@ class AggregationBuckets:
 
         if self.is_fixed_window:
             current_time_bucket_index = self.get_bucket_index_by_timestamp(self._round_time_func(timestamp) - 1)
+        end_bucket_index = current_time_bucket_index
 
         for aggregation_name in self._all_raw_aggregates:
             self._intermediate_aggregation_values[aggregation_name].reset()
@@ -1725,11 +2258,7 @@ class AggregationBuckets:
             if last_bucket_to_aggregate < 0:
                 last_bucket_to_aggregate = 0
 
-            for bucket_index in range(current_time_bucket_index, last_bucket_to_aggregate - 1, -1):
-                if bucket_index < len(self.buckets):
-                    for aggregation_name in self._all_raw_aggregates:
-                        bucket = self.buckets[bucket_index][aggregation_name]
-                        self._intermediate_aggregation_values[aggregation_name].aggregate(bucket.time, bucket.value)
+            self._aggregate_buckets(last_bucket_to_aggregate, current_time_bucket_index)
 
             # create a feature for the current time window
             for aggregation_name in self._explicit_raw_aggregations:
@@ -1752,6 +2281,8 @@ class AggregationBuckets:
             current_time_bucket_index = last_bucket_to_aggregate - 1
             prev_windows_millis = window_millis
 
+        if self._precalculated_aggregations and self._need_to_recalculate_pre_aggregates:
+            self._rebuild_extremum_deques(end_bucket_index)
         self._need_to_recalculate_pre_aggregates = False
         return result
 
@@ -1831,6 +2362,469 @@ class AggregationBuckets:
         return pending
 
 
+class NumpyAggregationBuckets(AggregationBuckets):
+    """AggregationBuckets that keep the values of each raw aggregate in a NumPy array, used as a circular buffer of
+    buckets, rather than in an object per bucket and aggregate. Produces the same features as AggregationBuckets."""
+
+    def initialize_column(self):
+        # Index of the earliest bucket in the arrays
+        self._head = 0
+        self._values = {}
+        # Times of the values of first and last aggregates
+        self._times = {}
+        self._reset_values = {}
+        self._reset_times = {}
+        for aggregation_name in self._all_raw_aggregates:
+            aggregation_value = AggregationValue.new_from_name(aggregation_name, self.max_value)
+            self._values[aggregation_name] = numpy.full(self.total_number_of_buckets, aggregation_value.value)
+            if aggregation_name in ("first", "last"):
+                self._times[aggregation_name] = numpy.full(self.total_number_of_buckets, aggregation_value.time)
+            # Reused buckets are reset, which sets some aggregates to a different value than new ones
+            aggregation_value.reset()
+            self._reset_values[aggregation_name] = aggregation_value.value
+            self._reset_times[aggregation_name] = aggregation_value.time
+
+    def _positions(self, first_index, last_index, step=1):
+        return (self._head + numpy.arange(first_index, last_index, step)) % self.total_number_of_buckets
+
+    def _get_bucket_value(self, index, aggregation_name):
+        return float(self._values[aggregation_name][(self._head + index) % self.total_number_of_buckets])
+
+    def _with_max(self, value):
+        if self.max_value and value > self.max_value:
+            return self.max_value
+        return value
+
+    def _aggregate_bucket(self, index, timestamp, value):
+        position = (self._head + index) % self.total_number_of_buckets
+        for aggregation_name, values in self._values.items():
+            current_value = values[position]
+            if aggregation_name == "min":
+                if value < current_value:
+                    values[position] = value
+            elif aggregation_name == "max":
+                if value > current_value:
+                    values[position] = self._with_max(value)
+            elif aggregation_name == "sum":
+                values[position] = self._with_max(current_value + value)
+            elif aggregation_name == "count":
+                values[position] = self._with_max(current_value + 1)
+            elif aggregation_name == "sqr":
+                values[position] = self._with_max(current_value + value * value)
+            elif not math.isnan(value):
+                times = self._times[aggregation_name]
+                if aggregation_name == "last" and timestamp > times[position]:
+                    values[position] = self._with_max(value)
+                    times[position] = timestamp
+                elif aggregation_name == "first" and timestamp < times[position]:
+                    if math.isnan(current_value):
+                        values[position] = self._with_max(value)
+                    times[position] = timestamp
+
+    def _aggregate_buckets(self, first_index, last_index):
+        last_index = min(last_index, self.total_number_of_buckets - 1)
+        if last_index < first_index:
+            return
+        positions = self._positions(last_index, first_index - 1, -1)
+        for aggregation_name in self._all_raw_aggregates:
+            values = self._values[aggregation_name][positions]
+            aggregation_value = self._intermediate_aggregation_values[aggregation_name]
+            if aggregation_name in ("first", "last"):
+                self._aggregate_by_time(aggregation_value, values, self._times[aggregation_name][positions])
+            elif aggregation_name == "min":
+                value = numpy.fmin.reduce(values)
+                if value < aggregation_value.value:
+                    aggregation_value.value = float(value)
+            elif aggregation_name == "max":
+                value = numpy.fmax.reduce(values)
+                if value > aggregation_value.value:
+                    aggregation_value._set_value(value)
+            elif self.max_value:
+                # The sum is capped after each addition
+                for value in values.tolist():
+                    aggregation_value.aggregate(None, value)
+            else:
+                # Values are accumulated one after the other, so that the result is the same as when adding them up
+                # in a loop
+                sums = numpy.add.accumulate(numpy.concatenate(([aggregation_value.value], values)))
+                aggregation_value.value = float(sums[-1])
+
+    @staticmethod
+    def _aggregate_by_time(aggregation_value, values, times):
+        has_value = ~numpy.isnan(values)
+        values, times = values[has_value], times[has_value]
+        if aggregation_value.time is not None:
+            if aggregation_value.name == "last":
+                in_range = times > aggregation_value.time
+            else:
+                in_range = times < aggregation_value.time
+            values, times = values[in_range], times[in_range]
+        if not len(values):
+            return
+        if aggregation_value.name == "last":
+            # Like aggregating one bucket after the other, the first of the latest values is taken
+            index = numpy.argmax(times)
+            aggregation_value._set_value(values[index])
+            aggregation_value.time = float(times[index])
+        else:
+            # A first value is only set once, by the first bucket that has one
+            if math.isnan(aggregation_value.value):
+                aggregation_value._set_value(values[0])
+            aggregation_value.time = float(times.min())
+
+    def _shift_buckets(self, count):
+        positions = self._positions(0, count)
+        for aggregation_name, values in self._values.items():
+            values[positions] = self._reset_values[aggregation_name]
+        for aggregation_name, times in self._times.items():
+            times[positions] = self._reset_times[aggregation_name]
+        self._head = (self._head + count) % self.total_number_of_buckets
+
+    def initialize_from_data(self, data, base_time):
+        period = self.period_millis
+        self.initialize_column()
+
+        aggregation_bucket_initial_data = {}
+
+        # Assuming all aggregates have the same time so just checking the first
+        for key, value in data[next(iter(self._all_raw_aggregates))].items():
+            if isinstance(key, int):
+                aggregation_bucket_initial_data[key] = value
+            else:
+                self.storage_specific_cache[key] = value
+
+        first_time, last_time = None, next(iter(aggregation_bucket_initial_data))
+        if len(aggregation_bucket_initial_data.keys()) == 2:
+            timestamp1, timestamp2 = aggregation_bucket_initial_data.keys()
+            first_time, last_time = min(timestamp1, timestamp2), max(timestamp1, timestamp2)
+
+        # Buckets are initialized from the latest to the earliest, so that they end at base_time
+        bucket_index = self.total_number_of_buckets - 1
+        self.last_bucket_start_time = self._window_start_time
+        self.first_bucket_start_time = self.last_bucket_start_time - (self.total_number_of_buckets - 1) * period
+
+        start_index = int((base_time - last_time) / period)
+        last_length = len(aggregation_bucket_initial_data[last_time])
+
+        # In case base_time is newer than what is stored in the storage, the buckets until the stored data are reset
+        if start_index >= last_length:
+            if start_index >= last_length + self.total_number_of_buckets:
+                return
+            count = start_index - last_length + 1
+            for aggregation_name, values in self._values.items():
+                values[max(0, bucket_index - count + 1) : bucket_index + 1] = self._reset_values[aggregation_name]
+            bucket_index -= count
+            start_index = last_length - 1
+
+        count = min(start_index + 1, bucket_index + 1)
+        if count > 0:
+            for aggregation_name, values in self._values.items():
+                stored_values = data[aggregation_name][last_time][start_index - count + 1 : start_index + 1]
+                values[bucket_index - count + 1 : bucket_index + 1] = stored_values
+            bucket_index -= count
+
+        # In case we still haven't finished initializing all buckets and there is
+        # another stored bucket, initialize from there
+        if first_time and bucket_index >= 0 and base_time > first_time:
+            first_length = len(aggregation_bucket_initial_data[first_time])
+            count = min(first_length, bucket_index + 1)
+            for aggregation_name, values in self._values.items():
+                stored_values = data[aggregation_name][first_time][first_length - count : first_length]
+                values[bucket_index - count + 1 : bucket_index + 1] = stored_values
+
+
+class TieredAggregationBuckets:
+    """Aggregation buckets of sliding windows whose data is rolled up into tiers of coarser buckets (see
+    SlidingWindows.get_tiers), so that a long window (e.g. 30d alongside 1h) is kept in far fewer buckets than it spans
+    at the period of the windows. Each tier keeps the buckets of its longest window and one more. Buckets at the period
+    of the windows are only kept for the windows of the tier with that period, if there is one, and for one bucket of
+    the coarsest tier, which covers the end of the windows of the other tiers. All of them also keep one more bucket of
+    the coarsest tier for events that arrive after later events. An event that arrives later than that may no longer
+    be covered by the buckets of some tiers, whose windows then leave it out.
+
+    A window ends at the end of the bucket of its event, at the period of the windows, as in AggregationBuckets. A
+    window of a tier with a coarser period starts at the start of the bucket of its tier in which it would otherwise
+    start, so it may be longer by less than one period of its tier.
+
+    The aggregates of the whole buckets of the tier that each window spans are updated as events are aggregated, and
+    are only recalculated from the buckets of the tier when the window moves to the next bucket of the tier. They are
+    combined with the bucket of the tier in which the window ends, or, if it holds events that are later than the
+    window, with the buckets at the period of the windows that the window spans in it.
+
+    Fixed windows, windows with a max_value, which caps the aggregates as buckets are added up one after the other, and
+    aggregates with first, last or approximate aggregates, are calculated by the buckets at the period of the windows
+    alone, like AggregationBuckets.
+
+    Pending data is kept, and stored data is read, at the period of the windows, so that the stored data is the same
+    as that of AggregationBuckets. Stored data is rolled up into the buckets of each tier when it is loaded.
+
+    Takes the same parameters as AggregationBuckets, and tier_class, the class of the buckets of each tier.
+    """
+
+    def __init__(
+        self,
+        name,
+        explicit_raw_aggregations,
+        hidden_raw_aggregations,
+        virtual_aggregations,
+        explicit_windows,
+        base_time,
+        max_value,
+        key,
+        initial_data=None,
+        persist_func=None,
+        approximate_aggregations=None,
+        initial_sketches=None,
+        tier_class=AggregationBuckets,
+    ):
+        self.key = key
+        self.name = name
+        self.explicit_windows = explicit_windows
+        self.max_value = max_value
+        self.should_persist = True
+        self.pending_aggr = {}
+        self.storage_specific_cache = {}
+        self.max_window_millis = explicit_windows.max_window_millis
+        self.total_number_of_buckets = explicit_windows.total_number_of_buckets
+        self.period_millis = explicit_windows.period_millis
+        self._virtual_aggregations = virtual_aggregations
+
+        if initial_data:
+            for key, value in next(iter(initial_data.values())).items():
+                if not isinstance(key, int):
+                    self.storage_specific_cache[key] = value
+
+        tiers = []
+        all_aggregations = set(explicit_raw_aggregations) | set(hidden_raw_aggregations)
+        # AggregationBuckets calculate first and last differently depending on whether they update their pre-aggregates
+        # or recalculate them, which the tiers cannot reproduce
+        if (
+            isinstance(explicit_windows, SlidingWindows)
+            and max_value is None
+            and not approximate_aggregations
+            and "first" not in all_aggregations
+            and "last" not in all_aggregations
+        ):
+            tiers = explicit_windows.get_tiers()
+        coarse_tiers = [windows for windows in tiers if windows.period_millis > self.period_millis]
+
+        # Buckets at the period of the windows
+        buckets_windows = explicit_windows
+        if coarse_tiers:
+            # Buckets are kept for events that arrive up to one period of the coarsest tier after later events
+            lateness_millis = max(windows.period_millis for windows in coarse_tiers)
+            span_millis = lateness_millis
+            if coarse_tiers[0] is not tiers[0]:
+                span_millis = max(span_millis, tiers[0].max_window_millis)
+            buckets_windows = _sliding_windows(self.period_millis, [(int(span_millis + lateness_millis), "span")])
+        self._buckets = tier_class(
+            name,
+            explicit_raw_aggregations.copy(),
+            hidden_raw_aggregations.copy(),
+            virtual_aggregations,
+            buckets_windows,
+            base_time,
+            max_value,
+            key,
+            initial_data,
+            persist_func,
+            approximate_aggregations,
+            initial_sketches=initial_sketches,
+        )
+        # Pending data is kept by the tiered buckets
+        self._buckets.should_persist = False
+        self._explicit_raw_aggregations = self._buckets._explicit_raw_aggregations
+        self._all_raw_aggregates = self._buckets._all_raw_aggregates
+
+        # The buckets of each tier, with the windows that they calculate
+        self._tiers = []
+        # The aggregates of the whole buckets of each window, by tier index and window, with the time at which they end
+        # and the start time of the buckets of the tier when they were calculated
+        self._window_values = {}
+        # The latest time of an aggregated event
+        self._latest_timestamp = -math.inf
+        if coarse_tiers:
+            for windows in tiers:
+                if windows.period_millis == self.period_millis:
+                    tier = self._buckets
+                else:
+                    # A window may start in the bucket before those that it spans
+                    span_millis = windows.max_window_millis + windows.period_millis
+                    span_millis += math.ceil(lateness_millis / windows.period_millis) * windows.period_millis
+                    tier_windows = _sliding_windows(windows.period_millis, [(int(span_millis), "span")])
+                    tier = tier_class(
+                        name,
+                        explicit_raw_aggregations.copy(),
+                        hidden_raw_aggregations.copy(),
+                        virtual_aggregations,
+                        tier_windows,
+                        base_time,
+                        max_value,
+                        key,
+                        self._roll_up(initial_data, windows.period_millis) if initial_data else None,
+                        persist_func,
+                    )
+                    tier.should_persist = False
+                # Features are calculated from the buckets of the tiers, so they need no pre-aggregates of their own
+                tier._precalculated_aggregations = False
+                self._tiers.append((tier, windows.windows))
+            self._buckets._precalculated_aggregations = False
+            self._longest_tier = max(self._tiers, key=lambda tier_and_windows: tier_and_windows[1][-1][0])[0]
+
+    # Rolls up stored data, which is kept at the period of the windows, into a single array at the given period
+    def _roll_up(self, data, period_millis):
+        rolled_up_data = {}
+        for aggregation_name, stored_data in data.items():
+            aggregation = "sum" if aggregation_name == "count" or aggregation_name == "sqr" else aggregation_name
+            values_by_time = {}
+            for stored_time in sorted(key for key in stored_data if isinstance(key, int)):
+                for index, value in enumerate(stored_data[stored_time]):
+                    bucket_start_time = stored_time + index * self.period_millis
+                    rolled_up_time = int(bucket_start_time / period_millis) * period_millis
+                    if rolled_up_time not in values_by_time:
+                        values_by_time[rolled_up_time] = AggregationValue.new_from_name(aggregation, self.max_value)
+                    values_by_time[rolled_up_time].aggregate(bucket_start_time, value)
+            first_time = min(values_by_time)
+            default_value = AggregationValue.new_from_name(aggregation).default_value
+            values = [default_value] * (int((max(values_by_time) - first_time) / period_millis) + 1)
+            for rolled_up_time, aggregation_value in values_by_time.items():
+                values[int((rolled_up_time - first_time) / period_millis)] = aggregation_value.value
+            rolled_up_data[aggregation_name] = {first_time: values}
+        return rolled_up_data
+
+    async def aggregate(self, timestamp, value):
+        await self._buckets.aggregate(timestamp, value)
+        if not self._tiers:
+            # Events that are too old for the buckets are not aggregated, as in AggregationBuckets
+            if self._buckets.get_bucket_index_by_timestamp(timestamp) >= 0:
+                self.add_to_pending(timestamp, value)
+            return
+
+        for tier, _ in self._tiers:
+            if tier is not self._buckets:
+                await tier.aggregate(timestamp, value)
+        # Events that are too old for the longest window are not aggregated
+        if self._longest_tier.get_bucket_index_by_timestamp(timestamp) < 0:
+            return
+        self._latest_timestamp = max(self._latest_timestamp, timestamp)
+        for (tier_index, _), (start_time, end_time, _, values) in self._window_values.items():
+            tier = self._tiers[tier_index][0]
+            if start_time <= timestamp < end_time and tier.get_bucket_index_by_timestamp(timestamp) >= 0:
+                self._aggregate_event(values, timestamp, value)
+        self.add_to_pending(timestamp, value)
+
+    @staticmethod
+    def _aggregate_event(values, timestamp, value):
+        for aggregation_name, current_value in values.items():
+            if aggregation_name == "count":
+                values[aggregation_name] = current_value + 1
+            elif aggregation_name == "sqr":
+                values[aggregation_name] = current_value + value * value
+            else:
+                values[aggregation_name] = TieredAggregationBuckets._combine(aggregation_name, current_value, value)
+
+    # Combines the aggregates of two ranges of buckets
+    @staticmethod
+    def _combine(aggregation_name, value, other_value):
+        if aggregation_name == "min":
+            return other_value if other_value < value else value
+        if aggregation_name == "max":
+            return other_value if other_value > value else value
+        return value + other_value
+
+    def add_to_pending(self, timestamp, value):
+        bucket_start_time = int(timestamp / self.period_millis) * self.period_millis
+        if bucket_start_time not in self.pending_aggr:
+            self.pending_aggr[bucket_start_time] = self._buckets.new_aggregation_value()
+
+        for aggr in self.pending_aggr[bucket_start_time].values():
+            aggr.aggregate(timestamp, value)
+
+    # Returns the aggregates of the buckets that cover the given time range
+    def _aggregate_time_range(self, buckets, start_time, end_time):
+        for aggregation_name in self._all_raw_aggregates:
+            buckets._intermediate_aggregation_values[aggregation_name].reset()
+        if start_time < end_time:
+            first_bucket_index = max(buckets.get_bucket_index_by_timestamp(start_time), 0)
+            last_bucket_index = buckets.get_bucket_index_by_timestamp(end_time) - 1
+            buckets._aggregate_buckets(first_bucket_index, last_bucket_index)
+        return {
+            aggregation_name: buckets._intermediate_aggregation_values[aggregation_name].value
+            for aggregation_name in self._all_raw_aggregates
+        }
+
+    # Returns the aggregates of the end of the windows of a tier, from the start of the bucket of the tier in which they
+    # end
+    def _get_window_end_values(self, tier, tier_end_time, window_end_time):
+        if tier_end_time >= window_end_time:
+            return None
+        if self._latest_timestamp < window_end_time or tier_end_time < self._buckets.first_bucket_start_time:
+            # The bucket of the tier holds nothing after the end of the windows
+            bucket_index = tier.get_bucket_index_by_timestamp(tier_end_time)
+            if 0 <= bucket_index < tier.total_number_of_buckets:
+                return {
+                    aggregation_name: tier._get_bucket_value(bucket_index, aggregation_name)
+                    for aggregation_name in self._all_raw_aggregates
+                }
+            return None
+        return self._aggregate_time_range(self._buckets, tier_end_time, window_end_time)
+
+    # Returns the aggregates of the whole buckets of the tier that a window spans until the given time
+    def _get_window_values(self, tier_index, window_millis, tier_end_time):
+        tier = self._tiers[tier_index][0]
+        window_values = self._window_values.get((tier_index, window_millis))
+        if (
+            window_values is None
+            or window_values[1] != tier_end_time
+            or window_values[2] != tier.first_bucket_start_time
+        ):
+            start_time = tier_end_time - window_millis
+            values = self._aggregate_time_range(tier, start_time, tier_end_time)
+            window_values = (start_time, tier_end_time, tier.first_bucket_start_time, values)
+            self._window_values[(tier_index, window_millis)] = window_values
+        return window_values[3]
+
+    def get_features(self, timestamp):
+        if not self._tiers:
+            return self._buckets.get_features(timestamp)
+
+        result = {}
+        if self._longest_tier.get_bucket_index_by_timestamp(timestamp) < 0:
+            return result
+
+        window_end_time = (int(timestamp / self.period_millis) + 1) * self.period_millis
+        for tier_index, (tier, windows) in enumerate(self._tiers):
+            tier_end_time = int(window_end_time / tier.period_millis) * tier.period_millis
+            end_values = self._get_window_end_values(tier, tier_end_time, window_end_time)
+            for window_millis, window_str in windows:
+                values = self._get_window_values(tier_index, window_millis, tier_end_time)
+                if end_values is not None:
+                    values = {
+                        aggregation_name: self._combine(aggregation_name, value, end_values[aggregation_name])
+                        for aggregation_name, value in values.items()
+                    }
+
+                for aggregation_name in self._explicit_raw_aggregations:
+                    value = values[aggregation_name]
+                    if value == math.inf or value == -math.inf:
+                        value = math.nan
+                    if values["count"] == 0 and aggregation_name != "count":
+                        value = math.nan
+                    result[f"{self.name}_{aggregation_name}_{window_str}"] = value
+                for aggregation in self._virtual_aggregations:
+                    args = [values[aggregation_name] for aggregation_name in aggregation.dependant_aggregates]
+                    result[f"{self.name}_{aggregation.name}_{window_str}"] = aggregation.aggregation_func(args)
+        return result
+
+    def get_serialized_sketches(self, bucket_start_time):
+        return self._buckets.get_serialized_sketches(bucket_start_time)
+
+    def get_and_flush_pending(self):
+        pending = self.pending_aggr
+        self.pending_aggr = {}
+        return pending
+
+
 class VirtualAggregation:
     def __init__(self, aggregation, dependant_aggregates):
         self.name = aggregation
@@ -35,6 +35,7 @@ import xxhash
 from . import Driver
 from .dtypes import Event, V3ioError
 from .flow import Flow, _Batching, _split_path, _termination_obj
+from .shared_memory import SharedMemoryRingBuffer
 from .table import Table, _PersistJob
 from .utils import stringify_key, url_to_file_system
 
@@ -60,6 +61,9 @@ class _Writer:
         index_cols = [index_cols] if isinstance(index_cols, str) else index_cols
         self._retain_dict = retain_dict
         self._storage_options = storage_options
+        if time_field is not None or partition_cols:
+            # Time fields are parsed, and partition columns are removed from list bodies, in place
+            self._read_only = False
 
         self._field_extractor = lambda event_body, field_name: event_body.get(field_name)
         self._write_missing_fields = False
@@ -395,6 +399,8 @@ class CSVTarget(_Batching, _Writer):
     :type storage_options: dict
     """
 
+    _read_only = True
+
     def __init__(
         self,
         path: str,
@@ -526,6 +532,8 @@ class ParquetTarget(_Batching, _Writer):
     :type storage_options: dict
     """
 
+    _read_only = True
+
     def __init__(
         self,
         path: str,
@@ -694,6 +702,8 @@ class TSDBTarget(_Batching, _Writer):
     :type storage_options: dict
     """
 
+    _read_only = True
+
     def __init__(
         self,
         path: str,
@@ -807,6 +817,8 @@ class TDEngineTarget(_Batching, _Writer):
     :type flush_after_seconds: int
     """
 
+    _read_only = True
+
     def __init__(
         self,
         url: str,
@@ -987,6 +999,8 @@ class StreamTarget(Flow, _Writer):
     :type storage_options: dict
     """
 
+    _read_only = True
+
     def __init__(
         self,
         storage: Driver,
@@ -1008,6 +1022,7 @@ class StreamTarget(Flow, _Writer):
             kwargs["infer_columns_from_data"] = infer_columns_from_data
         Flow.__init__(self, **kwargs)
         _Writer.__init__(self, columns, infer_columns_from_data, retain_dict=True)
+        self._register_queue_metrics(self.name, lambda: getattr(self, "_q", None))
 
         self._storage = storage
 
@@ -1200,6 +1215,8 @@ class KafkaTarget(Flow, _Writer):
     :param full_event: Enable metadata wrapper for serialized event. Defaults to False.
     """
 
+    _read_only = True
+
     def __init__(
         self,
         brokers: Union[str, List[str]],
@@ -1298,6 +1315,8 @@ class NoSqlTarget(_Writer, Flow):
     :type storage_options: dict
     """
 
+    _read_only = True
+
     def __init__(
         self,
         table: Union[Table, str],
@@ -1318,6 +1337,7 @@ class NoSqlTarget(_Writer, Flow):
                 raise TypeError("Table can not be string if no context was provided to the step")
             self._table = self.context.get_table(table)
         self._closeables = [self._table]
+        self._register_queue_metrics(f"{self.name}.table", lambda: self._table._q)
 
         self._field_extractor = lambda event_body, field_name: event_body.get(field_name)
         self._write_missing_fields = False
@@ -1348,3 +1368,37 @@ class NoSqlTarget(_Writer, Flow):
                 self._table._pending_events.append(event)
             self._table._init_flush_task()
             await self._do_downstream(event)
+
+
+class SharedMemoryTarget(_Batching):
+    """Writes batches of events to a shared memory ring buffer, to be read by a SharedMemorySource in another process.
+    Events are passed on to the next step (if any) after being added to a batch. Event bodies must be dictionaries.
+
+    :param ring_buffer: The ring buffer to write to.
+    :type ring_buffer: SharedMemoryRingBuffer
+    :param max_events: Maximum number of events to write at a time. Defaults to 1000.
+    :type max_events: int
+    :param flush_after_seconds: Maximum number of seconds to hold events before they are written. Defaults to 1.
+    :type flush_after_seconds: int
+    """
+
+    _read_only = True
+
+    def __init__(
+        self,
+        ring_buffer: SharedMemoryRingBuffer,
+        max_events: int = 1000,
+        flush_after_seconds: Union[int, float] = 1,
+        **kwargs,
+    ):
+        _Batching.__init__(self, max_events=max_events, flush_after_seconds=flush_after_seconds, **kwargs)
+        self._ring_buffer = ring_buffer
+
+    def _event_to_batch_entry(self, event):
+        return event
+
+    async def _emit(self, batch, batch_key, batch_time, batch_events, last_event_time=None):
+        await self._ring_buffer.write(batch)
+
+    async def _terminate(self):
+        await self._ring_buffer.write_end_of_stream()
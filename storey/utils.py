@@ -23,6 +23,8 @@ import fsspec
 
 bucketPerWindow = 2
 schema_file_name = ".schema"
+# Name under which drivers return the serialized sketches of a feature, as if it were one of its aggregates
+sketches_aggregation_name = "sketches"
 
 
 def parse_duration(string_time):
@@ -12,29 +12,43 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import asyncio
 import math
 import queue
+import random
 from datetime import datetime, timedelta, timezone
 
 import pandas as pd
+import pyarrow
 import pytest
 
 from storey import (
     AggregateByKey,
+    AsyncEmitSource,
     DataframeSource,
+    Event,
     FieldAggregator,
     NoopDriver,
     Reduce,
     SyncEmitSource,
     Table,
+    aggregate_dataframe,
     build_flow,
 )
 from storey.dtypes import (
+    EmissionType,
     EmitAfterMaxEvent,
+    EmitAfterPeriod,
     EmitEveryEvent,
     FixedWindows,
+    LateDataHandling,
     SlidingWindows,
 )
+from storey.table import (
+    AggregationBuckets,
+    NumpyAggregationBuckets,
+    TieredAggregationBuckets,
+)
 
 test_base_time = datetime.fromisoformat("2020-07-21T21:40:00+00:00")
 
@@ -3977,3 +3991,592 @@ def test_fixed_window_aggregation_with_first_and_last_aggregates(timestamp):
     assert (
         termination_result == expected
     ), f"actual did not match expected. \n actual: {termination_result} \n expected: {expected}"
+
+
+async def _async_aggregate_with_idle_keys(table, events):
+    controller = build_flow(
+        [
+            AsyncEmitSource(),
+            AggregateByKey(
+                [FieldAggregator("number_of_stuff", "col1", ["sum", "count"], SlidingWindows(["1h"], "10m"))],
+                table,
+                time_field="time",
+            ),
+            Reduce([], append_return),
+        ]
+    ).run()
+
+    for key, minutes in events:
+        await controller.emit({"col1": 1, "time": test_base_time + timedelta(minutes=minutes)}, key)
+
+    await controller.terminate()
+    termination_result = await controller.await_termination()
+    # Let the keys that were written to storage for eviction be evicted
+    await table._terminate()
+    return termination_result
+
+
+@pytest.mark.parametrize("expire_idle_keys", [False, True])
+def test_aggregation_expires_idle_keys(expire_idle_keys):
+    table = Table("test", NoopDriver(), expire_idle_keys=expire_idle_keys)
+    events = [("a", 0), ("b", 10), ("a", 20), ("b", 100), ("c", 200), ("a", 210)]
+    termination_result = asyncio.run(_async_aggregate_with_idle_keys(table, events))
+
+    assert [result["number_of_stuff_count_1h"] for result in termination_result] == [1, 1, 2, 1, 1, 1]
+    assert [result["number_of_stuff_sum_1h"] for result in termination_result] == [1, 1, 2, 1, 1, 1]
+    if expire_idle_keys:
+        assert sorted(table._get_keys()) == ["a", "c"]
+    else:
+        assert sorted(table._get_keys()) == ["a", "b", "c"]
+
+
+def test_aggregation_checks_idle_keys_once():
+    table = Table("test", NoopDriver(), expire_idle_keys=True)
+    evict_idle_key = table._evict_idle_key
+    eviction_attempts = []
+
+    def record_eviction_attempt(key):
+        eviction_attempts.append(key)
+        return evict_idle_key(key)
+
+    table._evict_idle_key = record_eviction_attempt
+    events = [("b", 0)] + [("a", minutes) for minutes in range(0, 1200, 5)]
+    asyncio.run(_async_aggregate_with_idle_keys(table, events))
+
+    # b is checked when it becomes idle, and again only once it has been written to storage, rather than on every event
+    assert set(eviction_attempts) == {"b"}
+    assert len(eviction_attempts) <= 3
+    assert table._get_keys() == ["a"]
+
+
+async def _async_emit_after_period_incrementally(columnar):
+    aggregate_by_key = AggregateByKey(
+        [FieldAggregator("number_of_stuff", "col1", ["count"], SlidingWindows(["1h"], "10m"))],
+        Table("test", NoopDriver()),
+        time_field="time",
+        # The delay keeps the emission worker from emitting by itself during the test
+        emit_policy=EmitAfterPeriod(delay_in_seconds=3600, emission_type=EmissionType.Incremental, columnar=columnar),
+    )
+    controller = build_flow([AsyncEmitSource(), aggregate_by_key, Reduce([], append_return)]).run()
+
+    def to_millis(minutes):
+        return (test_base_time + timedelta(minutes=minutes)).timestamp() * 1000
+
+    # Events are passed to the step directly, so that they are aggregated before emitting
+    for key, minutes in [("a", 0), ("b", 5), ("c", 10)]:
+        await aggregate_by_key._do(Event({"col1": 1, "time": to_millis(minutes)}, key))
+    await aggregate_by_key._emit_all_events(to_millis(10))
+    await aggregate_by_key._do(Event({"col1": 1, "time": to_millis(15)}, "a"))
+    # The windows of b pass at 75m, of c at 80m, and of a at 85m
+    for minutes in [20, 80, 90, 100]:
+        await aggregate_by_key._emit_all_events(to_millis(minutes))
+
+    await controller.terminate()
+    return await controller.await_termination()
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_emit_after_period_incrementally(columnar):
+    termination_result = asyncio.run(_async_emit_after_period_incrementally(columnar))
+
+    expected_keys = [["a", "b", "c"], ["a", "b", "c"], ["a", "b", "c"], ["a"]]
+    expected_counts = [[1, 1, 1], [2, 1, 1], [2, 1, 1], [2]]
+    if columnar:
+        assert [result["key"] for result in termination_result] == expected_keys
+        assert [result["number_of_stuff_count_1h"] for result in termination_result] == expected_counts
+    else:
+        assert [result["key"] for result in termination_result] == sum(expected_keys, [])
+        assert [result["number_of_stuff_count_1h"] for result in termination_result] == sum(expected_counts, [])
+
+
+@pytest.mark.parametrize("late_data_handling", list(LateDataHandling))
+def test_emit_after_period_by_watermark(late_data_handling):
+    controller = build_flow(
+        [
+            SyncEmitSource(),
+            AggregateByKey(
+                [FieldAggregator("number_of_stuff", "col1", ["count"], SlidingWindows(["1h"], "10m"))],
+                Table("test", NoopDriver()),
+                time_field="time",
+                emit_policy=EmitAfterPeriod(),
+                allowed_lateness_secs=0,
+                late_data_handling=late_data_handling,
+            ),
+            Reduce([], append_return),
+        ]
+    ).run()
+
+    # Periods are emitted as the events pass their ends, regardless of the wall clock
+    for key, minutes in [("a", 0), ("b", 5), ("a", 12), ("a", 25), ("b", 41)]:
+        controller.emit({"col1": 1, "time": test_base_time + timedelta(minutes=minutes)}, key)
+
+    controller.terminate()
+    termination_result = controller.await_termination()
+
+    emit_times = [
+        (test_base_time + timedelta(minutes=minutes)).timestamp() * 1000 for minutes in [10, 10, 20, 20, 30, 30, 40, 40]
+    ]
+    assert [result["time"] for result in termination_result] == emit_times
+    assert [result["key"] for result in termination_result] == ["a", "b"] * 4
+    assert [result["number_of_stuff_count_1h"] for result in termination_result] == [1, 1, 2, 1, 3, 1, 3, 1]
+
+
+@pytest.mark.parametrize("late_data_handling", list(LateDataHandling))
+def test_emit_after_period_by_watermark_with_lateness(late_data_handling):
+    controller = build_flow(
+        [
+            SyncEmitSource(),
+            AggregateByKey(
+                [FieldAggregator("number_of_stuff", "col1", ["count"], SlidingWindows(["1h"], "10m"))],
+                Table("test", NoopDriver()),
+                time_field="time",
+                emit_policy=EmitAfterPeriod(),
+                allowed_lateness_secs=1800,
+                late_data_handling=late_data_handling,
+            ),
+            Reduce([], append_return),
+        ]
+    ).run()
+
+    # Each period is emitted before the events that arrived while it was waiting for the watermark are aggregated
+    for minutes in [0, 5, 10, 20, 30, 40, 50]:
+        controller.emit({"col1": 1, "time": test_base_time + timedelta(minutes=minutes)}, "tal")
+
+    controller.terminate()
+    termination_result = controller.await_termination()
+
+    emit_times = [(test_base_time + timedelta(minutes=minutes)).timestamp() * 1000 for minutes in [10, 20, 30, 40, 50]]
+    assert [result["time"] for result in termination_result] == emit_times
+    assert [result["number_of_stuff_count_1h"] for result in termination_result] == [2, 3, 4, 5, 6]
+
+
+@pytest.mark.parametrize(
+    "late_data_handling,expected_minutes",
+    [
+        (LateDataHandling.Nothing, [0, 15, 8, 30, 3, 25]),
+        (LateDataHandling.Drop, [0, 15, 8, 30, 25]),
+        # Events that are at most 10 minutes late are sorted, while later ones are aggregated as they arrive
+        (LateDataHandling.Sort_before_emit, [0, 8, 15, 3, 25, 30]),
+    ],
+)
+def test_late_data_handling(late_data_handling, expected_minutes):
+    controller = build_flow(
+        [
+            SyncEmitSource(),
+            AggregateByKey(
+                [FieldAggregator("number_of_stuff", "col1", ["count"], SlidingWindows(["1h"], "10m"))],
+                Table("test", NoopDriver()),
+                time_field="time",
+                allowed_lateness_secs=600,
+                late_data_handling=late_data_handling,
+            ),
+            Reduce([], append_return),
+        ]
+    ).run()
+
+    for minutes in [0, 15, 8, 30, 3, 25]:
+        controller.emit({"col1": 1, "time": test_base_time + timedelta(minutes=minutes)}, "tal")
+
+    controller.terminate()
+    termination_result = controller.await_termination()
+
+    assert [result["time"] for result in termination_result] == [
+        test_base_time + timedelta(minutes=minutes) for minutes in expected_minutes
+    ]
+
+
+def test_late_data_handling_requires_allowed_lateness():
+    with pytest.raises(ValueError):
+        AggregateByKey(
+            [FieldAggregator("number_of_stuff", "col1", ["count"], SlidingWindows(["1h"], "10m"))],
+            Table("test", NoopDriver()),
+            late_data_handling=LateDataHandling.Drop,
+        )
+
+
+def _aggregate_with_backend(
+    aggregation_backend, windows, max_value, events, tiered_aggregation_buckets=False, first_and_last=True
+):
+    aggregations = ["sum", "min", "max", "count", "sqr"]
+    if first_and_last:
+        aggregations += ["first", "last"]
+    if max_value is None:
+        aggregations += ["avg", "stddev"]
+    controller = build_flow(
+        [
+            SyncEmitSource(),
+            AggregateByKey(
+                [
+                    FieldAggregator(
+                        "number_of_stuff",
+                        "col1",
+                        aggregations,
+                        windows,
+                        max_value=max_value,
+                    )
+                ],
+                Table(
+                    "test",
+                    NoopDriver(),
+                    aggregation_backend=aggregation_backend,
+                    tiered_aggregation_buckets=tiered_aggregation_buckets,
+                ),
+                time_field="time",
+            ),
+            Reduce([], append_return),
+        ]
+    ).run()
+
+    for key, minutes, value in events:
+        controller.emit({"col1": value, "time": test_base_time + timedelta(minutes=minutes)}, key)
+
+    controller.terminate()
+    return controller.await_termination()
+
+
+@pytest.mark.parametrize(
+    "windows",
+    [lambda: SlidingWindows(["1h", "2h", "24h"], "10m"), lambda: FixedWindows(["15m", "1h", "3h"])],
+)
+@pytest.mark.parametrize("max_value", [None, 50])
+def test_numpy_aggregation_backend(windows, max_value):
+    events = []
+    for i in range(200):
+        # Events arrive slightly out of order, and sometimes after a long gap
+        minutes = 7 * i - 3 * (i % 4) + (600 if i > 150 else 0)
+        events.append((f"key{i % 3}", minutes, (i * 37 % 23) - 5.5))
+
+    expected = _aggregate_with_backend("python", windows(), max_value, events)
+    actual = _aggregate_with_backend("numpy", windows(), max_value, events)
+
+    assert len(actual) == len(expected)
+    for actual_features, expected_features in zip(actual, expected):
+        assert actual_features.keys() == expected_features.keys()
+        for name, expected_value in expected_features.items():
+            if isinstance(expected_value, float) and math.isnan(expected_value):
+                assert math.isnan(actual_features[name]), name
+            else:
+                assert actual_features[name] == expected_value, name
+
+
+def test_sliding_windows_tiers():
+    tiers = SlidingWindows(["1h", "2h", "1d", "30d"], "10m").get_tiers()
+    assert [(tier.period_millis, tier.windows) for tier in tiers] == [
+        (30 * 60 * 1000, [(3600000, "1h"), (7200000, "2h")]),
+        (12 * 3600 * 1000, [(86400000, "1d"), (2592000000, "30d")]),
+    ]
+    assert [tier.total_number_of_buckets for tier in tiers] == [4, 60]
+
+
+def _tiered_events():
+    events = []
+    for i in range(300):
+        # Events arrive slightly out of order, and sometimes after a long gap
+        minutes = 13 * i - 11 * (i % 4) + (3000 if i > 250 else 0)
+        events.append((f"key{i % 3}", minutes, (i * 37 % 23) - 5.5))
+    return events
+
+
+@pytest.mark.parametrize("aggregation_backend", ["python", "numpy"])
+@pytest.mark.parametrize("windows", [["1h", "2h", "1d", "2d"], ["20m", "1h", "30d"]])
+def test_tiered_aggregation_buckets(aggregation_backend, windows):
+    events = _tiered_events()
+    sliding_windows = SlidingWindows(windows, "10m")
+    actual = _aggregate_with_backend(aggregation_backend, sliding_windows, None, events, True, False)
+
+    # A window ends at the end of the bucket of its event, and starts at the start of the bucket of its tier in which it
+    # would otherwise start
+    tier_periods = {
+        window_millis: tier.period_millis for tier in sliding_windows.get_tiers() for window_millis, _ in tier.windows
+    }
+    base_time_millis = test_base_time.timestamp() * 1000
+    for i, ((key, minutes, _), features) in enumerate(zip(events, actual)):
+        window_end_time = (int((base_time_millis + minutes * 60000) / 600000) + 1) * 600000
+        for window_millis, window_str in sliding_windows.windows:
+            tier_period_millis = tier_periods[window_millis]
+            window_start_time = int(window_end_time / tier_period_millis) * tier_period_millis - window_millis
+            values = [
+                value
+                for event_key, event_minutes, value in events[: i + 1]
+                if event_key == key and window_start_time <= base_time_millis + event_minutes * 60000 < window_end_time
+            ]
+            assert features[f"number_of_stuff_count_{window_str}"] == len(values)
+            assert features[f"number_of_stuff_sum_{window_str}"] == pytest.approx(sum(values))
+            assert features[f"number_of_stuff_sqr_{window_str}"] == pytest.approx(
+                sum(value * value for value in values)
+            )
+            assert features[f"number_of_stuff_min_{window_str}"] == min(values)
+            assert features[f"number_of_stuff_max_{window_str}"] == max(values)
+            assert features[f"number_of_stuff_avg_{window_str}"] == pytest.approx(sum(values) / len(values))
+
+
+@pytest.mark.parametrize("aggregation_backend", ["python", "numpy"])
+@pytest.mark.parametrize("max_value, first_and_last", [(50, False), (None, True), (50, True)])
+def test_tiered_aggregation_buckets_without_tiers(aggregation_backend, max_value, first_and_last):
+    events = _tiered_events()
+    windows = ["1h", "2h", "1d", "2d"]
+
+    actual = _aggregate_with_backend(
+        aggregation_backend, SlidingWindows(windows, "10m"), max_value, events, True, first_and_last
+    )
+    # Windows with a max_value, and first and last, are calculated as they are without tiers
+    expected = _aggregate_with_backend(
+        "python", SlidingWindows(windows, "10m"), max_value, events, False, first_and_last
+    )
+
+    assert len(actual) == len(expected)
+    for actual_features, expected_features in zip(actual, expected):
+        assert actual_features.keys() == expected_features.keys()
+        for name, expected_value in expected_features.items():
+            if isinstance(expected_value, float) and math.isnan(expected_value):
+                assert math.isnan(actual_features[name]), name
+            elif isinstance(expected_value, float):
+                assert actual_features[name] == pytest.approx(expected_value), name
+            else:
+                assert actual_features[name] == expected_value, name
+
+
+@pytest.mark.parametrize("aggregation_backend", ["python", "numpy"])
+def test_tiered_aggregation_buckets_window_edges(aggregation_backend):
+    # The 1h window of the event at minute 153 would start at minute 100, in the middle of a bucket of its 30m tier,
+    # which starts at minute 80, so the window includes the event at minute 85
+    events = [("key", minutes, 1) for minutes in [45, 85, 100, 153]]
+    actual = _aggregate_with_backend(
+        aggregation_backend, SlidingWindows(["1h", "2h", "1d"], "10m"), None, events, True, False
+    )
+    assert [features["number_of_stuff_count_1h"] for features in actual] == [1, 2, 2, 3]
+    assert [features["number_of_stuff_count_2h"] for features in actual] == [1, 2, 3, 4]
+    assert [features["number_of_stuff_count_1d"] for features in actual] == [1, 2, 3, 4]
+
+
+@pytest.mark.parametrize("tier_class", [AggregationBuckets, NumpyAggregationBuckets])
+def test_tiered_aggregation_buckets_memory(tier_class):
+    windows = SlidingWindows(["1h", "30d"], "10m")
+    base_time = test_base_time.timestamp() * 1000
+    buckets = tier_class("number_of_stuff", ["count", "sum"], [], [], windows, base_time, None, "key")
+    tiered_buckets = TieredAggregationBuckets(
+        "number_of_stuff", ["count", "sum"], [], [], windows, base_time, None, "key", tier_class=tier_class
+    )
+
+    # Buckets at the period of the windows are kept for 12h and 12h more for late events, rather than for 30d
+    assert buckets.total_number_of_buckets == 4320
+    assert tiered_buckets._buckets.total_number_of_buckets == 144
+    number_of_buckets = tiered_buckets._buckets.total_number_of_buckets
+    for tier, _ in tiered_buckets._tiers:
+        number_of_buckets += tier.total_number_of_buckets
+    assert number_of_buckets < buckets.total_number_of_buckets / 10
+
+
+def test_bad_aggregation_backend():
+    with pytest.raises(ValueError):
+        Table("test", NoopDriver(), aggregation_backend="pandas")
+
+
+def test_sliding_window_min_max_without_recalculation(monkeypatch):
+    recalculations = []
+    calculate_features = AggregationBuckets.calculate_features
+
+    def counting_calculate_features(self, timestamp):
+        recalculations.append(timestamp)
+        return calculate_features(self, timestamp)
+
+    monkeypatch.setattr(AggregationBuckets, "calculate_features", counting_calculate_features)
+
+    controller = build_flow(
+        [
+            SyncEmitSource(),
+            AggregateByKey(
+                [FieldAggregator("number_of_stuff", "col1", ["min", "max"], SlidingWindows(["30m", "1h"], "10m"))],
+                Table("test", NoopDriver()),
+                time_field="time",
+            ),
+            Reduce([], append_return),
+        ]
+    ).run()
+
+    events = [(7 * i, (i * 37 % 23) - 11) for i in range(100)]
+    for minutes, value in events:
+        controller.emit({"col1": value, "time": test_base_time + timedelta(minutes=minutes)}, "tal")
+
+    controller.terminate()
+    termination_result = controller.await_termination()
+
+    for (minutes, _), features in zip(events, termination_result):
+        for window, window_str in [(30, "30m"), (60, "1h")]:
+            # A sliding window consists of whole buckets, the last of which contains the event
+            window_start = (minutes // 10) * 10 - window + 10
+            values = [value for event_minutes, value in events if window_start <= event_minutes <= minutes]
+            assert features[f"number_of_stuff_min_{window_str}"] == min(values)
+            assert features[f"number_of_stuff_max_{window_str}"] == max(values)
+    assert recalculations == []
+
+
+@pytest.mark.parametrize("aggregation_backend", ["python", "numpy"])
+def test_approximate_aggregations(aggregation_backend):
+    controller = build_flow(
+        [
+            SyncEmitSource(),
+            AggregateByKey(
+                [
+                    FieldAggregator(
+                        "number_of_stuff",
+                        "col1",
+                        ["count", "approx_distinct", "approx_p50", "approx_p100", "approx_top2"],
+                        SlidingWindows(["1h", "2h"], "10m"),
+                    )
+                ],
+                Table("test", NoopDriver(), aggregation_backend=aggregation_backend),
+                time_field="time",
+            ),
+            Reduce([], append_return),
+        ]
+    ).run()
+
+    values = [3, 1, 3, 5, 3, 1, 7, 9]
+    for i, value in enumerate(values):
+        controller.emit({"col1": value, "time": test_base_time + timedelta(minutes=20 * i)}, "tal")
+
+    controller.terminate()
+    termination_result = controller.await_termination()
+
+    # The 1h window of the last event holds the events of the last 60 minutes (the last 3 events), and the 2h window
+    # holds the last 6 events
+    last_result = termination_result[-1]
+    assert last_result["number_of_stuff_count_1h"] == 3
+    assert last_result["number_of_stuff_approx_distinct_1h"] == 3
+    assert last_result["number_of_stuff_approx_p50_1h"] == 7
+    assert last_result["number_of_stuff_approx_p100_1h"] == 9
+    assert last_result["number_of_stuff_count_2h"] == 6
+    assert last_result["number_of_stuff_approx_distinct_2h"] == 5
+    assert last_result["number_of_stuff_approx_p100_2h"] == 9
+    assert last_result["number_of_stuff_approx_top2_2h"][0] == 3
+
+    first_result = termination_result[0]
+    assert first_result["number_of_stuff_approx_distinct_1h"] == 1
+    assert first_result["number_of_stuff_approx_p50_2h"] == 3
+    assert first_result["number_of_stuff_approx_top2_2h"] == [3]
+
+
+def test_approximate_aggregations_fixed_windows():
+    controller = build_flow(
+        [
+            SyncEmitSource(),
+            AggregateByKey(
+                [
+                    FieldAggregator(
+                        "number_of_stuff",
+                        "col1",
+                        ["count", "approx_distinct", "approx_p100"],
+                        FixedWindows(["30m", "2h"]),
+                    )
+                ],
+                Table("test", NoopDriver()),
+                time_field="time",
+            ),
+            Reduce([], append_return),
+        ]
+    ).run()
+
+    for i in range(20):
+        controller.emit({"col1": i, "time": test_base_time + timedelta(minutes=13 * i)}, "tal")
+
+    controller.terminate()
+    termination_result = controller.await_termination()
+
+    # All values are distinct, so each window holds as many distinct values as events, the largest of which is the
+    # latest one
+    for i, result in enumerate(termination_result):
+        for window in ["30m", "2h"]:
+            assert result[f"number_of_stuff_approx_distinct_{window}"] == result[f"number_of_stuff_count_{window}"]
+            assert result[f"number_of_stuff_approx_p100_{window}"] == i
+
+
+def _offline_test_aggregates():
+    return [
+        FieldAggregator(
+            "number_of_stuff",
+            "col1",
+            ["count", "sum", "sqr", "min", "max", "last", "avg", "stddev", "stdvar"],
+            SlidingWindows(["1h", "2h", "24h"], "10m"),
+        ),
+        FieldAggregator("fixed_stuff", "col1", ["count", "sum", "max"], FixedWindows(["1h"])),
+        FieldAggregator(
+            "filtered_stuff",
+            lambda element: element["col1"] * 2,
+            ["sum", "min", "last"],
+            SlidingWindows(["30m"], "5m"),
+            aggr_filter=lambda element: element["col1"] > 0,
+        ),
+    ]
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+def test_aggregate_dataframe(arrow):
+    rows = []
+    for i in range(300):
+        # Events of each key arrive in time order, with gaps of various lengths
+        minutes = 7 * i + (i * 13 % 5) + (600 if i > 200 else 0)
+        rows.append(
+            {"key": f"key{i % 3}", "time": test_base_time + timedelta(minutes=minutes), "col1": (i * 37 % 23) - 5.5}
+        )
+    df = pd.DataFrame(rows)
+
+    controller = build_flow(
+        [
+            DataframeSource(df, key_field="key"),
+            AggregateByKey(_offline_test_aggregates(), Table("test", NoopDriver()), time_field="time"),
+            Reduce([], append_return),
+        ]
+    ).run()
+    expected = pd.DataFrame(controller.await_termination())
+
+    source = pyarrow.Table.from_pandas(df) if arrow else df
+    actual = aggregate_dataframe(source, _offline_test_aggregates(), "key", "time")
+    assert list(actual.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+    # The result follows the order of the rows, which does not affect the features
+    reversed_actual = aggregate_dataframe(df.iloc[::-1], _offline_test_aggregates(), "key", "time")
+    pd.testing.assert_frame_equal(reversed_actual.loc[df.index], actual)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_aggregate_dataframe_random(seed):
+    rng = random.Random(seed)
+    rows = []
+    minutes = 0
+    for _ in range(400):
+        # Many rows share their time, and times are sometimes far apart
+        minutes += rng.choice([0, 0, 1, 3, 7, 20, 90])
+        rows.append({"key": f"key{rng.randrange(4)}", "time": test_base_time + timedelta(minutes=minutes)})
+        rows[-1]["col1"] = rng.randint(-50, 50)
+    df = pd.DataFrame(rows)
+
+    aggregations = ["count", "sum", "min", "max", "first", "last", "avg", "stddev"]
+    aggregates = [
+        FieldAggregator("sliding", "col1", aggregations, SlidingWindows(["30m", "2h", "1d"], "10m")),
+        FieldAggregator("fixed", "col1", aggregations, FixedWindows(["30m", "2h", "1d"])),
+    ]
+    controller = build_flow(
+        [
+            DataframeSource(df, key_field="key"),
+            AggregateByKey(aggregates, Table("test", NoopDriver()), time_field="time"),
+            Reduce([], append_return),
+        ]
+    ).run()
+    expected = pd.DataFrame(controller.await_termination())
+
+    actual = aggregate_dataframe(df, aggregates, "key", "time")
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+def test_aggregate_dataframe_unsupported_aggregates():
+    df = pd.DataFrame({"key": ["tal"], "time": [test_base_time], "col1": [1]})
+    with pytest.raises(ValueError):
+        aggregate_dataframe(
+            df, [FieldAggregator("number_of_stuff", "col1", ["approx_p50"], FixedWindows(["1h"]))], "key", "time"
+        )
+    with pytest.raises(ValueError):
+        aggregate_dataframe(
+            df, [FieldAggregator("number_of_stuff", "col1", ["sum"], FixedWindows(["1h"]), max_value=5)], "key", "time"
+        )
@@ -1,10 +1,20 @@
 import asyncio
+import contextvars
+import functools
+import math
 import time
 
 import pytest
 
-from storey import AsyncEmitSource
-from storey.flow import ConcurrentExecution, Reduce, build_flow
+import storey.flow
+from storey import AsyncEmitSource, MetricsCollector
+from storey.flow import (
+    ConcurrentExecution,
+    Context,
+    Reduce,
+    _AdaptiveConcurrencyLimit,
+    build_flow,
+)
 from tests.test_flow import append_and_return
 
 event_processing_duration = 0.5
@@ -76,3 +86,187 @@ async def async_test_concurrent_execution(concurrency_mechanism, event_processor
 )
 def test_concurrent_execution(concurrency_mechanism, event_processor, pass_context):
     asyncio.run(async_test_concurrent_execution(concurrency_mechanism, event_processor, pass_context))
+
+
+async def process_event_sleep_by_body(event):
+    await asyncio.sleep(event.body["sleep"])
+    return event
+
+
+async def async_test_concurrent_execution_unordered(ordered):
+    controller = build_flow(
+        [
+            AsyncEmitSource(key_field="key"),
+            ConcurrentExecution(event_processor=process_event_sleep_by_body, max_in_flight=4, ordered=ordered),
+            Reduce([], lambda acc, x: append_and_return(acc, x["id"])),
+        ]
+    ).run()
+
+    # The first event of each key is the slowest
+    events = [
+        {"id": 0, "key": "a", "sleep": 0.3},
+        {"id": 1, "key": "b", "sleep": 0.2},
+        {"id": 2, "key": "a", "sleep": 0},
+        {"id": 3, "key": "b", "sleep": 0},
+    ]
+    for event in events:
+        await controller.emit(event)
+    await controller.terminate()
+    return await controller.await_termination()
+
+
+@pytest.mark.parametrize(
+    ["ordered", "expected"],
+    [(True, [0, 1, 2, 3]), (False, [2, 3, 1, 0]), ("key", [1, 3, 0, 2])],
+)
+def test_concurrent_execution_unordered(ordered, expected):
+    assert asyncio.run(async_test_concurrent_execution_unordered(ordered)) == expected
+
+
+async def async_test_concurrent_execution_unordered_max_in_flight():
+    in_flight = 0
+    max_seen = 0
+
+    async def process_event(event):
+        nonlocal in_flight, max_seen
+        in_flight += 1
+        max_seen = max(max_seen, in_flight)
+        await asyncio.sleep(0.01 * (event.body % 3))
+        in_flight -= 1
+        return event
+
+    controller = build_flow(
+        [
+            AsyncEmitSource(),
+            ConcurrentExecution(event_processor=process_event, max_in_flight=3, ordered=False),
+            Reduce([], append_and_return),
+        ]
+    ).run()
+    for i in range(20):
+        await controller.emit(i)
+    await controller.terminate()
+    result = await controller.await_termination()
+    assert sorted(result) == list(range(20))
+    assert max_seen == 3
+
+
+def test_concurrent_execution_unordered_max_in_flight():
+    asyncio.run(async_test_concurrent_execution_unordered_max_in_flight())
+
+
+async def async_test_concurrent_execution_unordered_error():
+    async def process_event(event):
+        if event.body == 2:
+            raise ValueError("test")
+        return event
+
+    controller = build_flow(
+        [
+            AsyncEmitSource(),
+            ConcurrentExecution(event_processor=process_event, max_in_flight=3, ordered=False),
+            Reduce([], append_and_return),
+        ]
+    ).run()
+    with pytest.raises(ValueError):
+        for i in range(5):
+            await controller.emit(i)
+        await controller.terminate()
+        await controller.await_termination()
+
+
+def test_concurrent_execution_unordered_error():
+    asyncio.run(async_test_concurrent_execution_unordered_error())
+
+
+def test_concurrent_execution_bad_ordered():
+    with pytest.raises(ValueError):
+        ConcurrentExecution(event_processor=process_event_sleep_by_body, ordered="yes")
+
+
+def test_adaptive_concurrency_limit():
+    limiter = _AdaptiveConcurrencyLimit(2, 32)
+    # While latency is stable, each completion moves the limit a fifth of the way to limit + sqrt(limit)
+    limits = []
+    for _ in range(60):
+        limiter.on_completed(0.01, int(limiter.limit))
+        limits.append(limiter.limit)
+    assert limits[0] == pytest.approx(2 * 0.8 + (2 + math.sqrt(2)) * 0.2)
+    assert limits[1] == pytest.approx(limits[0] * 0.8 + (limits[0] + math.sqrt(limits[0])) * 0.2)
+    assert limits.index(32) == 43
+    assert limits[43:] == [32] * 17
+
+    # A rise in latency shrinks the limit by the ratio of the long-term average to recent latency
+    limiter.on_completed(0.1, 32)
+    short_latency = 0.01 + (0.1 - 0.01) / 10
+    long_latency = 0.01 + (0.1 - 0.01) / 500
+    gradient = 1.5 * long_latency / short_latency
+    assert limiter.limit == pytest.approx(32 * 0.8 + (32 * gradient + math.sqrt(32)) * 0.2)
+
+    # Each failure shrinks the limit by 10%, down to its lower bound
+    limit = limiter.limit
+    for i in range(1, 28):
+        limiter.on_failed()
+        assert limiter.limit == pytest.approx(max(2, limit * 0.9**i))
+    assert limiter.limit == 2
+
+    # The limit does not change while it is not reached
+    limiter.on_completed(0.01, 0)
+    assert limiter.limit == 2
+
+
+async def async_test_concurrent_execution_adaptive_in_flight(ordered, monkeypatch):
+    in_flight = 0
+    max_seen = 0
+    # Latency is measured on a simulated clock that each job advances by its own latency, so that the limit does not
+    # depend on how the machine running the test schedules the jobs
+    job_time = contextvars.ContextVar("job_time", default=0.0)
+    monkeypatch.setattr(
+        storey.flow, "_AdaptiveConcurrencyLimit", functools.partial(_AdaptiveConcurrencyLimit, clock=job_time.get)
+    )
+
+    async def process_event(event):
+        nonlocal in_flight, max_seen
+        in_flight += 1
+        max_seen = max(max_seen, in_flight)
+        await asyncio.sleep(0)
+        # The backend slows down as concurrency grows beyond 4
+        job_time.set(job_time.get() + 0.005 * max(1, in_flight - 3) ** 2)
+        in_flight -= 1
+        return event
+
+    metrics = MetricsCollector()
+    controller = build_flow(
+        [
+            AsyncEmitSource(),
+            ConcurrentExecution(
+                event_processor=process_event,
+                min_in_flight=2,
+                max_in_flight=16,
+                ordered=ordered,
+                context=Context(metrics=metrics),
+            ),
+            Reduce([], append_and_return),
+        ]
+    ).run()
+    for i in range(300):
+        await controller.emit(i)
+    await controller.terminate()
+    result = await controller.await_termination()
+    in_flight_limit = metrics.snapshot()["gauges"]["ConcurrentExecution.in_flight_limit"]
+
+    assert sorted(result) == list(range(300))
+    # The limit grows from its lower bound until latency rises, and settles there rather than at its upper bound
+    assert in_flight_limit == 7
+    assert max_seen == 7
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_concurrent_execution_adaptive_in_flight(ordered, monkeypatch):
+    asyncio.run(async_test_concurrent_execution_adaptive_in_flight(ordered, monkeypatch))
+
+
+def test_concurrent_execution_bad_min_in_flight():
+    with pytest.raises(ValueError):
+        ConcurrentExecution(event_processor=process_event_sleep_by_body, min_in_flight=10)
+    with pytest.raises(ValueError):
+        ConcurrentExecution(event_processor=process_event_sleep_by_body, min_in_flight=0)
@@ -48,11 +48,13 @@ from storey import (
     Extend,
     Filter,
     FlatMap,
+    FlowError,
     HttpRequest,
     JoinWithTable,
     Map,
     MapClass,
     MapWithState,
+    MetricsCollector,
     NoopDriver,
     NoSqlTarget,
     ParquetSource,
@@ -62,6 +64,7 @@ from storey import (
     Reduce,
     ReduceToDataFrame,
     SendToHttp,
+    ShardedExecution,
     SQLSource,
     SyncEmitSource,
     Table,
@@ -70,7 +73,17 @@ from storey import (
     V3ioDriver,
     build_flow,
 )
-from storey.flow import Context, ReifyMetadata, Rename, _ConcurrentJobExecution
+from storey.flow import (
+    Context,
+    DropColumns,
+    ReifyMetadata,
+    Rename,
+    _ConcurrentJobExecution,
+    _Timers,
+)
+from storey.sources import AwaitableResult
+from storey.steps import ForEach
+from storey.table import _PersistJob
 
 
 class ATestException(Exception):
@@ -125,6 +138,278 @@ def test_pass_context_to_function():
     assert termination_result == 60
 
 
+def _micro_batch_steps():
+    return [
+        Map(lambda x: {"x": x}),
+        Filter(lambda x: x["x"] % 3 != 0),
+        FlatMap(lambda x: [x, {"x": x["x"] * 10}]),
+        Extend(lambda x: {"y": x["x"] + 1}),
+        Rename({"y": "z"}),
+        Reduce([], lambda acc, x: append_and_return(acc, (x["x"], x["z"]))),
+    ]
+
+
+@pytest.mark.parametrize("micro_batch_size", [1, 4, 100])
+def test_micro_batch_functional_flow(micro_batch_size):
+    controller = build_flow(
+        [SyncEmitSource(buffer_size=100, micro_batch_size=micro_batch_size)] + _micro_batch_steps()
+    ).run()
+
+    for i in range(100):
+        controller.emit(i)
+    controller.terminate()
+    termination_result = controller.await_termination()
+    expected = []
+    for i in range(100):
+        if i % 3 != 0:
+            expected.extend([(i, i + 1), (i * 10, i * 10 + 1)])
+    assert termination_result == expected
+
+
+async def async_test_micro_batch_functional_flow():
+    controller = build_flow([AsyncEmitSource(micro_batch_size=8)] + _micro_batch_steps()).run()
+
+    for i in range(100):
+        await controller.emit(i)
+    await controller.terminate()
+    termination_result = await controller.await_termination()
+    expected = []
+    for i in range(100):
+        if i % 3 != 0:
+            expected.extend([(i, i + 1), (i * 10, i * 10 + 1)])
+    assert termination_result == expected
+
+
+def test_async_micro_batch_functional_flow():
+    asyncio.run(async_test_micro_batch_functional_flow())
+
+
+def test_micro_batch_dataframe_source():
+    df = pd.DataFrame([[i] for i in range(10)], columns=["x"])
+    reduce = Reduce([], append_and_return)
+    controller = build_flow(
+        [
+            DataframeSource(df, micro_batch_size=3),
+            Map(lambda x: x["x"]),
+            Map(RaiseEx(5).raise_ex, recovery_step=reduce),
+            Map(lambda x: x * 10),
+            reduce,
+        ]
+    ).run()
+
+    termination_result = controller.await_termination()
+    # The failed event is routed to the recovery step, without being reordered relative to the rest of its batch
+    assert termination_result == [0, 10, 20, 30, 4, 50, 60, 70, 80, 90]
+
+
+def test_micro_batch_awaitable_result():
+    controller = build_flow([SyncEmitSource(micro_batch_size=8), Map(lambda x: x * 2), Complete()]).run()
+
+    awaitable_results = [controller.emit(i) for i in range(20)]
+    for i, awaitable_result in enumerate(awaitable_results):
+        assert awaitable_result.await_result() == i * 2
+    controller.terminate()
+    controller.await_termination()
+
+
+@pytest.mark.parametrize("micro_batch_size", [1, 7])
+@pytest.mark.parametrize("chunk_size", [None, 1, 10])
+def test_emit_many(micro_batch_size, chunk_size):
+    controller = build_flow(
+        [
+            SyncEmitSource(key_field="k", micro_batch_size=micro_batch_size),
+            Map(lambda x: x["n"]),
+            Reduce([], append_and_return, full_event=True),
+        ]
+    ).run()
+
+    assert controller.emit_many(({"k": f"key{i}", "n": i} for i in range(25)), chunk_size=chunk_size) is None
+    controller.emit({"k": "last", "n": 25})
+    controller.emit_many([])
+    controller.terminate()
+    termination_result = controller.await_termination()
+
+    assert [event.body for event in termination_result] == list(range(26))
+    assert [event.key for event in termination_result] == [f"key{i}" for i in range(25)] + ["last"]
+
+
+def test_emit_many_awaitable_results():
+    controller = build_flow([SyncEmitSource(), Map(lambda x: x * 2), Complete()]).run()
+
+    awaitable_results = controller.emit_many(range(20), chunk_size=8)
+    assert [awaitable_result.await_result() for awaitable_result in awaitable_results] == list(range(0, 40, 2))
+    controller.terminate()
+    controller.await_termination()
+
+
+@pytest.mark.parametrize("fail_before_return", [False, True])
+def test_emit_many_error(fail_before_return):
+    source = SyncEmitSource()
+    controller = build_flow([source, Map(RaiseEx(3).raise_ex), Complete()]).run()
+    if fail_before_return:
+        put = source._q.put
+
+        def put_and_wait_for_failure(chunk):
+            put(chunk)
+            while chunk[-1]._awaitable_result._error is None:
+                time.sleep(0.001)
+
+        source._q.put = put_and_wait_for_failure
+
+    # The error is reported through the results of the chunk's events rather than raised by emit_many, even if the
+    # flow fails on them before emit_many returns
+    awaitable_results = controller.emit_many(range(5))
+    if fail_before_return:
+        source._q.put = put
+    assert awaitable_results[0].await_result() == 0
+    assert awaitable_results[1].await_result() == 1
+    for awaitable_result in awaitable_results[2:]:
+        with pytest.raises(ATestException):
+            awaitable_result.await_result()
+    controller.terminate()
+    with pytest.raises(ATestException):
+        controller.await_termination()
+
+
+def test_emit_many_bad_chunk_size():
+    controller = build_flow([SyncEmitSource(), Reduce(0, lambda acc, x: acc + x)]).run()
+    with pytest.raises(ValueError):
+        controller.emit_many(range(5), chunk_size=0)
+    controller.terminate()
+    assert controller.await_termination() == 0
+
+
+async def async_test_emit_many():
+    controller = build_flow([AsyncEmitSource(), Map(lambda x: x + 1), Complete()]).run()
+    assert await controller.emit_many(range(10), chunk_size=3) == list(range(1, 11))
+    await controller.terminate()
+    await controller.await_termination()
+
+    controller = build_flow([AsyncEmitSource(micro_batch_size=4), Reduce(0, lambda acc, x: acc + x)]).run()
+    assert await controller.emit_many(range(10), chunk_size=3) is None
+    await controller.emit(10)
+    await controller.terminate()
+    assert await controller.await_termination() == 55
+
+
+def test_async_emit_many():
+    asyncio.run(async_test_emit_many())
+
+
+def _keys_per_shard_flow(shard):
+    return [
+        MapWithState(Table("table", NoopDriver()), _count_per_key, group_by_key=True),
+        Reduce([], lambda acc, x: acc + [(shard, x)]),
+    ]
+
+
+def _count_per_key(element, state):
+    state["counter"] = state.get("counter", 0) + 1
+    return (element["k"], state["counter"]), state
+
+
+@pytest.mark.parametrize("key_field", [None, "k"])
+def test_sharded_execution(key_field):
+    controller = build_flow(
+        [
+            SyncEmitSource(key_field="k"),
+            ShardedExecution(
+                _keys_per_shard_flow,
+                num_shards=3,
+                key_field=key_field,
+                max_events=7,
+                termination_result_fn=lambda x, y: x + y,
+            ),
+        ]
+    ).run()
+    for i in range(100):
+        controller.emit({"k": f"key{i % 10}", "v": i})
+    controller.terminate()
+    termination_result = controller.await_termination()
+
+    assert len(termination_result) == 100
+    shards_per_key = {}
+    counts_per_key = {}
+    for shard, (key, count) in termination_result:
+        shards_per_key.setdefault(key, set()).add(shard)
+        counts_per_key[key] = max(counts_per_key.get(key, 0), count)
+    assert all(len(shards) == 1 for shards in shards_per_key.values())
+    assert counts_per_key == {f"key{i}": 10 for i in range(10)}
+    assert len(set().union(*shards_per_key.values())) > 1
+
+
+def _failing_flow(shard):
+    return [Map(RaiseEx(1).raise_ex), Reduce(0, lambda acc, x: acc + 1)]
+
+
+def test_sharded_execution_error():
+    controller = build_flow([SyncEmitSource(), ShardedExecution(_failing_flow, num_shards=2)]).run()
+    for i in range(10):
+        controller.emit(i, key=f"key{i}")
+    controller.terminate()
+    with pytest.raises(ATestException):
+        controller.await_termination()
+
+
+def _exit_on_event(event):
+    os._exit(3)
+
+
+def _dying_flow(shard):
+    return [Map(_exit_on_event), Reduce(0, lambda acc, x: acc + 1)]
+
+
+@pytest.mark.parametrize("max_pending_batches", [None, 1])
+def test_sharded_execution_dead_worker(monkeypatch, max_pending_batches):
+    monkeypatch.setattr(ShardedExecution, "_liveness_check_interval_seconds", 0.1)
+    controller = build_flow(
+        [
+            SyncEmitSource(),
+            ShardedExecution(_dying_flow, num_shards=2, max_events=1, max_pending_batches=max_pending_batches),
+        ]
+    ).run()
+    try:
+        # With a single pending batch, the queue of a dead worker fills up while events are still being emitted
+        for i in range(20 if max_pending_batches else 1):
+            controller.emit(i, key="key")
+        controller.terminate()
+    except FlowError:
+        pass
+    with pytest.raises(FlowError, match=r"shard \d exited unexpectedly with exit code 3"):
+        controller.await_termination()
+
+
+def _counting_flow(shard):
+    return [Reduce(0, lambda acc, x: acc + 1)]
+
+
+def test_sharded_execution_terminate_while_flushing(monkeypatch):
+    put = ShardedExecution._put
+
+    async def slow_put(self, shard, item):
+        if item is not None:
+            await asyncio.sleep(0.2)
+        await put(self, shard, item)
+
+    monkeypatch.setattr(ShardedExecution, "_put", slow_put)
+    controller = build_flow(
+        [SyncEmitSource(), ShardedExecution(_counting_flow, num_shards=1, flush_after_seconds=0.01)]
+    ).run()
+    for i in range(5):
+        controller.emit(i, key="key")
+    # Terminates while the flush task is sending the batch, which must still reach the worker before it terminates
+    time.sleep(0.1)
+    controller.terminate()
+    assert controller.await_termination() == 5
+
+
+def test_sharded_execution_is_terminal():
+    with pytest.raises(ValueError):
+        ShardedExecution(_failing_flow, num_shards=2).to(Map(lambda x: x))
+    with pytest.raises(ValueError):
+        ShardedExecution(_failing_flow, num_shards=0)
+
+
 class Committer:
     def __init__(self):
         self.offsets = {}
@@ -1297,6 +1582,90 @@ def test_nested_branching():
     assert termination_result == 45
 
 
+def test_broadcast_read_only_branches_share_body():
+    bodies1 = []
+    bodies2 = []
+    controller = build_flow(
+        [
+            SyncEmitSource(),
+            [Reduce(bodies1, append_and_return, read_only=True)],
+            [Filter(lambda x: x["n"] % 2 == 0, read_only=True), Reduce(bodies2, append_and_return, read_only=True)],
+        ]
+    ).run()
+
+    for i in range(4):
+        controller.emit({"n": i})
+    controller.terminate()
+    controller.await_termination()
+
+    assert bodies1 == [{"n": 0}, {"n": 1}, {"n": 2}, {"n": 3}]
+    assert bodies2 == [{"n": 0}, {"n": 2}]
+    assert bodies2[0] is bodies1[0]
+    assert bodies2[1] is bodies1[2]
+
+
+def test_broadcast_copy_on_write():
+    def mutate(body):
+        body["mutated"] = True
+        return body
+
+    read_only_bodies = []
+    mutated_bodies1 = []
+    mutated_bodies2 = []
+    controller = build_flow(
+        [
+            SyncEmitSource(),
+            [Reduce(read_only_bodies, append_and_return, read_only=True)],
+            [Map(mutate), Reduce(mutated_bodies1, append_and_return)],
+            [Choice([(Map(mutate), lambda x: True)], read_only=True)],
+            [Extend(lambda x: {"extended": True}), Reduce(mutated_bodies2, append_and_return)],
+        ]
+    ).run()
+
+    emitted_bodies = []
+    for i in range(3):
+        body = {"n": i}
+        emitted_bodies.append(body)
+        controller.emit(body)
+    controller.terminate()
+    controller.await_termination()
+
+    assert read_only_bodies == [{"n": 0}, {"n": 1}, {"n": 2}]
+    assert mutated_bodies1 == [{"n": 0, "mutated": True}, {"n": 1, "mutated": True}, {"n": 2, "mutated": True}]
+    assert mutated_bodies2 == [{"n": 0, "extended": True}, {"n": 1, "extended": True}, {"n": 2, "extended": True}]
+    for i in range(3):
+        # The read-only branch keeps the original body, while each modifying branch works on its own copy
+        assert read_only_bodies[i] is emitted_bodies[i]
+        assert mutated_bodies1[i] is not emitted_bodies[i]
+        assert mutated_bodies2[i] is not emitted_bodies[i]
+        assert mutated_bodies1[i] is not mutated_bodies2[i]
+
+
+def test_broadcast_last_modifying_branch_takes_body():
+    def mutate(body):
+        body["mutated"] = True
+        return body
+
+    mutated_bodies1 = []
+    mutated_bodies2 = []
+    controller = build_flow(
+        [
+            SyncEmitSource(),
+            [Map(mutate), Reduce(mutated_bodies1, append_and_return)],
+            [Map(mutate), Reduce(mutated_bodies2, append_and_return)],
+        ]
+    ).run()
+
+    body = {"n": 1}
+    controller.emit(body)
+    controller.terminate()
+    controller.await_termination()
+
+    assert mutated_bodies1 == mutated_bodies2 == [{"n": 1, "mutated": True}]
+    # Only one copy is made, and the other branch takes over the original body
+    assert (mutated_bodies1[0] is body) != (mutated_bodies2[0] is body)
+
+
 def test_map_with_state_flow():
     controller = build_flow(
         [
@@ -1526,6 +1895,25 @@ def test_awaitable_result_error():
         controller.terminate()
 
 
+def test_emit_raises_errors_not_reported_to_its_events():
+    ex = ValueError("boom")
+    succeeded = Event(0)
+    succeeded._awaitable_result = AwaitableResult()
+    succeeded._awaitable_result._set_result(0)
+    failed = Event(1)
+    failed._awaitable_result = AwaitableResult()
+    failed._awaitable_result._set_error(ex)
+
+    assert SyncEmitSource._error_reported_through_results(failed, ex)
+    assert SyncEmitSource._error_reported_through_results([failed], ex)
+    # Events of a chunk that precede the failing one complete normally
+    assert SyncEmitSource._error_reported_through_results([succeeded, failed], ex)
+    # An error of an earlier event is not swallowed because the emitted event got a result of its own
+    assert not SyncEmitSource._error_reported_through_results(succeeded, ex)
+    assert not SyncEmitSource._error_reported_through_results([failed, succeeded], ex)
+    assert not SyncEmitSource._error_reported_through_results(failed, ValueError("other"))
+
+
 async def async_test_async_awaitable_result_error():
     def boom(_):
         raise ValueError("boom")
@@ -2029,6 +2417,56 @@ def test_batch_with_timeout():
     assert termination_result == [[0, 1, 2], [3, 4, 5, 6], [7, 8, 9]]
 
 
+def test_batch_by_key_timeout_with_many_keys():
+    q = queue.Queue(1)
+    metrics = MetricsCollector()
+
+    def reduce_fn(acc, x):
+        acc.append(x)
+        if len(acc) == 500:
+            q.put(None)
+        return acc
+
+    controller = build_flow(
+        [
+            SyncEmitSource(),
+            Batch(10, 0.2, "$key", context=Context(metrics=metrics), name="batch"),
+            Reduce([], reduce_fn),
+        ]
+    ).run()
+
+    for i in range(1000):
+        controller.emit(i, key=i % 500)
+    q.get(timeout=10)
+    controller.terminate()
+    termination_result = controller.await_termination()
+
+    # All batches time out, in the order in which they started
+    assert termination_result == [[key, key + 500] for key in range(500)]
+    timer_lag = metrics.snapshot()["gauges"]["batch.timer_lag"]
+    assert timer_lag["fired"] == 500
+    assert timer_lag["max_lag"] >= timer_lag["mean_lag"] >= 0
+
+
+def test_timers():
+    timers = _Timers()
+    for key in range(100):
+        timers.schedule(key, 100 - key)
+    for key in range(0, 100, 2):
+        timers.cancel(key)
+    # Cancelled timers are dropped from the heap once they are most of it
+    assert len(timers) == 50
+    assert len(timers._heap) <= 100
+
+    assert timers.next_deadline() == 1
+    assert timers.pop_due(10) == [99, 97, 95, 93, 91]
+    timers.schedule(89, 20)
+    assert timers.pop_due(10.5) == []
+    assert timers.pop_due(13) == [87]
+    assert timers.get_lag_metrics() == {"fired": 6, "mean_lag": 25 / 6, "max_lag": 9}
+    assert len(timers) == 44
+
+
 async def async_test_write_csv(tmpdir):
     file_path = f"{tmpdir}/test_write_csv/out.csv"
     controller = build_flow([AsyncEmitSource(), CSVTarget(file_path, columns=["n", "n*10"], header=True)]).run()
@@ -2972,6 +3410,219 @@ def test_join_with_join_function():
     assert termination_result == expected
 
 
+class _CountingLoadDriver(Driver):
+    def __init__(self, data):
+        self._data = data
+        self.loads = []
+        self.bulk_loads = []
+
+    async def _load_by_key(self, container, table_path, key, attributes):
+        self.loads.append(key)
+        await asyncio.sleep(0.01)
+        return self._data.get(key)
+
+    async def _load_by_keys(self, container, table_path, keys, attributes):
+        self.bulk_loads.append(keys)
+        return await super()._load_by_keys(container, table_path, keys, attributes)
+
+
+@pytest.mark.parametrize("key", ["1", "2"])
+def test_join_with_table_concurrent_lookups_share_load(key):
+    driver = _CountingLoadDriver({"1": {"color": "blue"}})
+    table = Table("test", driver)
+
+    controller = build_flow(
+        [
+            SyncEmitSource(),
+            JoinWithTable(table, "col1", max_in_flight=8),
+            Reduce([], lambda acc, x: append_and_return(acc, x)),
+        ]
+    ).run()
+    for _ in range(8):
+        controller.emit({"col1": key})
+    controller.terminate()
+    termination_result = controller.await_termination()
+
+    expected = [{"col1": "1", "color": "blue"} if key == "1" else {"col1": key}] * 8
+    assert termination_result == expected
+    assert driver.loads == [key]
+
+
+def test_join_with_table_loads_keys_in_bulk():
+    driver = _CountingLoadDriver({str(i): {"color": f"blue{i}"} for i in range(0, 10, 2)})
+    table = Table("test", driver, missing_key_ttl_secs=60)
+
+    controller = build_flow(
+        [
+            SyncEmitSource(),
+            JoinWithTable(table, "col1"),
+            Reduce([], lambda acc, x: append_and_return(acc, x)),
+        ]
+    ).run()
+    controller.emit_many([{"col1": i % 10} for i in range(20)])
+    controller.terminate()
+    termination_result = controller.await_termination()
+
+    assert termination_result == [
+        {"col1": i % 10, "color": f"blue{i % 10}"} if i % 2 == 0 else {"col1": i % 10} for i in range(20)
+    ]
+    assert sorted(driver.loads, key=int) == [str(i) for i in range(10)]
+    assert len(driver.bulk_loads) < 10
+
+
+class _CancelledLoadDriver(Driver):
+    async def _load_by_keys(self, container, table_path, keys, attributes):
+        raise asyncio.CancelledError()
+
+
+def test_join_with_table_cancelled_bulk_load():
+    controller = build_flow(
+        [
+            SyncEmitSource(),
+            JoinWithTable(Table("test", _CancelledLoadDriver()), "col1"),
+            Reduce([], lambda acc, x: append_and_return(acc, x)),
+        ]
+    ).run()
+    # Events that wait for the cancelled lookup fail rather than hang
+    with pytest.raises(asyncio.CancelledError):
+        controller.emit_many([{"col1": i} for i in range(5)])
+        controller.terminate()
+        controller.await_termination()
+
+
+class _RecordingSaveDriver(Driver):
+    def __init__(self):
+        self.saves = []
+
+    async def _save_key(self, container, table_path, key, aggr_item, partitioned_by_key, additional_data):
+        self.saves.append([key])
+
+    async def _save_keys(self, container, table_path, items, partitioned_by_key):
+        await asyncio.sleep(0.01)
+        self.saves.append([key for key, _, _ in items])
+
+
+def test_table_flush_in_batches():
+    driver = _RecordingSaveDriver()
+    table = Table("test", driver, flush_batch_size=10)
+
+    async def update_and_terminate():
+        for i in range(25):
+            table._update_static_attrs(str(i), {"color": f"blue{i}"})
+        await table._terminate()
+
+    asyncio.run(update_and_terminate())
+
+    assert [len(keys) for keys in driver.saves] == [10, 10, 5]
+    assert sorted(sum(driver.saves, []), key=int) == [str(i) for i in range(25)]
+
+
+def test_table_flush_batch_keeps_key_order():
+    driver = _RecordingSaveDriver()
+    table = Table("test", driver)
+
+    async def flush_and_update():
+        for i in range(3):
+            table._update_static_attrs(str(i), {"color": f"blue{i}"})
+        await table._persist_batch(["0", "1", "2"])
+        # Written after the batch that includes the same key completes
+        await table._persist(_PersistJob("1", {"color": "red"}, None))
+        await table._terminate()
+
+    asyncio.run(flush_and_update())
+
+    assert driver.saves == [["0", "1", "2"], ["1"]]
+
+
+def test_table_flush_batch_keeps_keys_changed_while_queued():
+    driver = _RecordingSaveDriver()
+    table = Table("test", driver, max_updates_in_flight=1)
+
+    async def flush_and_update():
+        for i in range(3):
+            table._update_static_attrs(str(i), {"color": f"blue{i}"})
+        flush = asyncio.get_running_loop().create_task(table._persist_for_eviction(["0", "1", "2"]))
+        # The batch waits for room in the queue of updates in flight, while its first key changes again
+        await asyncio.sleep(0)
+        table._update_static_attrs("0", {"color": "red"})
+        await flush
+        await asyncio.sleep(0.05)
+        await table._terminate()
+
+    asyncio.run(flush_and_update())
+
+    assert driver.saves == [["0", "1", "2"], ["0"]]
+
+
+def test_table_cache_evicts_least_recently_used_keys():
+    driver = _CountingLoadDriver({str(i): {"color": f"blue{i}"} for i in range(3)})
+    table = Table("test", driver, max_cached_keys=2)
+
+    async def lookup(*keys):
+        for key in keys:
+            assert await table._get_or_load_static_attributes_by_key(key) == {"color": f"blue{key}"}
+
+    asyncio.run(lookup("0", "1", "0", "2"))
+    assert table._get_keys() == ["0", "2"]
+
+    asyncio.run(lookup("0", "1"))
+    assert table._get_keys() == ["0", "1"]
+    assert driver.loads == ["0", "1", "2", "1"]
+
+
+def test_table_cache_writes_changed_keys_before_evicting_them():
+    driver = _RecordingSaveDriver()
+    table = Table("test", driver, max_cached_keys=2)
+
+    async def update():
+        for i in range(4):
+            async with table._get_lock(str(i)):
+                table._update_static_attrs(str(i), {"color": f"blue{i}"})
+        # Let the changed keys be written, so that they can be evicted
+        await asyncio.sleep(0.05)
+        async with table._get_lock("4"):
+            pass
+        await table._terminate()
+
+    asyncio.run(update())
+
+    assert len(table._get_keys()) == 2
+    assert sorted(sum(driver.saves, [])) == ["0", "1", "2", "3"]
+
+
+def test_table_bad_max_cached_keys():
+    with pytest.raises(ValueError):
+        Table("test", NoopDriver(), max_cached_keys=0)
+
+
+@pytest.mark.parametrize("missing_key_ttl_secs", [None, 60])
+def test_join_with_table_missing_key_ttl(missing_key_ttl_secs):
+    driver = _CountingLoadDriver({})
+    table = Table("test", driver, missing_key_ttl_secs=missing_key_ttl_secs)
+
+    async def lookup_sequentially():
+        for _ in range(3):
+            assert await table._get_or_load_static_attributes_by_key("1") == {}
+
+    asyncio.run(lookup_sequentially())
+
+    assert len(driver.loads) == (1 if missing_key_ttl_secs else 3)
+
+
+def test_join_with_table_missing_key_expires():
+    driver = _CountingLoadDriver({})
+    table = Table("test", driver, missing_key_ttl_secs=0.01)
+
+    async def lookup_twice():
+        await table._get_or_load_static_attributes_by_key("1")
+        driver._data["1"] = {"color": "blue"}
+        await asyncio.sleep(0.02)
+        return await table._get_or_load_static_attributes_by_key("1")
+
+    assert asyncio.run(lookup_twice()) == {"color": "blue"}
+    assert driver.loads == ["1", "1"]
+
+
 def test_termination_result_order():
     controller = build_flow(
         [
@@ -3409,6 +4060,155 @@ def test_push_error():
     assert context.source == "Map"
 
 
+def test_fused_steps():
+    steps = [
+        Map(lambda x: {"n": x, "to_drop": True}),
+        Filter(lambda x: x["n"] % 2 == 0),
+        Extend(lambda x: {"double": x["n"] * 2}),
+        Rename({"double": "twice"}),
+        DropColumns("to_drop"),
+    ]
+    reduce = Reduce([], lambda acc, x: acc + [x])
+    flow = build_flow([SyncEmitSource(), *steps, reduce])
+    code_before_run = flow.to_code()
+    dict_before_run = [step.to_dict() for step in steps]
+
+    controller = flow.run()
+    assert steps[0]._fused_steps == [*steps, reduce]
+    for i in range(5):
+        controller.emit(i)
+    controller.terminate()
+    termination_result = controller.await_termination()
+
+    assert termination_result == [{"n": 0, "twice": 0}, {"n": 2, "twice": 4}, {"n": 4, "twice": 8}]
+    assert flow.to_code() == code_before_run
+    assert [step.to_dict() for step in steps] == dict_before_run
+
+
+def test_fused_stateful_steps():
+    seen = []
+    steps = [
+        MapWithState(0, lambda x, state: ({"n": x["n"], "sum": state + x["n"]}, state + x["n"])),
+        ForEach(lambda x: seen.append(x["n"])),
+        ReifyMetadata(["key"]),
+        Reduce([], lambda acc, x: acc + [x]),
+    ]
+    controller = build_flow([SyncEmitSource(key_field="n"), *steps]).run()
+    assert steps[0]._fused_steps == steps
+    for i in range(4):
+        controller.emit({"n": i})
+    controller.terminate()
+    termination_result = controller.await_termination()
+
+    assert seen == [0, 1, 2, 3]
+    assert termination_result == [
+        {"n": 0, "sum": 0, "key": 0},
+        {"n": 1, "sum": 1, "key": 1},
+        {"n": 2, "sum": 3, "key": 2},
+        {"n": 3, "sum": 6, "key": 3},
+    ]
+
+
+def test_fused_steps_not_fused_across_branches():
+    map_step = Map(lambda x: x + 1)
+    filter_step = Filter(lambda x: x > 1)
+    flow = build_flow(
+        [
+            SyncEmitSource(),
+            map_step,
+            filter_step,
+            [Map(lambda x: x * 10), Reduce(0, lambda acc, x: acc + x)],
+            [Map(lambda x: x * 100), Reduce(0, lambda acc, x: acc + x)],
+        ]
+    )
+    controller = flow.run()
+    assert map_step._fused_steps == [map_step, filter_step]
+    for i in range(3):
+        controller.emit(i)
+    controller.terminate()
+    assert controller.await_termination() == 50
+
+
+def test_fused_steps_error_attribution():
+    class PushErrorContext:
+        def push_error(self, event, message, source):
+            self.event = event
+            self.message = message
+            self.source = source
+
+    def raise_on_5(x):
+        if x == 5:
+            raise ATestException("test")
+        return True
+
+    context = PushErrorContext()
+    recovered = []
+    raising_map = Map(RaiseEx(3).raise_ex, recovery_step=Reduce(recovered, append_and_return, full_event=True))
+    first_map = Map(lambda x: x + 1)
+    raising_filter = Filter(raise_on_5, context=context)
+    reduce = Reduce(0, lambda acc, x: acc + x)
+    controller = build_flow([SyncEmitSource(), first_map, raising_map, raising_filter, reduce]).run()
+    assert first_map._fused_steps == [first_map, raising_map, raising_filter, reduce]
+
+    for i in range(6):
+        controller.emit(i)
+    controller.terminate()
+    assert controller.await_termination() == 1 + 2 + 4 + 6
+
+    assert len(recovered) == 1
+    assert recovered[0].body == 3
+    assert recovered[0].origin_state == "Map"
+    assert isinstance(recovered[0].error, ATestException)
+    assert recovered[0].error._raised_by_storey_step is raising_map
+    assert context.event.body == 5
+    assert "raise ATestException" in context.message
+    assert context.source == "Filter"
+
+
+def test_metrics():
+    metrics = MetricsCollector(latency_buckets=[10, 0.001])
+    context = Context(metrics=metrics)
+    recovered = []
+    first_map = Map(lambda x: x + 1, context=context, name="increment")
+    controller = build_flow(
+        [
+            SyncEmitSource(context=context, buffer_size=5),
+            first_map,
+            Map(
+                RaiseEx(3).raise_ex,
+                context=context,
+                name="raise",
+                recovery_step=Reduce(recovered, append_and_return, full_event=True),
+            ),
+            Filter(lambda x: x % 2 == 0, context=context),
+            Reduce(0, lambda acc, x: acc + x),
+        ]
+    ).run()
+    # Steps are measured one by one
+    assert first_map._fused_steps is None
+
+    for i in range(10):
+        controller.emit(i)
+    controller.terminate()
+    assert controller.await_termination() == 2 + 4 + 6 + 8 + 10
+    assert len(recovered) == 1
+
+    snapshot = metrics.snapshot()
+    assert set(snapshot["steps"]) == {"increment", "raise", "Filter"}
+    for name in ["increment", "raise"]:
+        assert snapshot["steps"][name]["events"] == 10
+    assert snapshot["steps"]["Filter"]["events"] == 9
+    assert snapshot["steps"]["increment"]["errors"] == 0
+    assert snapshot["steps"]["raise"]["errors"] == 1
+    for step_metrics in snapshot["steps"].values():
+        assert sum(step_metrics["latency_histogram"].values()) == step_metrics["events"]
+        assert list(step_metrics["latency_histogram"]) == ["0.001", "10", "+Inf"]
+        assert step_metrics["total_latency"] > 0
+        assert step_metrics["max_latency"] >= step_metrics["mean_latency"] > 0
+    assert snapshot["steps"]["increment"]["total_latency"] >= snapshot["steps"]["raise"]["total_latency"]
+    assert snapshot["queues"] == {"SyncEmitSource": {"size": 0, "max_size": 5}}
+
+
 def test_metadata_fields():
     controller = build_flow(
         [
@@ -1,8 +1,9 @@
 import asyncio
+import threading
 
 import pytest
 
-from storey.queue import SimpleAsyncQueue
+from storey.queue import SimpleAsyncQueue, ThreadSafeAsyncQueue
 
 
 async def async_test_simple_async_queue():
@@ -26,3 +27,32 @@ async def async_test_simple_async_queue():
 
 def test_simple_async_queue():
     asyncio.run(async_test_simple_async_queue())
+
+
+async def async_test_thread_safe_async_queue():
+    q = ThreadSafeAsyncQueue(2)
+
+    with pytest.raises(TimeoutError):
+        await q.get(0)
+    with pytest.raises(asyncio.QueueEmpty):
+        q.get_nowait()
+
+    get_task = asyncio.create_task(q.get(1))
+    await asyncio.sleep(0)
+    threading.Thread(target=q.put, args=("x",)).start()
+    assert await get_task == "x"
+
+    # The producer blocks while the queue is full
+    producer = threading.Thread(target=lambda: [q.put(i) for i in range(5)])
+    producer.start()
+    results = []
+    while len(results) < 5:
+        results.append(await q.get(1))
+    producer.join()
+    assert results == [0, 1, 2, 3, 4]
+    assert q.empty()
+    assert q.qsize() == 0
+
+
+def test_thread_safe_async_queue():
+    asyncio.run(async_test_thread_safe_async_queue())
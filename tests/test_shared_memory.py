@@ -0,0 +1,146 @@
+import asyncio
+import multiprocessing
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+from storey import (
+    Event,
+    FlowError,
+    Map,
+    Reduce,
+    SharedMemoryRingBuffer,
+    SharedMemorySource,
+    SharedMemoryTarget,
+    SyncEmitSource,
+    build_flow,
+)
+
+
+def _produce(ring_buffer, num_events):
+    controller = build_flow([SyncEmitSource(key_field="k"), SharedMemoryTarget(ring_buffer, max_events=7)]).run()
+    controller.emit_many({"k": f"key{i % 3}", "v": i} for i in range(num_events))
+    controller.terminate()
+    controller.await_termination()
+
+
+@pytest.mark.parametrize("micro_batch_size", [None, 5])
+def test_shared_memory_transport(micro_batch_size):
+    ring_buffer = SharedMemoryRingBuffer(num_slots=2, slot_size=64 * 1024)
+    try:
+        process = multiprocessing.Process(target=_produce, args=(ring_buffer, 100))
+        process.start()
+        controller = build_flow(
+            [
+                SharedMemorySource(ring_buffer, micro_batch_size=micro_batch_size),
+                Map(lambda x: x, full_event=True),
+                Reduce([], lambda acc, event: acc + [(event.key, event.body)], full_event=True),
+            ]
+        ).run()
+        termination_result = controller.await_termination()
+        process.join()
+        assert process.exitcode == 0
+    finally:
+        ring_buffer.unlink()
+
+    assert termination_result == [(f"key{i % 3}", {"k": f"key{i % 3}", "v": i}) for i in range(100)]
+
+
+def test_shared_memory_transport_splits_large_batches():
+    ring_buffer = SharedMemoryRingBuffer(num_slots=4, slot_size=2048)
+    try:
+        process = multiprocessing.Process(target=_produce, args=(ring_buffer, 50))
+        process.start()
+        controller = build_flow([SharedMemorySource(ring_buffer), Reduce(0, lambda acc, x: acc + x["v"])]).run()
+        termination_result = controller.await_termination()
+        process.join()
+    finally:
+        ring_buffer.unlink()
+
+    assert termination_result == sum(range(50))
+
+
+def test_shared_memory_transport_event_too_large():
+    ring_buffer = SharedMemoryRingBuffer(num_slots=1, slot_size=512)
+    try:
+        controller = build_flow([SyncEmitSource(), SharedMemoryTarget(ring_buffer)]).run()
+        controller.emit({"v": "x" * 1024})
+        controller.terminate()
+        with pytest.raises(ValueError):
+            controller.await_termination()
+    finally:
+        ring_buffer.unlink()
+
+
+def test_shared_memory_transport_heterogeneous_events():
+    events = [
+        Event({"a": 1}, key="key0", id="0"),
+        Event({"a": "s", "b": None}, key=["key1", 2], id="1", headers={"h": "v"}, method="POST", path="/p"),
+        Event({"b": {"x": [1]}}, key="key2", processing_time=datetime(2020, 1, 1, tzinfo=timezone.utc)),
+    ]
+    events[2].offset = 5
+    events[2].origin_state = "step"
+
+    async def write_and_read():
+        await ring_buffer.write(events)
+        return await ring_buffer.read()
+
+    ring_buffer = SharedMemoryRingBuffer(num_slots=1, slot_size=64 * 1024)
+    try:
+        read_events = asyncio.run(write_and_read())
+    finally:
+        ring_buffer.unlink()
+
+    # Fields that an event lacks are not added to it, and columns of mixed types are passed along
+    assert [event.body for event in read_events] == [{"a": 1}, {"a": "s", "b": None}, {"b": {"x": [1]}}]
+    assert read_events == events
+    for event, read_event in zip(events, read_events):
+        assert read_event.key == event.key
+        assert read_event.processing_time == event.processing_time
+        assert read_event.__dict__ == event.__dict__
+        assert getattr(read_event, "origin_state", None) == getattr(event, "origin_state", None)
+
+
+def _write_once_and_exit(ring_buffer):
+    asyncio.run(ring_buffer.write([Event({"v": 1})]))
+    os._exit(1)
+
+
+def _read_once_and_exit(ring_buffer):
+    asyncio.run(ring_buffer.read())
+    os._exit(1)
+
+
+def test_shared_memory_transport_producer_exits(monkeypatch):
+    monkeypatch.setattr(SharedMemoryRingBuffer, "_liveness_check_interval_secs", 0.1)
+    ring_buffer = SharedMemoryRingBuffer(num_slots=2, slot_size=64 * 1024)
+    try:
+        process = multiprocessing.Process(target=_write_once_and_exit, args=(ring_buffer,))
+        process.start()
+        controller = build_flow([SharedMemorySource(ring_buffer), Reduce(0, lambda acc, x: acc + x["v"])]).run()
+        # The producer exits without writing the end of the stream, which the consumer does not wait for
+        with pytest.raises(FlowError):
+            controller.await_termination()
+        process.join()
+    finally:
+        ring_buffer.unlink()
+
+
+def test_shared_memory_transport_consumer_exits(monkeypatch):
+    monkeypatch.setattr(SharedMemoryRingBuffer, "_liveness_check_interval_secs", 0.1)
+    ring_buffer = SharedMemoryRingBuffer(num_slots=1, slot_size=64 * 1024)
+
+    async def write():
+        for i in range(3):
+            await ring_buffer.write([Event({"v": i})])
+
+    try:
+        process = multiprocessing.Process(target=_read_once_and_exit, args=(ring_buffer,))
+        process.start()
+        # The second batch fills the only slot, so the third waits for the consumer, which has exited
+        with pytest.raises(FlowError):
+            asyncio.run(write())
+        process.join()
+    finally:
+        ring_buffer.unlink()
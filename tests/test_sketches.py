@@ -0,0 +1,96 @@
+# Copyright 2020 Iguazio
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import math
+import random
+from collections import Counter
+
+import pytest
+
+from storey.sketches import (
+    ApproximateAggregates,
+    _HyperLogLog,
+    _SpaceSaving,
+    _TDigest,
+    is_approximate_aggregate,
+)
+
+
+def test_hyperloglog_merge():
+    sketch1, sketch2 = _HyperLogLog(), _HyperLogLog()
+    for i in range(20000):
+        sketch1.add(i)
+        sketch2.add(i + 10000)
+    sketch1.merge(sketch2)
+    assert abs(sketch1.estimate() - 30000) < 0.1 * 30000
+
+
+def test_tdigest_merge():
+    random.seed(1)
+    values = [random.gauss(0, 1) for _ in range(10000)]
+    sketch1, sketch2 = _TDigest(), _TDigest()
+    for i, value in enumerate(values):
+        (sketch1 if i % 2 else sketch2).add(value)
+    sketch1.merge(sketch2)
+    sorted_values = sorted(values)
+    for quantile in [0.01, 0.5, 0.99]:
+        assert abs(sketch1.quantile(quantile) - sorted_values[int(quantile * len(values))]) < 0.05
+    assert sketch1.quantile(0) == sorted_values[0]
+    assert sketch1.quantile(1) == sorted_values[-1]
+    assert len(sketch1._centroids) <= 100
+
+
+def test_space_saving_merge():
+    random.seed(1)
+    values = [int(random.paretovariate(1)) for _ in range(10000)]
+    sketch1, sketch2 = _SpaceSaving(50), _SpaceSaving(50)
+    for i, value in enumerate(values):
+        (sketch1 if i % 2 else sketch2).add(value)
+    sketch1.merge(sketch2)
+    assert sketch1.top(3) == [value for value, _ in Counter(values).most_common(3)]
+
+
+def test_approximate_aggregates_serialize():
+    random.seed(1)
+    aggregates = ApproximateAggregates(["approx_distinct", "approx_p50", "approx_top2"])
+    sketches = aggregates.new_sketches()
+    for _ in range(1000):
+        aggregates.add(sketches, random.randint(0, 100))
+    bucket_start_time, deserialized = aggregates.deserialize(ApproximateAggregates.serialize(1200000, sketches))
+    assert bucket_start_time == 1200000
+    assert aggregates.get_features(deserialized) == aggregates.get_features(sketches)
+
+    # Sketches that were not serialized are empty
+    _, deserialized = ApproximateAggregates(["approx_distinct", "approx_p90"]).deserialize(
+        ApproximateAggregates.serialize(0, {"distinct": sketches["distinct"]})
+    )
+    assert deserialized["distinct"].estimate() == sketches["distinct"].estimate()
+    assert math.isnan(deserialized["quantile"].quantile(0.9))
+
+
+@pytest.mark.parametrize(
+    "aggregate,expected",
+    [
+        ("approx_distinct", True),
+        ("approx_p95", True),
+        ("approx_p100", True),
+        ("approx_p101", False),
+        ("approx_top3", True),
+        ("approx_top0", False),
+        ("approx_sum", False),
+        ("sum", False),
+    ],
+)
+def test_is_approximate_aggregate(aggregate, expected):
+    assert is_approximate_aggregate(aggregate) == expected
@@ -12,14 +12,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import copy
+import pickle
+from datetime import datetime, timedelta, timezone
+
 import pytest
 
 from storey.dtypes import (
+    EmissionType,
     EmitAfterDelay,
     EmitAfterMaxEvent,
     EmitAfterPeriod,
     EmitAfterWindow,
     EmitEveryEvent,
+    Event,
     _dict_to_emit_policy,
 )
 
@@ -76,3 +82,43 @@ def test_emit_policy_period():
     policy = _dict_to_emit_policy(policy_dict)
     assert type(policy) == EmitAfterPeriod
     assert policy.delay_in_seconds == 8
+
+
+def test_emit_policy_period_incremental_columnar():
+    policy_dict = {"mode": EmitAfterPeriod.name(), "emissionType": "Incremental", "columnar": True}
+    policy = _dict_to_emit_policy(policy_dict)
+    assert type(policy) == EmitAfterPeriod
+    assert policy.emission_type == EmissionType.Incremental
+    assert policy.columnar
+
+
+def test_emit_policy_bad_emission_type():
+    policy_dict = {"mode": EmitAfterWindow.name(), "emissionType": "Sometimes"}
+    with pytest.raises(ValueError):
+        _dict_to_emit_policy(policy_dict)
+
+
+def test_event_lazy_processing_time():
+    before = datetime.now(timezone.utc)
+    event = Event({"a": 1})
+    after = datetime.now(timezone.utc)
+    assert before - timedelta(milliseconds=1) <= event.processing_time <= after + timedelta(milliseconds=1)
+    assert event.processing_time is event.processing_time
+    assert event.processing_time.tzinfo == timezone.utc
+
+    processing_time = datetime(2020, 2, 15, 2, 0)
+    event.processing_time = processing_time
+    assert event.processing_time == processing_time
+    assert Event({"a": 1}, processing_time=processing_time).processing_time == processing_time
+
+
+def test_event_copy_and_extra_attributes():
+    event = Event({"a": 1}, key="k", id="id1")
+    event.shard_id = 3
+    event.offset = 17
+    for event_copy in [copy.copy(event), copy.deepcopy(event), pickle.loads(pickle.dumps(event))]:
+        assert event_copy == event
+        assert event_copy.key == "k"
+        assert event_copy.shard_id == 3
+        assert event_copy.offset == 17
+        assert event_copy.processing_time == event.processing_time